@@ -1,2 +1,8 @@
-from .teql import TEQL
-from .exceptions import *
\ No newline at end of file
+from .exceptions import *
+
+def __getattr__(name):
+    # The engine is loaded on first use, so that e.g. `teql --help` doesn't pay for importing it
+    if name == 'TEQL':
+        from .teql import TEQL
+        return TEQL
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
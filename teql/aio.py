@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from . import ast
+from .cancellation import Cancellation
+from .teql import TEQL, SelectResult
+from typing import AsyncIterator, Callable, Iterable, Optional
+__all__ = ('AsyncRunner', 'offload')
+
+DEFAULT_CONCURRENCY = 8 # Number of files a call evaluates at once
+
+class AsyncRunner:
+    """
+    Runs queries for an asyncio event loop, without blocking it.
+
+    The parsing, file I/O and evaluation are run on an executor (the loop's default executor if none is
+    given), which must run the work in this process, i.e. be a ThreadPoolExecutor. SHOW and update
+    queries evaluate up to `concurrency` files at once; SELECT results evaluate a file each time they
+    are fetched from. Other queries are run as a single unit of work.
+
+    If the task iterating the results is cancelled (or the iteration is closed early) the scans in
+    progress stop before the next file or selection, and files not yet started are never opened. Files
+    already being rewritten are still replaced whole, never left partly written.
+    """
+    def __init__(self, teql:TEQL, executor:Executor=None, concurrency:int=None):
+        if concurrency is not None and concurrency < 1:
+            raise ValueError('The concurrency must be at least 1')
+        self.teql = teql
+        self.executor = executor
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+        self.cancellation = Cancellation()
+
+    async def run(self, queries:Iterable[ast._Node])->AsyncIterator:
+        """
+        Execute the queries in turn, yielding the result of each
+        """
+        queries = iter(queries)
+        try:
+            while True:
+                # The queries may be parsed lazily from a script being read
+                query = await self._call(next, queries, None)
+                if query is None:
+                    return
+                yield await self._execute(query)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancellation.cancel()
+            raise
+
+    async def _execute(self, query:ast._Node):
+        teql = self.teql
+        if isinstance(query, ast.ShowQuery) and isinstance(query.value.value, ast._Selection):
+            plan = await self._call(teql._compileSelection, query.value.value)
+            paths = await self._call(lambda: teql._candidateFiles(teql._findFiles(teql.use), query.value.value))
+            def show(path):
+                return [selection.string() for selection in plan(teql._openContext(path))]
+            async for strings in self._map(show, paths):
+                for string in strings:
+                    print(string)
+        elif isinstance(query, ast._UpdateQuery):
+            query = await self._call(teql._resolveUpdateQuery, query)
+            selector = teql._getUpdateQuerySelector(query)
+            plan = await self._call(teql._compileSelection, selector)
+            paths = await self._call(lambda: teql._candidateFiles(teql._findFiles(teql.use), selector))
+            def update(path):
+                teql._updateFile(path, teql._editContext(query, teql._openContext(path, True), plan))
+            async for _ in self._map(update, paths):
+                pass
+        else:
+            result = await self._call(teql._executeQuery, query)
+            if isinstance(result, SelectResult):
+                result._executor = self.executor
+                result._cancellation = Cancellation(self.cancellation)
+            return result
+
+    def _call(self, function:Callable, *args):
+        return offload(self.executor, self.cancellation, function, *args)
+
+    async def _map(self, function:Callable, items:Iterable)->AsyncIterator:
+        """
+        Call a function with each item on the executor, at most `concurrency` at once, yielding the results in order
+        """
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(asyncio.ensure_future(self._call(function, item)))
+                if len(pending) >= self.concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            # Those not yet started never will be; those running stop at their next check
+            if pending:
+                self.cancellation.cancel()
+            for future in pending:
+                future.cancel()
+
+
+async def offload(executor:Optional[Executor], cancellation:Cancellation, function:Callable, *args):
+    """
+    Call a function on an executor under a cancellation, which is cancelled if the awaiting task is
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, partial(cancellation.run, function, *args))
+    except asyncio.CancelledError:
+        cancellation.cancel()
+        raise
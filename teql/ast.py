@@ -2,18 +2,18 @@ from dataclasses import dataclass
 from lark import ast_utils, Transformer, v_args
 from lark.tree import Meta
 import sys
-from typing import List, Any, Union
+from typing import List, Any, Mapping, Union
 
 @dataclass
 class _Node(ast_utils.Ast):
     pass
 
 @dataclass
-class Variable(_Node):
+class Variable(_Node, ast_utils.AsList):
     identifiers:List[Union[str,int]]
 
 @dataclass
-class SelectionVariable(_Node):
+class SelectionVariable(_Node, ast_utils.AsList):
     identifiers:List[Union[str,int]]
 
 @dataclass
@@ -54,6 +54,10 @@ class RangeIndexRange(_RangeIndex):
     start:int
     end:int
     step:int=1
+    def __post_init__(self):
+        if self.step is None:
+            # The parser passes None when the optional step is omitted
+            self.step = 1
 
 @dataclass
 class _CursorOrSelection(_Node):
@@ -187,6 +191,22 @@ class FindSelection(_Selection):
             elif modifier == 'WITH':
                 self.is_with = True
 @dataclass
+class FindFirstSelection(_Selection):
+    """find only the first match (produced by the optimizer)"""
+    expression: _StringMatchExpression
+
+@dataclass
+class FindLastSelection(_Selection):
+    """find only the last match (or last n matches), searching backward (produced by the optimizer)"""
+    expression: _StringMatchExpression
+    n: int = None
+
+@dataclass
+class FindAnySelection(_Selection):
+    """find every occurrence of any of the keys, in a single pass (produced by CHANGE USING MAPPING)"""
+    keys: List[str]
+
+@dataclass
 class BlockSelection(_Selection):
     """select a large block from two other selections"""
     start: _CursorOrSelection
@@ -238,6 +258,10 @@ class ChangeQuery(_UpdateQuery):
     selection: Union[_Selection,Variable,str]
     replacement: Union[Variable,str]
     
+@dataclass
+class ChangeMappingQuery(_UpdateQuery):
+    mapping: Union[str,Variable,Mapping[str,str]] # Path to a file of tab-separated pairs, or the mapping itself
+
 @dataclass
 class DeleteQuery(_UpdateQuery):
     selection: _Selection
@@ -276,6 +300,24 @@ class ShowQuery(_Node):
     def __init__(self, value):
         self.value = value
 
+@dataclass
+class ExplainQuery(_Node):
+    query:Union[ShowQuery,_UpdateQuery]
+    is_analyze:bool = False
+    def __init__(self, *args):
+        if len(args) == 2 and args[0].upper() == 'ANALYZE':
+            self.is_analyze = True
+        self.query = args[-1]
+
+@dataclass
+class PreviewQuery(_Node):
+    query:_UpdateQuery
+    is_diff:bool = False
+    def __init__(self, *args):
+        if len(args) == 2 and args[0].upper() == 'DIFF':
+            self.is_diff = True
+        self.query = args[-1]
+
 @dataclass
 class SetQuery(_Node):
     key:Union[Variable,Symbol]
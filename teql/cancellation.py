@@ -0,0 +1,71 @@
+import threading
+from .exceptions import QueryCancelled
+from typing import Callable, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .compiler import Plan
+__all__ = ('Cancellation', 'check_cancelled', 'cancellable')
+
+_current = threading.local()
+
+class Cancellation:
+    """
+    A flag which tells work running on other threads to stop.
+
+    Work is run under a cancellation with `run`; while it is running, the scans it makes check the flag
+    before opening each file and between each selection, and raise QueryCancelled once it is set. A
+    cancellation with a parent is also cancelled when the parent is.
+    """
+    def __init__(self, parent:'Cancellation'=None):
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self)->bool:
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled('The query was cancelled')
+
+    def run(self, function:Callable, *args):
+        """
+        Call a function on this thread under the cancellation
+        """
+        self.check()
+        previous = getattr(_current, 'cancellation', None)
+        _current.cancellation = self
+        try:
+            return function(*args)
+        finally:
+            _current.cancellation = previous
+
+
+def current()->Optional[Cancellation]:
+    """
+    Get the cancellation the work on this thread is running under, if any
+    """
+    return getattr(_current, 'cancellation', None)
+
+def check_cancelled():
+    """
+    Raise QueryCancelled if the work on this thread has been cancelled
+    """
+    cancellation = current()
+    if cancellation is not None:
+        cancellation.check()
+
+def cancellable(plan:'Plan')->'Plan':
+    """
+    Wrap a plan so that it stops between selections if the work on this thread is cancelled
+    """
+    cancellation = current()
+    if cancellation is None:
+        return plan
+    def run(context):
+        for selection in plan(context):
+            cancellation.check()
+            yield selection
+    return run
@@ -1,23 +1,53 @@
-import argparse, sys, io
-from .teql import TEQL
+import argparse, sys
+from .parser import PARSER_MODES, DEFAULT_MODE
 
 ap = argparse.ArgumentParser('teql', description="Text Editing Query Language\nThe functionality of grep and sed, with the syntax of SQL")
 ap.add_argument('script', help='The TEQL script to execute', nargs='?')
+ap.add_argument('--stream', help='Run the script in a single pass over stdin, writing the edited text to stdout', action='store_true')
+ap.add_argument('--no-index-cache', help="Don't keep the line indexes of large files in the on-disk cache (see TEQL_INDEX_CACHE)", action='store_true')
+ap.add_argument('--trigram-index', help='Skip files which can\'t contain the strings a query finds, using an on-disk index of their trigrams (see TEQL_TRIGRAM_INDEX)', action='store_true')
+ap.add_argument('--jobs', help='The number of processes to run queries against many files with', type=int, default=1)
+ap.add_argument('--parser', help='The parser to use; lalr is faster to start, and is cached on disk', choices=PARSER_MODES, default=DEFAULT_MODE)
 
 def main():
     args = ap.parse_args()
-    if args.script is None:
+    if args.stream:
+        if args.script is None or args.script == '-':
+            ap.error('--stream reads the text from stdin, so the script must be given as an argument')
+        run_stream(args.script, parser=args.parser)
+    elif args.script is None:
         from .interactive_shell import InteractiveShell
-        InteractiveShell().run()
+        InteractiveShell(parser=args.parser, index_cache=index_cache(args), jobs=args.jobs, trigram_index=trigram_index(args)).run()
     elif args.script == '-':
-        run_script(sys.stdin)
+        run_script(sys.stdin, parser=args.parser, index_cache=index_cache(args), jobs=args.jobs, trigram_index=trigram_index(args))
     else:
-        run_script(args.script)
+        run_script(args.script, parser=args.parser, index_cache=index_cache(args), jobs=args.jobs, trigram_index=trigram_index(args))
             
 
-def run_script(script):
-    teql = TEQL()
-    if isinstance(script, io.IOBase):
-        script = script.read()
-    for result in teql.execute_all(script):
-        print(result) # TODO make it prettier
\ No newline at end of file
+def index_cache(args):
+    if args.no_index_cache:
+        return None
+    from .index_cache import LineIndexCache
+    return LineIndexCache()
+
+def trigram_index(args):
+    if not args.trigram_index:
+        return None
+    from .trigram_index import TrigramIndex
+    return TrigramIndex()
+
+
+def run_script(script, parser=None, index_cache=None, jobs=1, trigram_index=None):
+    # Imported here so that e.g. `--help` doesn't pay for loading the engine
+    from .teql import TEQL
+    with TEQL(parser=parser, index_cache=index_cache, jobs=jobs, trigram_index=trigram_index) as teql:
+        # File scripts are passed through as-is, so they are read and executed one statement at a time
+        for result in teql.execute_all(script):
+            print(result) # TODO make it prettier
+
+
+def run_stream(script, parser=None):
+    from .teql import TEQL
+    teql = TEQL(parser=parser)
+    teql.execute_stream(script, sys.stdin.buffer, sys.stdout.buffer)
+    sys.stdout.flush()
@@ -0,0 +1,331 @@
+from . import ast
+from .context import Context
+from .exceptions import TEQLException
+from .explain import NodeStats, profile_plan
+from .keywords import compile_keywords
+from .range import apply_ranges, first, last
+from itertools import islice
+from .file_map import FileMap
+from collections.abc import Sequence
+from typing import Callable, Dict, Iterator, Tuple
+
+Plan = Callable[[Context], Iterator[Context]]
+
+class SelectionCompiler:
+    """
+    Compiles a cursor or selection AST into a tree of closures.
+
+    All of the dispatch on node types happens once, when the query is compiled; the resulting plan
+    can then be called with each file's context to yield the real selections in that context.
+
+    If a profile dict is given, every node's plan is wrapped to record its NodeStats in the dict, 
+    keyed by the id of the AST node (for EXPLAIN ANALYZE).
+    """
+    def __init__(self, resolve_variable:Callable[[ast.Variable], object], profile:Dict[int,NodeStats]=None):
+        self.resolve_variable = resolve_variable
+        self.profile = profile
+
+    def compile_root(self, selector:ast._CursorOrSelection)->Plan:
+        """
+        Compile a top-level selector. The plan accepts a Context (or Span), and evaluates it using
+        lightweight Spans rather than full contexts.
+        """
+        plan = self.compile(selector)
+        def root_plan(context:Context):
+            return plan(context.span())
+        return root_plan
+
+    def compile(self, selector:ast._CursorOrSelection)->Plan:
+        compiler = getattr(self, f"_compile{type(selector).__name__}", None)
+        if compiler is None:
+            raise TEQLException(f"Unsupported cursor or selection: {type(selector).__name__}")
+        if self.profile is None:
+            return compiler(selector)
+        stats = self.profile[id(selector)] = NodeStats()
+        return profile_plan(compiler(selector), stats)
+
+    def _compileStartCursor(self, selector:ast.StartCursor)->Plan:
+        def start_cursor(context:Context):
+            yield context.sub(0, 0)
+        return start_cursor
+
+    def _compileEndCursor(self, selector:ast.EndCursor)->Plan:
+        def end_cursor(context:Context):
+            i = len(context)
+            yield context.sub(i, i)
+        return end_cursor
+
+    def _compileSeekCursor(self, selector:ast.SeekCursor)->Plan:
+        offset = selector.offset
+        def seek_cursor(context:Context):
+            i = offset
+            if i < 0:
+                i = len(context) + i
+            yield context.sub(i, i)
+        return seek_cursor
+
+    def _compileOffsetCursor(self, selector:ast.OffsetCursor)->Plan:
+        other_plan = self.compile(selector.other)
+        offset = selector.offset
+        def offset_cursor(context:Context):
+            for other in other_plan(context):
+                i = other.start + offset
+                yield _span(context, i, i)
+        return offset_cursor
+
+    def _compileSelectionAfterCursor(self, selector:ast.SelectionAfterCursor)->Plan:
+        other_plan = self.compile(selector.other)
+        n = selector.n or 0
+        def selection_after_cursor(context:Context):
+            for other in other_plan(context):
+                i = other.end + n
+                yield _span(context, i, i)
+        return selection_after_cursor
+
+    def _compileSelectionBeforeCursor(self, selector:ast.SelectionBeforeCursor)->Plan:
+        other_plan = self.compile(selector.other)
+        n = selector.n or 0
+        def selection_before_cursor(context:Context):
+            for other in other_plan(context):
+                i = other.start - n
+                yield _span(context, i, i)
+        return selection_before_cursor
+
+    def _compileSelectionCursor(self, selector:ast.SelectionCursor)->Plan:
+        # place a cursor in the context of a selection
+        inner_plan = self.compile(selector.inner)
+        outer_plan = self.compile(selector.outer)
+        def selection_cursor(context:Context):
+            for other in outer_plan(context):
+                yield from inner_plan(other)
+        return selection_cursor
+
+    def _compileRangeIndexCursor(self, selector:ast.RangeIndexCursor)->Plan:
+        # if a cursor has multiple matches, select the nth one(s)
+        other_plan = self.compile(selector.other)
+        ranges = selector.ranges
+        def range_index_cursor(context:Context):
+            return apply_ranges(ranges, other_plan(context), adapt_index=True)
+        return range_index_cursor
+
+    def _compileSelectionAfterSelection(self, selector:ast.SelectionAfterSelection)->Plan:
+        # select everything in context from the end of the other cursor or selection
+        other_plan = self.compile(selector.other)
+        def selection_after_selection(context:Context):
+            other = last(other_plan(context))
+            if other is not None:
+                yield _span(context, other.end, context.end)
+        return selection_after_selection
+
+    def _compileSelectionBeforeSelection(self, selector:ast.SelectionBeforeSelection)->Plan:
+        # select everything in context until the start of the other cursor or selection
+        other_plan = self.compile(selector.other)
+        def selection_before_selection(context:Context):
+            other = first(other_plan(context))
+            if other is not None:
+                yield _span(context, context.start, other.start)
+        return selection_before_selection
+
+    def _compileSubstringSelection(self, selector:ast.SubstringSelection)->Plan:
+        start, end = selector.start, selector.end
+        def substring_selection(context:Context):
+            yield context.sub(start, end)
+        return substring_selection
+
+    def _compileDirectLineSelection(self, selector:ast.DirectLineSelection)->Plan:
+        # select a specific line by line number; negative to select from end
+        ranges = selector.ranges
+        def direct_line_selection(context:Context):
+            return apply_ranges(ranges, _Lines(context.expand_to_lines()), adapt_index=True)
+        return direct_line_selection
+
+    def _compileCursorLineSelection(self, selector:ast.CursorLineSelection)->Plan:
+        # select a line by that a cursor sits on
+        other_plan = self.compile(selector.other)
+        def cursor_line_selection(context:Context):
+            file_map = context.file_map
+            for other in other_plan(context):
+                first_line, last_line = _line_range(other, file_map)
+                yield other._new(file_map.line_to_cursor(first_line), file_map.line_to_start_end_cursor(last_line)[1])
+        return cursor_line_selection
+
+    def _compileSelectionLineSelection(self, selector:ast.SelectionLineSelection)->Plan:
+        # select individual lines of a larger selection
+        other_plan = self.compile(selector.other)
+        def selection_line_selection(context:Context):
+            for other in other_plan(context):
+                yield from other.expand_to_lines().split_lines()
+        return selection_line_selection
+
+    def _compileFindSelection(self, selector:ast.FindSelection)->Plan:
+        # TODO include modifiers:
+        # is_next # relative to previous selection
+        # is_matching:bool # same indentation as previous selection
+        # is_with:bool # match only part of a line even if selecting entire line
+        plan = self._compileFindExpression(selector.expression)
+        if not selector.is_line:
+            return plan
+        def find_lines(context:Context):
+            # select each line with a match, once
+            line_end = None
+            for found in plan(context):
+                if line_end is not None and found.start < line_end:
+                    continue
+                line = found.expand_to_lines()
+                line_end = line.end
+                yield line
+        return find_lines
+
+    def _compileFindExpression(self, expression:ast._StringMatchExpression)->Plan:
+        if isinstance(expression, str):
+            def find_string(context:Context):
+                return context.find_all(expression)
+            return find_string
+        elif isinstance(expression, ast.LiteralRegex):
+            pattern, flags = expression.pattern, expression.flags
+            def find_regex(context:Context):
+                return context.find_all_re(pattern, flags)
+            return find_regex
+        elif isinstance(expression, ast.Variable):
+            resolve_variable = self.resolve_variable
+            def find_variable(context:Context):
+                return context.find_all(str(resolve_variable(expression)))
+            return find_variable
+        # TODO selections
+        return _nothing
+
+    def _compileFindFirstSelection(self, selector:ast.FindFirstSelection)->Plan:
+        expression = selector.expression
+        resolve_variable = self.resolve_variable
+        def find_first(context:Context):
+            if isinstance(expression, ast.LiteralRegex):
+                found = context.find_re(expression.pattern, expression.flags)
+            elif isinstance(expression, ast.Variable):
+                found = context.find(str(resolve_variable(expression)))
+            else:
+                found = context.find(expression)
+            if found is not None:
+                yield found
+        return find_first
+
+    def _compileFindLastSelection(self, selector:ast.FindLastSelection)->Plan:
+        expression = selector.expression
+        n = 1 if selector.n is None else selector.n
+        resolve_variable = self.resolve_variable
+        def find_last(context:Context):
+            if isinstance(expression, ast.LiteralRegex):
+                found = context.rfind_all_re(expression.pattern, expression.flags)
+            elif isinstance(expression, ast.Variable):
+                found = context.rfind_all(str(resolve_variable(expression)))
+            else:
+                found = context.rfind_all(expression)
+            # Found from last to first, but yielded in order
+            return reversed(list(islice(found, n)))
+        return find_last
+
+    def _compileFindAnySelection(self, selector:ast.FindAnySelection)->Plan:
+        keys = selector.keys
+        patterns = {} # The keys are compiled once per encoding, on first use
+        def find_any(context:Context):
+            pattern = patterns.get(context.encoding)
+            if pattern is None:
+                pattern = patterns[context.encoding] = compile_keywords(key.encode(context.encoding) for key in keys)
+            return context.find_all_pattern(pattern)
+        return find_any
+
+    def _compileBlockSelection(self, selector:ast.BlockSelection)->Plan:
+        # select a large block from two other selections
+        start_plan = self.compile(selector.start)
+        if isinstance(selector.end, ast.LengthCursor):
+            length = selector.end.length
+            def block_selection_length(context:Context):
+                start = first(start_plan(context))
+                if start is not None:
+                    yield _span(context, start.start, start.start + length)
+            return block_selection_length
+        end_plan = self.compile(selector.end)
+        def block_selection(context:Context):
+            start = first(start_plan(context))
+            end = last(end_plan(context))
+            # Ensure both ends exist and the end is after the start
+            if start is not None and end is not None and start.end <= end.start:
+                yield _span(context, start.start, end.end)
+        return block_selection
+
+    def _compileBetweenSelection(self, selector:ast.BetweenSelection)->Plan:
+        # select a large block between two other selections
+        start_plan = self.compile(selector.start)
+        end_plan = self.compile(selector.end)
+        def between_selection(context:Context):
+            start = first(start_plan(context))
+            end = last(end_plan(context))
+            # Ensure both ends exist and the end is after the start
+            if start is not None and end is not None and start.end <= end.start:
+                yield _span(context, start.end, end.start)
+        return between_selection
+
+    def _compileSubSelection(self, selector:ast.SubSelection)->Plan:
+        # select a portion of a previous selection
+        inner_plan = self.compile(selector.inner)
+        outer_plan = self.compile(selector.outer)
+        def sub_selection(context:Context):
+            for other in outer_plan(context):
+                yield from inner_plan(other)
+        return sub_selection
+
+    def _compileRangeIndexSelection(self, selector:ast.RangeIndexSelection)->Plan:
+        # if a selection has multiple matches, select the nth one
+        other_plan = self.compile(selector.other)
+        ranges = selector.ranges
+        def range_index_selection(context:Context):
+            return apply_ranges(ranges, other_plan(context), adapt_index=True)
+        return range_index_selection
+
+    def _compileFileSelection(self, selector:ast.FileSelection)->Plan:
+        def file_selection(context:Context):
+            yield context.file()
+        return file_selection
+
+
+def _span(context:Context, start:int, end:int)->Context:
+    """
+    Get a sub-selection of the context from absolute (rather than relative) start and end points
+    """
+    return context.sub(start - context.start, end - context.start)
+
+def _nothing(context:Context):
+    return iter(())
+
+def _line_range(selection:Context, file_map:FileMap)->Tuple[int,int]:
+    """
+    Get the numbers of the first and last lines a selection touches. A cursor after a line break falls
+    on the following line, but a selection ending with a line break doesn't include the following line.
+    """
+    first_line = file_map.cursor_to_line(selection.start)
+    last_line = file_map.cursor_to_line(selection.end)
+    if selection.end > selection.start and file_map.line_to_cursor(last_line) == selection.end:
+        last_line -= 1
+    return first_line, last_line
+
+class _Lines(Sequence):
+    """
+    The lines of a selection (already expanded to whole lines), looked up in the file map as they are
+    accessed, so that addressing a few lines by number doesn't split the whole selection into lines
+    """
+    def __init__(self, selection:Context):
+        self.selection = selection
+        self.file_map = selection.file_map
+        if selection.start == selection.end:
+            self.first_line, self.count = 1, 0
+        else:
+            self.first_line, last_line = _line_range(selection, self.file_map)
+            self.count = last_line - self.first_line + 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(self.count)[index]]
+        start, end = self.file_map.line_to_start_end_cursor(self.first_line + range(self.count)[index])
+        return self.selection._new(start, end)
@@ -1,97 +1,27 @@
-from functools import reduce
+from functools import lru_cache, reduce
 import re
 import io
-from mmap import mmap
+from mmap import mmap, ACCESS_DEFAULT, ACCESS_READ
 import sys, os
 from operator import or_
-from typing import List
-from .file_map import FileMap
+from typing import BinaryIO, List, Optional, Tuple, Union, TYPE_CHECKING
+from .file_map import FileMap, _overlaps_itself
+from .regex_analysis import can_match_byte, is_line_local, required_literals
+if TYPE_CHECKING:
+    from .index_cache import LineIndexCache
 
+REVERSE_SEARCH_CHUNK = 64 * 1024 # Minimum number of bytes to scan at a time when searching backward
+PREFILTER_REGION = 64 * 1024 # Minimum number of bytes to search with a regex around each line found by a prefilter
 
-class Context:
-    data: mmap
-    start: int
-    start_line:int = None # Line number of first selected line
-    end: int
-    end_line:int = None # Line number of last selected line
-    encoding: str
-    line_separator: bytes
-    parent: 'Context'
-    match_data: re.Match
-    highlights: List['Context'] # Any sub-selections which should be highlighted (e.g. the matched term in a selected line)
 
-    def __init__(self, data, start=None, end=None, *, encoding=None, line_separator=None, parent=None, _match_data=None):
-        """
-        
-        """
-        self.start = start
-        self.end = end
-        self.encoding = encoding or sys.getdefaultencoding()
-        self.line_separator = line_separator or os.linesep
-        self._file_map = None
-        if isinstance(self.line_separator, str):
-            self.line_separator = self.line_separator.encode(self.encoding)
-        self.parent = parent
-        self.match_data = _match_data
-        if isinstance(data, Context):
-            # Sub-selection
-            self.parent = data
-            self.data = data.data
-            self.start += data.start
-            self.end += data.start
-            self.encoding = data.encoding
-            if self.end > data.end:
-                raise IndexError('Sub-selection out of bounds')
-        elif isinstance(data, mmap):
-            self.data = data
-        elif isinstance(data, io.IOBase):
-            try:
-                self.data = mmap(data.fileno(), 0)
-            except io.UnsupportedOperation:
-                # Probably not a "real" file, so try to copy into an mmap
-                if isinstance(data, io.BytesIO):
-                    data.seek(0, os.SEEK_END)
-                    self.data = mmap(-1, data.tell())
-                    data.seek(0)
-                    while True:
-                        page = data.read(1024)
-                        if not page:
-                            break
-                        self.data.write(page)
-                elif isinstance(data, io.TextIOBase):
-                    data.seek(0, os.SEEK_END)
-                    self.data = mmap(-1, data.tell()) # FIXME assumes single-byte encoding
-                    data.seek(0)
-                    while True:
-                        page = data.read(1024)
-                        if not page:
-                            break
-                        self.data.write(page.encode(self.encoding))
-        elif isinstance(data, (bytes,bytearray)):
-            self.data = mmap(-1, len(data))
-            self.data.write(data)
-        elif isinstance(data, str):
-            data = data.encode(self.encoding)
-            self.data = mmap(-1, len(data))
-            self.data.write(data)
-        if self.start is None:
-            self.start = 0
-        if self.end is None:
-            self.data.seek(0, os.SEEK_END)
-            self.end = self.data.tell()
-    
-    @property
-    def file_map(self)->FileMap:
-        """
-        A map of the file that allows quickly traversing and converting cursor positions to line/column numbers.
+class _Selectable:
+    """
+    Searching and slicing operations shared by full contexts and lightweight spans.
 
-        This is a map of the entire file, not merely of this context.
-        """
-        if self.parent is not None:
-            return self.parent.file_map
-        if self._file_map is None:
-            self._file_map = FileMap.from_lines(self.split_lines_bytes())
-        return self._file_map
+    Subclasses provide `data`, `start`, `end`, `encoding` and `line_separator`, and
+    `_new(start, end, match_data=None)` to create a selection of their own type.
+    """
+    __slots__ = ()
 
     def find(self, value):
         """
@@ -102,7 +32,18 @@ class Context:
         index = self.data.find(value, self.start, self.end)
         if index == -1:
             return None
-        return Context(self.data, index, index+len(value), encoding=self.encoding, parent=self)
+        return self._new(index, index+len(value))
+    
+    def rfind(self, value):
+        """
+        Get a new context by searching this context backward for the last matching string
+        """
+        if isinstance(value, str):
+            value = value.encode(self.encoding)
+        index = self.data.rfind(value, self.start, self.end)
+        if index == -1:
+            return None
+        return self._new(index, index+len(value))
     
     def find_all(self, value):
         """
@@ -116,7 +57,28 @@ class Context:
             if index == -1:
                 break
             start = index + len(value)
-            yield Context(self.data, index, start, encoding=self.encoding, parent=self)
+            yield self._new(index, start)
+    
+    def rfind_all(self, value):
+        """
+        Get new contexts by searching this context backward for matching strings; the same matches 
+        as `find_all`, from last to first
+        """
+        if isinstance(value, str):
+            value = value.encode(self.encoding)
+        if not value:
+            return
+        if _overlaps_itself(value):
+            # Which of the overlapping matches find_all skips depends on where it started, so go forward
+            yield from reversed(list(self.find_all(value)))
+            return
+        end = self.end
+        while True:
+            index = self.data.rfind(value, self.start, end)
+            if index == -1:
+                break
+            yield self._new(index, index+len(value))
+            end = index
     
     def find_re(self, value, flags=None):
         """
@@ -125,10 +87,10 @@ class Context:
         if isinstance(value, str):
             value = value.encode(self.encoding)
         pattern = re.compile(value, _interpret_flags(flags))
-        matched = pattern.search(self.data, self.start, self.end)
+        matched = pattern.search(_searchable(self.data), self.start, self.end)
         if not matched:
             return None
-        return Context(self.data, matched.start(), matched.end(), encoding=self.encoding, parent=self, _match_data = matched)
+        return self._new(matched.start(), matched.end(), matched)
     
     def find_all_re(self, value, flags=None):
         """
@@ -136,21 +98,84 @@ class Context:
         """
         if isinstance(value, str):
             value = value.encode(self.encoding)
-        pattern = re.compile(value, _interpret_flags(flags))
-        for matched in pattern.finditer(self.data, self.start, self.end):
-            yield Context(self.data, matched.start(), matched.end(), encoding=self.encoding, parent=self, _match_data = matched)
+        return self.find_all_pattern(re.compile(value, _interpret_flags(flags)))
     
-    def sub(self, start, end):
+    def find_all_pattern(self, pattern:re.Pattern):
         """
-        Get a sub-selection (A selection with start/end points relative to this selection)
+        Get new contexts by searching this context using an already compiled (bytes) regular expression.
+
+        Text which can't contain a match is skipped without running the regex. If every match must
+        contain some literal strings (such as `foo` and `bar` in `/foo.+bar/`), the context is first
+        searched for them, and if none of the matches can span a line separator, only the regions
+        (of whole lines) around the occurrences of the longest of them are searched with the regex.
         """
-        return Context(self, start, end)
+        literals, line_local = _prefilter(pattern, self.line_separator)
+        if any(self.data.find(literal, self.start, self.end) == -1 for literal in literals):
+            return
+        data = _searchable(self.data)
+        if not line_local:
+            for matched in pattern.finditer(data, self.start, self.end):
+                yield self._new(matched.start(), matched.end(), matched)
+            return
+        separator = self.line_separator
+        position = self.start
+        while True:
+            index = self.data.find(literals[0], position, self.end)
+            if index == -1:
+                return
+            line = self.data.rfind(separator, position, index)
+            line = position if line == -1 else line + len(separator)
+            # Nearby occurrences are searched together, so dense matches don't cost a search per line
+            region_end = self.data.find(separator, min(self.end, index + PREFILTER_REGION), self.end)
+            if region_end == -1:
+                region_end = self.end
+            # Matches can't include the separator, so end within the region; searching up to the end of
+            # the separator (rather than the line) leaves anchors and word boundaries as they would be
+            for matched in pattern.finditer(data, line, min(self.end, region_end + len(separator))):
+                if matched.start() >= region_end:
+                    break
+                yield self._new(matched.start(), matched.end(), matched)
+            position = region_end
     
-    def file(self):
+    def rfind_all_re(self, value, flags=None):
         """
-        Expand the context selection to the entire file
+        Get new contexts by searching this context backward using a regular expression; the same 
+        matches as `find_all_re`, from last to first
         """
-        return Context(self.data, encoding=self.encoding, line_separator=self.line_separator)
+        if isinstance(value, str):
+            value = value.encode(self.encoding)
+        return self.rfind_all_pattern(re.compile(value, _interpret_flags(flags)))
+    
+    def rfind_all_pattern(self, pattern:re.Pattern):
+        """
+        Get new contexts by searching this context backward using an already compiled (bytes) regular 
+        expression; the same matches as `find_all_pattern`, from last to first.
+
+        If the pattern can't match a line separator, no match can span the end of a line, so scanning 
+        forward from the start of any line finds the same matches as scanning from the start of the 
+        context. The context is then scanned in chunks from the end, each starting at a line. Otherwise
+        all the matches must be found going forward.
+        """
+        literals, line_local = _prefilter(pattern, self.line_separator)
+        if any(self.data.find(literal, self.start, self.end) == -1 for literal in literals):
+            return
+        separator = self.line_separator
+        if can_match_byte(pattern.pattern, pattern.flags, separator[-1]):
+            yield from reversed(list(self.find_all_pattern(pattern)))
+            return
+        end = None # Matches starting from here were found in the previous chunk
+        while end is None or end > self.start:
+            top = self.end if end is None else end
+            index = self.data.rfind(separator, self.start, max(self.start, top - REVERSE_SEARCH_CHUNK))
+            cut = self.start if index == -1 else index + len(separator)
+            chunk = []
+            for matched in pattern.finditer(_searchable(self.data), cut, self.end):
+                if end is not None and matched.start() >= end:
+                    break
+                chunk.append(matched)
+            for matched in reversed(chunk):
+                yield self._new(matched.start(), matched.end(), matched)
+            end = cut
     
     def bytes(self, start=None, end=None):
         """
@@ -208,7 +233,7 @@ class Context:
         """
         # TODO it may be good to keep an array of line start indices, and use the standard bisect module to search it, enabling fast line number lookups
         len_eol = len(self.line_separator)
-        size = self.data.tell()
+        size = len(self.data)
         if self.start == 0:
             start = 0
         else:
@@ -219,7 +244,6 @@ class Context:
                 start = 0
             else:
                 start = prev_eol + len_eol
-        self.data.seek(0, os.SEEK_END)
         if self.end == size:
             end = self.end
         else:
@@ -231,7 +255,7 @@ class Context:
             else:
                 # Include the line ending in the result
                 end += len_eol
-        return Context(self.data, start, end, encoding=self.encoding, line_separator=self.line_separator)
+        return self._new(start, end)
 
     def split_lines(self):
         """
@@ -243,10 +267,10 @@ class Context:
             index = self.data.find(value, start, self.end)
             if index == -1:
                 # Last line didn't have a final EOL
-                yield Context(self.data, start, self.end, encoding=self.encoding, parent=self)
+                yield self._new(start, self.end)
                 break
             end = index + len(value)
-            yield Context(self.data, start, end, encoding=self.encoding, parent=self)
+            yield self._new(start, end)
             start = end
     
     def split_lines_string(self):
@@ -270,6 +294,210 @@ class Context:
         return f"Selection @ {self.start}-{self.end}: {string}"
 
 
+
+class Context(_Selectable):
+    data: Union[mmap, bytes, bytearray, '_BufferView']
+    start: int
+    start_line:int = None # Line number of first selected line
+    end: int
+    end_line:int = None # Line number of last selected line
+    encoding: str
+    line_separator: bytes
+    parent: 'Context'
+    match_data: re.Match
+    highlights: List['Context'] # Any sub-selections which should be highlighted (e.g. the matched term in a selected line)
+
+    def __init__(self, data, start=None, end=None, *, encoding=None, line_separator=None, parent=None, _match_data=None, index_cache:'LineIndexCache'=None, file_map:FileMap=None):
+        """
+        If an index cache is given and the data is a real file, the file's line index is looked up in
+        (or saved to) the cache, rather than always being built by scanning the file. Alternatively, a
+        file map that is already known to be up to date may be given.
+
+        A BytesIO is viewed rather than copied, so it can't be written to or truncated until the
+        context is released.
+        """
+        self.start = start
+        self.end = end
+        self.encoding = encoding or sys.getdefaultencoding()
+        self.line_separator = line_separator or os.linesep
+        self._file_map = file_map
+        self._cached_file = None # The index cache, path and stat used to look up the file map
+        self._source_file = None # The path and state of the file mapped, so it can be reopened to copy from
+        if isinstance(self.line_separator, str):
+            self.line_separator = self.line_separator.encode(self.encoding)
+        self.parent = parent
+        self.match_data = _match_data
+        if isinstance(data, Context):
+            # Sub-selection
+            self.parent = data
+            self.data = data.data
+            self.start += data.start
+            self.end += data.start
+            self.encoding = data.encoding
+            if self.end > data.end:
+                raise IndexError('Sub-selection out of bounds')
+        elif isinstance(data, (bytes, bytearray, mmap, _BufferView)):
+            # Searched in place, without copying
+            self.data = data
+        elif isinstance(data, io.IOBase):
+            try:
+                # Files opened read-only are mapped read-only, so they don't need write permission
+                self.data = mmap(data.fileno(), 0, access=ACCESS_DEFAULT if data.writable() else ACCESS_READ)
+                stat = os.fstat(data.fileno())
+                if isinstance(data.name, str):
+                    self._source_file = (data.name, _file_state(stat))
+                if index_cache is not None:
+                    self._cached_file = (index_cache, data.name, stat)
+            except io.UnsupportedOperation:
+                # Probably not a "real" file
+                if isinstance(data, io.BytesIO):
+                    # Share the buffer rather than copying it
+                    self.data = _wrap_buffer(data.getbuffer())
+                elif isinstance(data, io.TextIOBase):
+                    data.seek(0)
+                    self.data = data.read().encode(self.encoding)
+                else:
+                    raise TypeError(f"Can't create a context from {type(data).__name__}")
+        elif isinstance(data, str):
+            self.data = data.encode(self.encoding)
+        else:
+            # Anything else supporting the buffer protocol, e.g. a memoryview
+            self.data = _wrap_buffer(memoryview(data))
+        if self.start is None:
+            self.start = 0
+        if self.end is None:
+            self.end = len(self.data)
+    
+    def release(self):
+        """
+        Stop viewing the buffer this context was created from (such as a BytesIO), so it can be resized
+        again. The context can't be used afterwards. This does nothing for files, bytes, and sub-selections.
+        """
+        if self.parent is None and isinstance(self.data, _BufferView):
+            self.data.view.release()
+
+    def _open_source(self)->Optional[BinaryIO]:
+        """
+        Reopen the file this context maps, if it is a real file and is unchanged since it was mapped, 
+        so that its contents can be copied without reading them through the map
+        """
+        if self.parent is not None:
+            return self.parent._open_source()
+        if self._source_file is None:
+            return None
+        path, state = self._source_file
+        try:
+            file = open(path, 'rb')
+        except OSError:
+            return None
+        if _file_state(os.fstat(file.fileno())) != state:
+            file.close()
+            return None
+        return file
+
+    @property
+    def file_map(self)->FileMap:
+        """
+        A map of the file that allows quickly traversing and converting cursor positions to line/column numbers.
+
+        This is a map of the entire file, not merely of this context.
+        """
+        if self.parent is not None:
+            return self.parent.file_map
+        if self._file_map is None:
+            if self._cached_file is not None:
+                index_cache, path, stat = self._cached_file
+                self._file_map = index_cache.get(path, stat, self.line_separator, self._build_file_map)
+            else:
+                self._file_map = self._build_file_map()
+        return self._file_map
+
+    def _build_file_map(self)->FileMap:
+        return FileMap.from_data(_searchable(self.data), self.line_separator)
+
+    def sub(self, start, end):
+        """
+        Get a sub-selection (A selection with start/end points relative to this selection)
+        """
+        return Context(self, start, end)
+    
+    def file(self):
+        """
+        Expand the context selection to the entire file
+        """
+        return Context(self.data, encoding=self.encoding, line_separator=self.line_separator)
+    
+    def _new(self, start, end, match_data=None):
+        return Context(self.data, start, end, encoding=self.encoding, line_separator=self.line_separator, parent=self, _match_data=match_data)
+
+    def span(self)->'Span':
+        """
+        Get a lightweight span covering the same selection
+        """
+        return Span(self, self.start, self.end, self.match_data)
+
+
+class Span(_Selectable):
+    """
+    A lightweight selection used internally by the evaluator.
+
+    Rather than a chain of parents, a span only refers to the source context it was found in (which 
+    provides the data, encoding and file map), so matching millions of lines doesn't keep whole 
+    selection trees alive. Use `context()` to get a full Context when one is needed.
+    """
+    __slots__ = ('source', 'start', 'end', 'match_data')
+
+    def __init__(self, source:Context, start:int, end:int, match_data:re.Match=None):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.match_data = match_data
+
+    @property
+    def data(self)->mmap:
+        return self.source.data
+
+    @property
+    def encoding(self)->str:
+        return self.source.encoding
+
+    @property
+    def line_separator(self)->bytes:
+        return self.source.line_separator
+
+    @property
+    def file_map(self)->FileMap:
+        return self.source.file_map
+
+    def _new(self, start, end, match_data=None):
+        return Span(self.source, start, end, match_data)
+
+    def span(self)->'Span':
+        return self
+
+    def sub(self, start, end):
+        """
+        Get a sub-selection (A selection with start/end points relative to this selection)
+        """
+        start += self.start
+        end += self.start
+        if end > self.end:
+            raise IndexError('Sub-selection out of bounds')
+        return Span(self.source, start, end)
+
+    def file(self):
+        """
+        Expand the selection to the entire file
+        """
+        return Span(self.source, 0, len(self.source.data))
+
+    def context(self)->Context:
+        """
+        Get a full Context for this selection
+        """
+        return Context(self.data, self.start, self.end, encoding=self.encoding, line_separator=self.line_separator, parent=self.source, _match_data=self.match_data)
+
+
 def _interpret_flags(flags):
     if flags is None:
         return 0
@@ -284,4 +512,75 @@ def _interpret_flags(flags):
         }[f], flags.lower()), 0)
     if isinstance(flags, int):
         return flags
-    raise ValueError("Unknown flags: {}")
\ No newline at end of file
+    raise ValueError("Unknown flags: {}")
+
+@lru_cache(maxsize=256)
+def _prefilter(pattern:re.Pattern, separator:bytes)->Tuple[Tuple[bytes,...], bool]:
+    """
+    Get the literal strings every match of a pattern must contain (longest first), and whether its
+    matches can be found by searching only the lines which contain the first of them
+    """
+    if not isinstance(pattern.pattern, bytes):
+        return (), False
+    literals = tuple(sorted(set(required_literals(pattern.pattern, pattern.flags)), key=len, reverse=True))
+    return literals, bool(literals) and is_line_local(pattern.pattern, pattern.flags, separator)
+
+def _file_state(stat:os.stat_result)->Tuple[int,int,int,int]:
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class _BufferView:
+    """
+    Adapts a memoryview to the bytes-like interface that contexts expect of their data, so that any 
+    buffer can be searched without copying it. Only slices taken out of it are copied.
+    """
+    __slots__ = ('view',)
+
+    def __init__(self, view:memoryview):
+        self.view = view
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.view[index].tobytes()
+        return self.view[index]
+
+    def find(self, value:bytes, start:int=0, end:int=None)->int:
+        if end is None:
+            end = len(self.view)
+        matched = re.compile(re.escape(value)).search(self.view, start, end)
+        return -1 if matched is None else matched.start()
+
+    def rfind(self, value:bytes, start:int=0, end:int=None)->int:
+        if end is None:
+            end = len(self.view)
+        if not value:
+            return end if start <= end else -1
+        # Search a chunk at a time from the end; each chunk only needs copying to search it
+        cursor = end
+        while cursor > start:
+            chunk_start = max(start, cursor - REVERSE_SEARCH_CHUNK)
+            index = self.view[chunk_start:min(end, cursor + len(value) - 1)].tobytes().rfind(value)
+            if index != -1:
+                return chunk_start + index
+            cursor = chunk_start
+        return -1
+
+def _wrap_buffer(view:memoryview):
+    """
+    Get data for a context from a memoryview, using the object it views directly where possible
+    """
+    if not view.c_contiguous:
+        raise ValueError('Contexts require a contiguous buffer')
+    view = view.cast('B')
+    if isinstance(view.obj, (bytes, bytearray, mmap)) and len(view) == len(view.obj):
+        return view.obj
+    return _BufferView(view)
+
+def _searchable(data):
+    """
+    Get an object supporting the buffer protocol (for regular expressions) from a context's data
+    """
+    return data.view if isinstance(data, _BufferView) else data
@@ -0,0 +1,98 @@
+import os, threading
+from collections import OrderedDict
+from .context import Context, _file_state
+from .file_map import FileMap
+from typing import BinaryIO, Callable, Hashable, Optional, Tuple
+__all__ = ('ContextPool',)
+
+DEFAULT_MAX_OPEN = 64 # Number of files a session keeps mapped between queries
+
+class ContextPool:
+    """
+    The contexts of the files a session has queried, kept open between queries so that the file maps
+    (and anything else derived from a file) are only built once.
+
+    A pooled context is reused as long as the file's device, inode, size and modification time are
+    unchanged, and the settings it was opened with (such as the encoding) are the same. Contexts are
+    mapped read-only unless they are needed for an update. At most `max_open` contexts are kept; beyond
+    that, the least recently used are dropped (and unmapped once nothing else refers to them).
+
+    The pool may be shared by threads evaluating different files.
+    """
+    def __init__(self, max_open:int=DEFAULT_MAX_OPEN):
+        self.max_open = max_open
+        self._entries = OrderedDict() # path -> _Entry
+        self._lock = threading.Lock()
+
+    def get(self, path:str, open_context:Callable[[BinaryIO, Optional[FileMap]], Context], *, writable:bool=False, settings:Hashable=None)->Context:
+        """
+        Get the context of a file, from the pool if it is still current, or else by opening the file
+        and passing it (and the file's map, if it is known) to `open_context`
+        """
+        entry = self._entries.get(path)
+        file_map = None
+        if entry is not None and entry.settings == settings and entry.state == _file_state(os.stat(path)):
+            if entry.context is not None and (entry.writable or not writable):
+                with self._lock:
+                    if path in self._entries:
+                        self._entries.move_to_end(path)
+                return entry.context
+            file_map = entry.file_map
+        with open(path, 'r+b' if writable else 'rb') as file:
+            context = open_context(file, file_map)
+            state = _file_state(os.fstat(file.fileno()))
+        self._put(path, _Entry(state, settings, writable, context))
+        return context
+
+    def replaced(self, path:str, file_map:Optional[FileMap]=None, *, settings:Hashable=None):
+        """
+        Record that the session has replaced a file, along with the map of its new contents if it is known
+        """
+        self.discard(path)
+        if file_map is not None:
+            self._put(path, _Entry(_file_state(os.stat(path)), settings, False, None, file_map))
+
+    def discard(self, path:str):
+        """
+        Drop the context of a file from the pool
+        """
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        """
+        Drop every context from the pool
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path:str):
+        return path in self._entries
+
+    def _put(self, path:str, entry:'_Entry'):
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_open:
+                self._entries.popitem(last=False)
+
+
+class _Entry:
+    __slots__ = ('state', 'settings', 'writable', 'context', '_file_map')
+
+    def __init__(self, state:Tuple[int,int,int,int], settings:Hashable, writable:bool, context:Optional[Context], file_map:FileMap=None):
+        self.state = state
+        self.settings = settings
+        self.writable = writable
+        self.context = context
+        self._file_map = file_map
+
+    @property
+    def file_map(self)->Optional[FileMap]:
+        # The map the context has built, if any; without building it if not
+        if self.context is not None:
+            return self.context._file_map
+        return self._file_map
@@ -0,0 +1,286 @@
+import os, re
+from fnmatch import translate
+from time import monotonic
+from typing import Dict, List, Optional, Sequence, Tuple
+__all__ = ('FileFinder',)
+
+DEFAULT_CACHE_SECONDS = 2.0 # How long a listing is reused for before the directories are walked again
+BINARY_CHECK_SIZE = 8192 # Number of bytes at the start of a file checked for a NUL byte
+IGNORE_FILE = '.gitignore'
+
+_MAGIC = re.compile(r'[*?[]')
+_SEPARATORS = re.compile(r'[\\/]' if os.sep == '\\' else r'/')
+
+class FileFinder:
+    """
+    Finds the files matching a glob pattern, like `glob.glob`, but walks the directories with
+    `os.scandir` on a pool of threads, and supports:
+
+    * `**` to match any number of directories (including none)
+    * ignoring files excluded by `.gitignore` files, both within the directories searched and in their
+      parents up to the top of the git repository
+    * skipping binary files (those with a NUL byte near the start) and files over a maximum size
+
+    As with `glob`, wildcards don't match names starting with a dot unless the pattern does. A path
+    with no wildcards is always returned if it exists, regardless of the filters. Matches are returned
+    in sorted order.
+
+    Listings are cached for `cache_seconds`, so a session running a series of queries against the
+    same files only walks the directories once.
+    """
+    def __init__(self, *, use_ignore_files:bool=True, skip_binary:bool=True, max_file_size:int=None, threads:int=None, cache_seconds:float=DEFAULT_CACHE_SECONDS):
+        self.use_ignore_files = use_ignore_files
+        self.skip_binary = skip_binary
+        self.max_file_size = max_file_size
+        self.threads = threads or min(32, (os.cpu_count() or 1) + 4)
+        self.cache_seconds = cache_seconds
+        self._cache:Dict[tuple, Tuple[float, List[str]]] = {}
+
+    def find(self, pattern:str)->List[str]:
+        """
+        Get the (sorted) paths of the files matching a pattern
+        """
+        key = (pattern, os.getcwd(), self.use_ignore_files, self.skip_binary, self.max_file_size)
+        cached = self._cache.get(key)
+        if cached is not None and monotonic() - cached[0] < self.cache_seconds:
+            return cached[1]
+        found = self._find(pattern)
+        self._cache[key] = (monotonic(), found)
+        return found
+
+    def invalidate(self):
+        """
+        Forget all cached listings
+        """
+        self._cache.clear()
+
+    def _find(self, pattern:str)->List[str]:
+        if not _MAGIC.search(pattern):
+            return [pattern] if os.path.lexists(pattern) else []
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait # deferred; plain paths never need threads
+        root, components = _split_pattern(pattern)
+        matchers = [None if component == '**' else _compile_component(component) for component in components]
+        ignores = _parent_ignore_files(root) if self.use_ignore_files else ()
+        found = set()
+        with ThreadPoolExecutor(self.threads) as executor:
+            pending = {executor.submit(self._scan, root or os.curdir, bool(root), 0, matchers, ignores)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirectories = future.result()
+                    found.update(files)
+                    for subdirectory in subdirectories:
+                        pending.add(executor.submit(self._scan, *subdirectory))
+        return sorted(found)
+
+    def _scan(self, directory:str, keep_prefix:bool, index:int, matchers:Sequence[Optional[re.Pattern]], ignores:tuple):
+        """
+        Scan a directory, matching its entries against the pattern's components from the given index.
+
+        Returns the matching files, and the arguments to scan each subdirectory which may contain more.
+        """
+        files = []
+        subdirectories = []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return files, subdirectories # Gone, not a directory, not readable, or a symlink loop
+        if self.use_ignore_files and any(entry.name == IGNORE_FILE for entry in entries):
+            ignores = ignores + (_IgnoreFile.load(os.path.join(directory, IGNORE_FILE)),)
+        # Each position the pattern may have reached: `**` matches any number of directories, including none
+        indexes = [index]
+        while indexes[-1] < len(matchers) and matchers[indexes[-1]] is None:
+            indexes.append(indexes[-1] + 1)
+        for entry in entries:
+            path = entry.path if keep_prefix else entry.name
+            try:
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+                # `**` doesn't descend through symlinks, which could lead back up the tree
+                recurse = is_dir and not entry.name.startswith('.') and not entry.is_symlink()
+            except OSError:
+                continue # Deleted (or otherwise unreadable) during the walk
+            if ignores and _is_ignored(ignores, os.path.abspath(path), is_dir):
+                continue
+            next_indexes = set()
+            for i in indexes:
+                if i == len(matchers):
+                    continue
+                if matchers[i] is None:
+                    if recurse:
+                        next_indexes.add(i)
+                elif matchers[i].match(entry.name):
+                    if i + 1 == len(matchers):
+                        if is_file and self._accept(entry):
+                            files.append(path)
+                    elif is_dir:
+                        next_indexes.add(i + 1)
+            for i in next_indexes:
+                subdirectories.append((path, True, i, matchers, ignores))
+        return files, subdirectories
+
+    def _accept(self, entry:os.DirEntry)->bool:
+        if self.max_file_size is not None:
+            try:
+                if entry.stat().st_size > self.max_file_size:
+                    return False
+            except OSError:
+                return False
+        if self.skip_binary:
+            try:
+                with open(entry.path, 'rb') as file:
+                    return b'\0' not in file.read(BINARY_CHECK_SIZE)
+            except OSError:
+                return False
+        return True
+
+
+def _split_pattern(pattern:str)->Tuple[str, List[str]]:
+    """
+    Split a pattern into the directory to start from (its leading components without wildcards) and
+    the remaining components
+    """
+    drive, rest = os.path.splitdrive(pattern)
+    components = _SEPARATORS.split(rest)
+    root = drive
+    if components and components[0] == '':
+        # Absolute
+        root += os.sep
+        components = components[1:]
+    components = [component for component in components if component]
+    # Adjacent `**`s are the same as one
+    components = [c for i, c in enumerate(components) if not (c == '**' and i and components[i-1] == '**')]
+    if components and components[-1] == '**':
+        components.append('*') # Every file in the directories
+    literal = []
+    while components and not _MAGIC.search(components[0]):
+        literal.append(components.pop(0))
+    if literal:
+        root = os.path.join(root, *literal) if root else os.path.join(*literal)
+    return root, components
+
+def _compile_component(component:str)->re.Pattern:
+    pattern = translate(component)
+    if not component.startswith('.'):
+        # As with glob, wildcards don't match hidden names
+        pattern = r'(?!\.)' + pattern
+    return re.compile(pattern, 0 if os.path.normcase('A') == 'A' else re.IGNORECASE)
+
+
+class _IgnoreFile:
+    """
+    The rules of a `.gitignore` file, which apply to the paths within the directory it is in
+    """
+    def __init__(self, base:str, rules:List[Tuple[re.Pattern, bool, bool]]):
+        self.base = base # Absolute path of the directory, with a trailing separator
+        self.rules = rules # (pattern, is_negated, directories_only)
+
+    @classmethod
+    def load(cls, path:str)->'_IgnoreFile':
+        rules = []
+        try:
+            with open(path, encoding='utf-8', errors='surrogateescape') as file:
+                for line in file:
+                    rule = _compile_ignore_rule(line.rstrip('\r\n'))
+                    if rule is not None:
+                        rules.append(rule)
+        except OSError:
+            pass
+        return cls(os.path.join(os.path.abspath(os.path.dirname(path)), ''), rules)
+
+    def match(self, path:str, is_dir:bool)->Optional[bool]:
+        """
+        Whether the rules ignore (True) or re-include (False) an absolute path, or None if no rule matches it
+        """
+        if not path.startswith(self.base):
+            return None
+        relative = path[len(self.base):].replace(os.sep, '/')
+        result = None
+        for pattern, negated, directories_only in self.rules:
+            if directories_only and not is_dir:
+                continue
+            if pattern.match(relative):
+                result = not negated
+        return result
+
+def _is_ignored(ignores:Sequence[_IgnoreFile], path:str, is_dir:bool)->bool:
+    # Rules in deeper directories take precedence over those above them, as do later rules in a file
+    ignored = False
+    for ignore in ignores:
+        matched = ignore.match(path, is_dir)
+        if matched is not None:
+            ignored = matched
+    return ignored
+
+def _compile_ignore_rule(line:str)->Optional[Tuple[re.Pattern, bool, bool]]:
+    """
+    Compile a line of a `.gitignore` file to a regex matching the paths (relative to the file's
+    directory, with `/` separators) that it applies to
+    """
+    if not line.strip() or line.startswith('#'):
+        return None
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\'):
+        line = line[1:] # An escaped leading `!` or `#`
+    directories_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # Patterns with a slash (other than at the end) are relative to the directory; others match at any depth
+    anchored = '/' in line
+    line = line.lstrip('/')
+    regex = []
+    i = 0
+    while i < len(line):
+        if line.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif line.startswith('/**', i) and i + 3 == len(line):
+            regex.append('/.*')
+            i += 3
+        elif line[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif line[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        elif line[i] == '[':
+            close = line.find(']', i + 2)
+            if close == -1:
+                regex.append(re.escape('['))
+                i += 1
+            else:
+                body = line[i+1:close]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                regex.append('[' + body.replace('\\', '\\\\') + ']')
+                i = close + 1
+        elif line[i] == '\\' and i + 1 < len(line):
+            regex.append(re.escape(line[i+1]))
+            i += 2
+        else:
+            regex.append(re.escape(line[i]))
+            i += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    return re.compile(prefix + ''.join(regex) + r'\Z', re.DOTALL), negated, directories_only
+
+def _parent_ignore_files(root:str)->tuple:
+    """
+    Load the ignore files of the directories above the one a search starts from, up to the top of the git repository
+    """
+    directory = os.path.abspath(root or os.curdir)
+    found = []
+    while True:
+        parent = os.path.dirname(directory)
+        if os.path.exists(os.path.join(directory, '.git')) or parent == directory:
+            break
+        directory = parent
+        if os.path.isfile(os.path.join(directory, IGNORE_FILE)):
+            found.append(_IgnoreFile.load(os.path.join(directory, IGNORE_FILE)))
+    if not os.path.exists(os.path.join(directory, '.git')):
+        return () # Not in a repository, so only the ignore files within the search apply
+    return tuple(reversed(found))
@@ -1,7 +1,13 @@
-from .context import Context
-from io import IOBase, TextIOBase, RawIOBase, TextIOWrapper, BytesIO
+import os
+from functools import partial
+from .context import Context, _searchable
+from .file_map import FileMap
+from io import IOBase, TextIOBase, RawIOBase, TextIOWrapper, UnsupportedOperation, SEEK_SET, SEEK_CUR, SEEK_END
 from .operation import Opcode, Operation
-from typing import Iterable
+from .piece_table import PieceTable
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+PAGE_SIZE = 1024 * 1024 # Maximum number of unchanged bytes copied out of the context at a time when iterating
 
 class Editor:
     """
@@ -10,6 +16,7 @@ class Editor:
     def __init__(self, context:Context, operations:Iterable[Operation]):
         self.context = context
         self.operations = operations
+        self._piece_table = None
     
     def __call__(self, output):
         # TODO can we track the number of lines affected by the change?
@@ -23,126 +30,348 @@ class Editor:
         else:
             # Binary IO; write directly
             with output:
-                for block in self:
-                    output.write(block)
+                self.write(output)
     
     def __iter__(self):
+        for start, end, value in self._segments():
+            if value is None:
+                yield from self.context.page_bytes(start, end, PAGE_SIZE)
+            else:
+                yield value
+
+    def write(self, output:BinaryIO):
+        """
+        Write the result of the editor operation to a binary file.
+
+        Where the output and the context are both real files, the unchanged text is copied from one
+        to the other by the kernel (with `os.copy_file_range` or `os.sendfile`), without passing
+        through this process. Otherwise, it is written straight from the context's data, without
+        being copied out of it first.
+        """
+        fd = _fileno(output)
+        source = self.context._open_source() if fd is not None else None
+        try:
+            if source is None:
+                write = output.write
+            else:
+                # Everything is written to the file descriptor, so nothing may be left in the buffer
+                output.flush()
+                write = partial(_write_all, fd)
+            data = _searchable(self.context.data)
+            for start, end, value in self._segments():
+                if value is not None:
+                    write(value)
+                    continue
+                start += self.context.start
+                end += self.context.start
+                if source is not None:
+                    start += _copy_range(source.fileno(), fd, start, end - start)
+                if start < end:
+                    with memoryview(data) as view, view[start:end] as unchanged:
+                        write(unchanged)
+        finally:
+            if source is not None:
+                source.close()
+
+    def _segments(self)->Iterator[Tuple[int,int,Optional[bytes]]]:
+        """
+        Yield the pieces of the edited text in order: either the start and end of unchanged text in
+        the context (and None), or the start and end of the text an operation replaces (empty for an
+        insertion) and its encoded text
+        """
         context_cursor = 0
         for operation in self.operations:
-            # Emit unchanged text up to the start of the operation
-            yield from self._fast_forward(context_cursor, operation.start)
-            # Emit changed text from the operation
+            # Unchanged text up to the start of the operation
+            if context_cursor > operation.start:
+                raise EditorError('Overlapping operations detected')
+            if context_cursor < operation.start:
+                yield context_cursor, operation.start, None
+            # Changed text from the operation; nothing for deletions
             if operation.opcode == Opcode.insert or operation.opcode == Opcode.replace:
-                yield operation.value.encode(self.context.encoding)
-            # Don't need to yield anything for deletions
+                yield operation.start, operation.end, operation.value.encode(self.context.encoding)
             # Move cursor to the end of the operation
             context_cursor = operation.end
-        # Emit any unchanged text at the end of the file
-        yield from self._fast_forward(context_cursor, self.context.end)
+        # Any unchanged text at the end of the file
+        if context_cursor < len(self.context):
+            yield context_cursor, len(self.context), None
     
+    def bytes(self)->bytes:
+        """
+        Get the result of the editor operation in memory, rather than writing it to a file
+        """
+        return b''.join(self)
+
+    def edited_file_map(self)->Optional[FileMap]:
+        """
+        Get the line map of the edited text, updated from the context's map rather than by scanning the 
+        edited text. Returns None if the context's map hasn't been built (so there is nothing to update),
+        or if it can't be updated incrementally.
+        """
+        context = self.context
+        if context.parent is not None or context._file_map is None:
+            return None
+        try:
+            return context._file_map.apply(self.operations, context.line_separator, context.encoding, _searchable(context.data))
+        except ValueError:
+            return None
+
+    @property
+    def piece_table(self)->PieceTable:
+        """
+        The result of the editor operation as a piece table, which can be read from anywhere (and its
+        offsets translated to and from the context's) without applying the operations
+        """
+        if self._piece_table is None:
+            self._piece_table = PieceTable(self)
+        return self._piece_table
+
     @property
     def stream(self):
         """
-        A file-like object that gives the result of the editor operation
+        A seekable file-like object that gives the result of the editor operation
         """
         return EditorStream(self)
         
-    def _fast_forward(self, start, end):
-        if start > end:
-            raise EditorError('Overlapping operations detected')
-        yield from self.context.page_bytes(start, end)
-    
-    def _blocks_by_lines(self, merge_distance=1):
-        file_map = self.context.file_map
-        first_line = last_line = diff_first_line = diff_last_line = None
-        block_ops = []
-        line_delta = 0
-        for op in self.operations:
-            op_start_line = file_map.cursor_to_line(op.start)
-            if first_line is not None and op_start_line - last_line > merge_distance:
-                # There is a previous block, but this op is not adjacent and need not be combined
-                yield first_line, last_line, diff_first_line, diff_last_line, block_ops
-                block_ops = []
-                first_line = op_start_line
-                diff_first_line = op_start_line + line_delta
-            elif first_line is None:
-                # We are starting a new block
-                first_line = op_start_line
-                diff_first_line = op_start_line + line_delta
-            block_ops.append(op)
-            # Adjust the line delta based on the operation's change
-            if op.opcode == Opcode.insert:
-                line_delta += op.value.count("\n")
-            elif op.opcode == Opcode.delete:
-                line_delta -= self.context.string(op.start, op.end).count("\n")
-            elif op.opcode == Opcode.replace:
-                line_delta += op.value.count("\n")
-                line_delta -= self.context.string(op.start, op.end).count("\n")
-            # Expand the block to include the last line
-            last_line = file_map.cursor_to_line(op.end)
-            diff_last_line = last_line + line_delta
-        if block_ops:
-            yield first_line, last_line, diff_first_line, diff_last_line, block_ops
+    def patch(self, context_lines:int=3, before:bytes=b'before', after:bytes=b'after')->Iterator[bytes]:
+        """
+        Outputs the operations in the unified diff format used by Git and by the `patch` command-line utility,
+        with up to `context_lines` unchanged lines around each change. Changes whose context would meet
+        or overlap are merged into a single hunk.
 
-    
-    def patch(self):
+        Yields lines of the patch file, as bytes in the context's encoding; nothing if there are no changes.
+        Line numbers come from the file map, so only the changed lines (and their context) are ever read.
         """
-        Outputs the operations in the unified diff format used by Git and by the `patch` command-line utility.
+        separator = self.context.line_separator
+        line_count = self._line_count()
+        header = [b'--- ' + before + b'\n', b'+++ ' + after + b'\n'] # Only written before the first hunk
+        hunk = None # Old first line, new first line, old line after the last, and the lines of the hunk
+        removed, added = [], [] # Lines of adjacent changes, which show all of their removed lines first
+        delta = 0 # Lines added (or removed) by the changes so far
+        for first, end, region_start, region_end, new in self._changes():
+            old = self.context.bytes(region_start, region_end)
+            if old == new:
+                continue # The operations on these lines cancel out
+            if hunk is not None and first - hunk[2] <= 2 * context_lines:
+                # Close enough to the previous change to share its hunk
+                if first > hunk[2]:
+                    _add_changes(hunk[3], removed, added)
+                    hunk[3].extend(self._lines(b' ', hunk[2], first))
+            else:
+                if hunk is not None:
+                    _add_changes(hunk[3], removed, added)
+                    yield from self._hunk(hunk, min(hunk[2] + context_lines, line_count + 1), header)
+                leading = max(1, first - context_lines)
+                hunk = [leading, leading + delta, None, list(self._lines(b' ', leading, first))]
+            removed.extend(_prefixed(b'-', old, separator))
+            new_lines = _prefixed(b'+', new, separator)
+            added.extend(new_lines)
+            hunk[2] = end
+            delta += len(new_lines) - (end - first)
+        if hunk is not None:
+            _add_changes(hunk[3], removed, added)
+            yield from self._hunk(hunk, min(hunk[2] + context_lines, line_count + 1), header)
 
-        Yields lines of the patch file
+    def _hunk(self, hunk:list, trailing_end:int, header:list)->Iterator[bytes]:
+        old_first, new_first, end, lines = hunk
+        if all(line[:1] == b' ' for line in lines):
+            return # Every change in it cancelled out
+        lines.extend(self._lines(b' ', end, trailing_end))
+        old_count = sum(1 for line in lines if line[:1] != b'+')
+        new_count = sum(1 for line in lines if line[:1] != b'-')
+        yield from header
+        header.clear()
+        yield f"@@ -{_hunk_range(old_first, old_count)} +{_hunk_range(new_first, new_count)} @@\n".encode()
+        yield from lines
+
+    def _changes(self)->Iterator[Tuple[int,int,int,int,bytes]]:
+        """
+        Yield each run of changed lines: the first line and the line after the last, the start and end of
+        those lines in the context, and the new text that replaces them. Operations on the same line (or
+        which would otherwise leave a partial line) are combined into one change, and operations which
+        change nothing are skipped.
         """
-        # TODO context lines
-        # TODO check for unchanged lines
-        # Could just use difflib to generate a diff rather than doing it ourselves?
-        yield "--- before\n"
-        yield "+++ after\n"
-        for first_line, last_line, diff_first_line, diff_last_line, block_ops in self._blocks_by_lines():
-            yield f"@@ -{first_line},{last_line-first_line+1} +{diff_first_line},{diff_last_line-diff_first_line+1} @@\n"
-            sub_context = self.context.sub(block_ops[0].start, block_ops[-1].end).expand_to_lines()
-            old_lines = sub_context.split_lines_string()
-            for line in old_lines:
-                yield f"- {line}"
-            sub_editor = Editor(sub_context, [Operation(
-                op.opcode, 
-                op.start - sub_context.start, 
-                op.end - sub_context.end, 
-                op.value
-            ) for op in block_ops])
-            new_lines = BytesIO()
-            sub_editor(new_lines)
-            new_lines.seek(0)
-            for line in TextIOWrapper(new_lines, encoding=self.context.encoding):
-                yield f"+ {line}"
+        context = self.context
+        file_map = context.file_map
+        base = context.start # Cursors in the file map are relative to the whole file
+        separator = context.line_separator
+        line_start = lambda cursor: file_map.line_to_cursor(file_map.cursor_to_line(cursor + base)) - base
+        first = region_start = cursor = None
+        pieces = []
+        tail = b'' # The end of the new text, to tell whether it ends a line
+        for operation in self.operations:
+            value = b'' if operation.opcode == Opcode.delete else operation.value.encode(context.encoding)
+            if value == context.bytes(operation.start, operation.end):
+                continue # Changes nothing (such as an empty insertion, or deleting an empty match)
+            start = line_start(operation.start)
+            if first is not None and (start < cursor or (start == cursor and tail not in (b'', separator))):
+                # Shares a line with the previous change
+                gap = context.bytes(cursor, operation.start)
+            else:
+                if first is not None:
+                    yield self._finish_change(first, region_start, cursor, pieces, tail, separator)
+                first = file_map.cursor_to_line(operation.start + base)
+                region_start = start
+                pieces = []
+                tail = b''
+                gap = context.bytes(start, operation.start)
+            for piece in (gap, value):
+                if piece:
+                    pieces.append(piece)
+                    tail = (tail + piece)[-len(separator):]
+            cursor = operation.end
+        if first is not None:
+            yield self._finish_change(first, region_start, cursor, pieces, tail, separator)
 
+    def _finish_change(self, first:int, region_start:int, cursor:int, pieces:list, tail:bytes, separator:bytes)->Tuple[int,int,int,int,bytes]:
+        context = self.context
+        file_map = context.file_map
+        base = context.start
+        line = file_map.cursor_to_line(cursor + base)
+        line_start, line_end = file_map.line_to_start_end_cursor(line)
+        if cursor + base != line_start or tail not in (b'', separator):
+            # The new text leaves a partial line, so the rest of the old line is part of the change
+            pieces.append(context.bytes(cursor, line_end - base))
+            cursor = line_end - base
+            if line_end > line_start:
+                line += 1
+        return first, line, region_start, cursor, b''.join(pieces)
 
+    def _line_count(self)->int:
+        file_map = self.context.file_map
+        end = self.context.end
+        line = file_map.cursor_to_line(end)
+        # A separator at the very end doesn't start another line
+        return line - 1 if file_map.line_to_cursor(line) == end else line
 
+    def _lines(self, prefix:bytes, first:int, end:int)->Iterator[bytes]:
+        """
+        Yield the unchanged lines from `first` up to (but not including) `end`, prefixed for a diff
+        """
+        if first >= end:
+            return
+        file_map = self.context.file_map
+        base = self.context.start
+        start = file_map.line_to_cursor(first) - base
+        stop = file_map.line_to_start_end_cursor(end - 1)[1] - base
+        yield from _prefixed(prefix, self.context.bytes(start, stop), self.context.line_separator)
 
 
 class EditorError(Exception):
     pass
 
+
+def _prefixed(prefix:bytes, text:bytes, separator:bytes)->list:
+    """
+    Split text into lines (keeping their separators) for a diff, each with the given prefix
+    """
+    if not text:
+        return []
+    lines = [prefix + line + separator for line in text.split(separator)]
+    if text.endswith(separator):
+        lines.pop()
+    else:
+        lines[-1] = lines[-1][:-len(separator)] + _NO_NEWLINE
+    return lines
+
+_NO_NEWLINE = b'\n\\ No newline at end of file\n'
+
+def _add_changes(lines:list, removed:list, added:list):
+    """
+    Add the lines of adjacent changes to a hunk (emptying the lists), as unchanged lines if together they change nothing
+    """
+    if [line[1:] for line in removed] == [line[1:] for line in added]:
+        lines.extend(b' ' + line[1:] for line in removed)
+    else:
+        lines.extend(removed)
+        lines.extend(added)
+    removed.clear()
+    added.clear()
+
+def _hunk_range(first:int, count:int)->str:
+    if count == 1:
+        return str(first)
+    if count == 0:
+        # An empty range is given as the line before it
+        return f"{first - 1},0"
+    return f"{first},{count}"
+
+
+def _fileno(output)->Optional[int]:
+    try:
+        return output.fileno()
+    except (AttributeError, UnsupportedOperation):
+        return None
+
+def _write_all(fd:int, data):
+    with memoryview(data) as view:
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+def _copy_file_range(source:int, output:int, offset:int, count:int)->int:
+    return os.copy_file_range(source, output, count, offset)
+
+def _sendfile(source:int, output:int, offset:int, count:int)->int:
+    return os.sendfile(output, source, offset, count)
+
+# The ways of copying between files in the kernel, in order of preference
+_KERNEL_COPIES = [copy for copy, name in ((_copy_file_range, 'copy_file_range'), (_sendfile, 'sendfile')) if hasattr(os, name)]
+
+def _copy_range(source:int, output:int, offset:int, count:int)->int:
+    """
+    Copy bytes from one file (at the given offset) to another (at its current position) in the
+    kernel, returning the number copied; fewer (possibly none) if the kernel can't copy between them
+    """
+    copied = 0
+    for copy in _KERNEL_COPIES:
+        while copied < count:
+            try:
+                done = copy(source, output, offset + copied, count - copied)
+            except OSError:
+                break # Not supported for these files; try the next way
+            if done == 0:
+                break
+            copied += done
+    return copied
+
 class EditorStream(RawIOBase):
+    """
+    A seekable, read-only file-like object over the result of an editor operation, read from the
+    editor's piece table
+    """
     def __init__(self, editor:Editor):
-        self._buffer = None
         self.editor = editor
-        self._iter = iter(editor)
+        self._table = editor.piece_table
+        self._position = 0
 
     def readable(self):
         return True
     
     def seekable(self) -> bool:
-        return False
+        return True
     
     def writable(self) -> bool:
         return False
+
+    def __len__(self):
+        return len(self._table)
     
     def readinto(self, byte_buffer):
-        max_len = len(byte_buffer)
-        try:
-            chunk = self._buffer or next(self._iter)
-            output, self._buffer = chunk[:max_len], chunk[max_len:]
-            actual_len = len(output)
-            byte_buffer[:actual_len] = output
-            return actual_len
-        except StopIteration:
-            return 0
\ No newline at end of file
+        count = self._table.readinto(self._position, byte_buffer)
+        self._position += count
+        return count
+
+    def seek(self, offset:int, whence:int=SEEK_SET)->int:
+        if whence == SEEK_CUR:
+            offset += self._position
+        elif whence == SEEK_END:
+            offset += len(self._table)
+        elif whence != SEEK_SET:
+            raise ValueError(f"Invalid whence: {whence}")
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def tell(self)->int:
+        return self._position
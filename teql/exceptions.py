@@ -1,3 +1,6 @@
 class TEQLException(Exception):
     pass
 
+
+class QueryCancelled(TEQLException):
+    pass
@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field, fields
+from time import perf_counter
+from . import ast
+from typing import Dict, Iterator, List, Optional
+
+__all__ = ('NodeStats', 'profile_plan', 'format_plan')
+
+@dataclass
+class NodeStats:
+    """
+    Runtime statistics for a single node of a compiled plan, as collected by EXPLAIN ANALYZE
+    """
+    loops:int = 0 # Number of times the node was run
+    produced:int = 0 # Number of contexts yielded
+    bytes_scanned:int = 0 # Total length of the contexts the node was run against
+    files:int = 0 # Number of distinct files the node was run against
+    seconds:float = 0.0 # Wall time, including time spent in child nodes
+    _last_data:object = field(default=None, repr=False, compare=False)
+
+    def __str__(self):
+        return f"(time={self.seconds*1000:.3f}ms produced={self.produced} bytes={self.bytes_scanned} files={self.files} loops={self.loops})"
+
+
+def profile_plan(plan, stats:NodeStats):
+    """
+    Wrap a compiled plan so that running it records statistics
+    """
+    def profiled(context):
+        stats.loops += 1
+        stats.bytes_scanned += len(context)
+        if context.data is not stats._last_data:
+            stats.files += 1
+            stats._last_data = context.data
+        iterator = iter(plan(context))
+        while True:
+            started = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stats.seconds += perf_counter() - started
+                return
+            stats.seconds += perf_counter() - started
+            stats.produced += 1
+            yield item
+    return profiled
+
+
+def format_plan(selector:ast._CursorOrSelection, profile:Optional[Dict[int,NodeStats]]=None)->List[str]:
+    """
+    Describe a selector tree as indented lines of text; if a profile from EXPLAIN ANALYZE is given,
+    the statistics for each node are included.
+    """
+    return list(_format_node(selector, profile, 0))
+
+def _format_node(node, profile, depth)->Iterator[str]:
+    line = '  ' * depth + _describe(node)
+    if profile is not None and id(node) in profile:
+        line += ' ' + str(profile[id(node)])
+    yield line
+    for node_field in fields(node):
+        value = getattr(node, node_field.name)
+        if isinstance(value, ast._CursorOrSelection):
+            yield from _format_node(value, profile, depth + 1)
+
+def _describe(node)->str:
+    parts = [type(node).__name__]
+    for node_field in fields(node):
+        value = getattr(node, node_field.name)
+        if isinstance(value, ast._CursorOrSelection) or value is None:
+            continue
+        if isinstance(node, ast.FindAnySelection):
+            parts.append(f"keys={len(value)}")
+        elif node_field.name.startswith('is_'):
+            if value:
+                parts.append(node_field.name[3:].upper())
+        else:
+            parts.append(f"{node_field.name}={_describe_value(value)}")
+    return ' '.join(parts)
+
+def _describe_value(value)->str:
+    if isinstance(value, list):
+        return ','.join(map(_describe_value, value))
+    if isinstance(value, ast.LiteralRegex):
+        return f"/{value.pattern}/{value.flags or ''}"
+    if isinstance(value, ast.Variable):
+        return '$' + '.'.join(map(str, value.identifiers))
+    if isinstance(value, (ast.RangeIndexFirst, ast.RangeIndexLast, ast.RangeIndexNext)):
+        keyword = type(value).__name__[len('RangeIndex'):].upper()
+        return keyword if value.n is None else f"{keyword} {value.n}"
+    if isinstance(value, ast.RangeIndexIndex):
+        return str(value.index)
+    if isinstance(value, ast.RangeIndexRange):
+        return f"{value.start}:{value.end}" + ('' if value.step == 1 else f":{value.step}")
+    return repr(value)
@@ -1,5 +1,12 @@
+from array import array
 from bisect import bisect
-from typing import Tuple,Iterable
+from collections.abc import Sequence
+from itertools import accumulate, islice
+from .operation import Opcode, Operation
+from typing import List, Tuple, Iterable
+
+SCAN_CHUNK = 1 << 20 # Number of bytes to scan for line breaks at a time
+MAX_PIECES = 4096 # Number of pieces an edited map may be split into before it is no longer updated incrementally
 
 class FileMap:
     """
@@ -12,8 +19,11 @@ class FileMap:
         """
         Initialize the map from a list of linebreak cursor positions. This will be a list of cursor
         positions immediately after each linebreak character
+
+        The positions are stored in a compact array of 64-bit integers (8 bytes per line). A memoryview
+        of 64-bit integers (such as an index mapped from the cache) is used as it is.
         """
-        self.linebreaks = tuple(linebreaks)
+        self.linebreaks = linebreaks if isinstance(linebreaks, (array, memoryview)) else array('q', linebreaks)
         self.filesize = filesize
         self.eol_size = 1 # TODO calculate or pass as parameter?
     
@@ -27,6 +37,36 @@ class FileMap:
                 breaks.append(cursor)
         return cls(breaks, cursor)
 
+    @classmethod
+    def from_data(cls, data, line_separator:bytes):
+        """
+        Build the map by searching a bytes-like object (anything supporting the buffer protocol) for 
+        line separators.
+
+        The data is scanned in large chunks, with NumPy if it is installed (and otherwise by splitting
+        each chunk in C), so no Python code runs per line.
+        """
+        breaks = array('q')
+        size = len(data)
+        step = len(line_separator)
+        numpy = _numpy() if size and not _overlaps_itself(line_separator) else None
+        if numpy is not None:
+            buffer = numpy.frombuffer(data, numpy.uint8)
+        chunk_size = max(SCAN_CHUNK, step) # Each chunk must be able to hold a whole separator
+        pos = 0
+        while pos < size:
+            end = min(pos + chunk_size, size)
+            if numpy is not None:
+                found = _find_breaks_numpy(numpy, buffer[pos:end], pos, line_separator)
+            else:
+                found = _find_breaks(bytes(data[pos:end]), pos, line_separator)
+            breaks.extend(found)
+            if end == size:
+                break
+            # A separator may straddle the end of the chunk, so overlap the next one by all but a byte of it
+            pos = max(end - (step - 1), breaks[-1] if breaks else 0)
+        return cls(breaks, size)
+
     def cursor_to_line(self, cursor:int)->int:
         """
         Given a cursor somewhere in the file, return the line number that cursor appears on.
@@ -106,4 +146,177 @@ class FileMap:
         start, end = self.line_to_start_end_cursor(lineno)
         # -1 because we index columns at 1 instead of 0
         return min(start + colno - 1, end)
-    
\ No newline at end of file
+
+    def apply(self, operations:Iterable[Operation], line_separator:bytes, encoding:str, data=None)->'FileMap':
+        """
+        Get the map of the file as it will be after the given (sorted, non-overlapping) operations, 
+        without scanning the whole file again.
+
+        The new map is made of pieces of this one, shifted to their new positions, and of the inserted
+        text, so only the inserted text is scanned for line breaks, and looking up a line or cursor
+        costs an extra binary search over the pieces. `data` is the text of the file before the edit;
+        it is only needed for line separators longer than a byte, which an edit could split or join.
+
+        Raises ValueError if the map can't be updated incrementally (it should be built again instead).
+        """
+        step = len(line_separator)
+        size = self.filesize
+        edits = [
+            (op.start, op.end, b'' if op.opcode == Opcode.delete else op.value.encode(encoding))
+            for op in operations
+        ]
+        if step > 1:
+            if data is None:
+                raise ValueError('The text of the file is needed to update the map for a multi-byte line separator')
+            if _overlaps_itself(line_separator):
+                raise ValueError(f"Can't update the map incrementally for the line separator {line_separator!r}")
+            edits = _widen_edits(edits, data, line_separator, size)
+        pieces = self._pieces()
+        starts = list(accumulate((end - start for source, start, end, first, count in pieces), initial=0))
+        edited = []
+        pos = 0
+        for start, end, value in edits:
+            _take_pieces(pieces, starts, pos, start, edited)
+            if value:
+                breaks = FileMap.from_data(value, line_separator).linebreaks
+                edited.append((breaks, 0, len(value), 0, len(breaks)))
+            size += len(value) - (end - start)
+            pos = end
+        _take_pieces(pieces, starts, pos, self.filesize, edited)
+        if len(edited) > MAX_PIECES:
+            raise ValueError('The map has been edited in too many places to update it incrementally')
+        if len(edited) == 1 and edited[0][1] == 0 and edited[0][3] == 0 and edited[0][4] == len(edited[0][0]):
+            # A single piece covering all of its source is just the source
+            return FileMap(edited[0][0], size)
+        return FileMap(_PieceBreaks(edited), size)
+
+    def _pieces(self)->List['_Piece']:
+        if isinstance(self.linebreaks, _PieceBreaks):
+            return self.linebreaks.pieces
+        return [(self.linebreaks, 0, self.filesize, 0, len(self.linebreaks))]
+
+
+# A piece of an edited file: the line breaks (as a sorted sequence of positions) of the text the piece
+# was taken from, the start and end of the piece within that text, and the index of the first of 
+# those line breaks within the piece along with the number of them. A line break at a position p is
+# within the piece if start < p <= end.
+_Piece = Tuple[Sequence, int, int, int, int]
+
+class _PieceBreaks(Sequence):
+    """
+    The line breaks of an edited file, made up of the line breaks of each of its pieces
+    """
+    def __init__(self, pieces:List[_Piece]):
+        self.pieces = pieces
+        # The position of each piece in the file, and the number of line breaks before it
+        self.offsets = array('q', accumulate((end - start for source, start, end, first, count in pieces), initial=0))
+        self.counts = array('q', accumulate((count for source, start, end, first, count in pieces), initial=0))
+
+    def __len__(self):
+        return self.counts[-1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        index = range(len(self))[index]
+        # The last piece with no more than `index` line breaks before it is the one with the line break
+        i = bisect(self.counts, index) - 1
+        source, start, end, first, count = self.pieces[i]
+        return source[first + index - self.counts[i]] - start + self.offsets[i]
+
+
+def _take_pieces(pieces:List[_Piece], starts:List[int], start:int, end:int, into:List[_Piece]):
+    """
+    Add the parts of the pieces between two positions in the file they make up
+    """
+    if start >= end:
+        return
+    i = bisect(starts, start) - 1
+    while i < len(pieces) and starts[i] < end:
+        source, piece_start, piece_end, first, count = pieces[i]
+        lo = piece_start + max(start - starts[i], 0)
+        hi = piece_start + min(end - starts[i], piece_end - piece_start)
+        if lo != piece_start or hi != piece_end:
+            first = bisect(source, lo)
+            count = bisect(source, hi) - first
+        if hi > lo:
+            into.append((source, lo, hi, first, count))
+        i += 1
+
+def _widen_edits(edits:List[Tuple[int,int,bytes]], data, line_separator:bytes, size:int)->List[Tuple[int,int,bytes]]:
+    """
+    Widen each edit to take in the bytes around it, far enough that no line separator crosses the 
+    edges of the edit either before or after it is made; so the separators an edit splits or joins
+    are found when its replacement text is scanned. Edits that would come close enough to touch once
+    widened are merged first.
+    """
+    step = len(line_separator)
+    merged = []
+    for start, end, value in edits:
+        if merged and start - merged[-1][1] < 4 * step:
+            prev_start, prev_end, prev_value = merged[-1]
+            merged[-1] = (prev_start, end, prev_value + bytes(data[prev_end:start]) + value)
+        else:
+            merged.append((start, end, value))
+    widened = []
+    for start, end, value in merged:
+        new_start = _separator_boundary(data, max(start - (step - 1), 0), line_separator, size, -1)
+        new_end = _separator_boundary(data, min(end + (step - 1), size), line_separator, size, 1)
+        widened.append((new_start, new_end, bytes(data[new_start:start]) + value + bytes(data[end:new_end])))
+    return widened
+
+def _separator_boundary(data, pos:int, line_separator:bytes, size:int, direction:int)->int:
+    """
+    Move a position backward or forward (by the given direction) to the edge of any line separator it is inside
+    """
+    step = len(line_separator)
+    window_start = max(pos - (step - 1), 0)
+    found = bytes(data[window_start:min(pos + step - 1, size)]).find(line_separator)
+    if found == -1:
+        return pos
+    found += window_start
+    if not found < pos < found + step:
+        return pos
+    return found if direction < 0 else found + step
+
+
+def _find_breaks(chunk:bytes, offset:int, line_separator:bytes)->Iterable[int]:
+    """
+    Find the positions after each separator in a chunk, by splitting it into lines and summing their lengths
+    """
+    lines = chunk.split(line_separator)
+    lines.pop() # Whatever follows the last separator
+    lengths = map(len(line_separator).__add__, map(len, lines))
+    return islice(accumulate(lengths, initial=offset), 1, None)
+
+def _find_breaks_numpy(numpy, chunk, offset:int, line_separator:bytes):
+    """
+    Find the positions after each separator in a chunk (a NumPy array of bytes), by comparing every byte at once
+    """
+    step = len(line_separator)
+    ends = numpy.flatnonzero(chunk == line_separator[-1])
+    if step > 1:
+        ends = ends[ends >= step - 1]
+        for i in range(1, step):
+            ends = ends[chunk[ends - i] == line_separator[-1 - i]]
+    return array('q', (ends + (offset + 1)).astype(numpy.int64).tobytes())
+
+def _overlaps_itself(value:bytes)->bool:
+    """
+    Whether two occurrences of the value can overlap (i.e. it starts with one of its own suffixes)
+    """
+    return any(value.startswith(value[i:]) for i in range(1, len(value)))
+
+_numpy_module = None
+def _numpy():
+    """
+    Get the NumPy module if it is installed (imported on first use, as it is slow to import)
+    """
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ImportError:
+            _numpy_module = False
+    return _numpy_module or None
@@ -0,0 +1,154 @@
+import os, sys, threading
+from array import array
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+from .file_map import FileMap
+from typing import Callable, Optional
+__all__ = ('LineIndexCache', 'default_cache_directory')
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # Total size of all cached indexes, in bytes
+DEFAULT_MIN_FILE_SIZE = 1024 * 1024 # Smaller files are quick enough to scan that they aren't worth caching
+SUFFIX = '.idx'
+
+def default_cache_directory()->str:
+    """
+    The directory given by the TEQL_INDEX_CACHE environment variable, or else `teql/line-index` in the
+    user's cache directory
+    """
+    directory = os.environ.get('TEQL_INDEX_CACHE')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'teql', 'line-index')
+
+class LineIndexCache:
+    """
+    An on-disk cache of the line indexes (FileMaps) of large files, so that later runs querying the
+    same file don't have to scan it for line breaks again.
+
+    Each index is stored in its own file, as the raw little-endian 64-bit line break positions, and is
+    memory-mapped when loaded rather than read. Entries are keyed by the file's real path and the line
+    separator, and record the file's device, inode, size and modification time; if any of those have
+    changed, the entry is stale and is replaced.
+
+    The total size of the cache is capped at `max_size` bytes; when it grows beyond that, the least
+    recently used indexes are deleted. Files smaller than `min_file_size` are never cached.
+    """
+    def __init__(self, directory:str=None, *, max_size:int=DEFAULT_MAX_SIZE, min_file_size:int=DEFAULT_MIN_FILE_SIZE):
+        self.directory = directory or default_cache_directory()
+        self.max_size = max_size
+        self.min_file_size = min_file_size
+
+    def get(self, path:str, stat:os.stat_result, line_separator:bytes, build:Callable[[], FileMap])->FileMap:
+        """
+        Get the line index of a file (whose current stat is given) from the cache, or else build it and
+        store it in the cache. Errors reading or writing the cache are ignored; the cache is only ever
+        an optimization.
+        """
+        if stat.st_size < self.min_file_size:
+            return build()
+        try:
+            file_map = self.load(path, stat, line_separator)
+        except OSError:
+            file_map = None
+        if file_map is None:
+            file_map = build()
+            try:
+                self.store(path, stat, line_separator, file_map)
+            except OSError:
+                pass
+        return file_map
+
+    def load(self, path:str, stat:os.stat_result, line_separator:bytes)->Optional[FileMap]:
+        """
+        Load the cached line index of a file, or return None if there isn't an up to date one
+        """
+        entry = os.path.join(self.directory, self._entry_name(path, stat, line_separator))
+        try:
+            with open(entry, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size % 8:
+                    return None # Truncated; it will be overwritten
+                if size == 0:
+                    linebreaks = array('q')
+                else:
+                    data = mmap(file.fileno(), 0, access=ACCESS_READ)
+                    if sys.byteorder == 'little':
+                        # The mapping stays open for as long as the view is in use
+                        linebreaks = memoryview(data).cast('q')
+                    else:
+                        linebreaks = array('q')
+                        linebreaks.frombytes(data)
+                        linebreaks.byteswap()
+                        data.close()
+        except FileNotFoundError:
+            return None
+        os.utime(entry) # Mark it as recently used
+        return FileMap(linebreaks, stat.st_size)
+
+    def store(self, path:str, stat:os.stat_result, line_separator:bytes, file_map:FileMap):
+        """
+        Save the line index of a file, replacing any stale index of the same file, then evict the least
+        recently used indexes if the cache is over its size limit
+        """
+        linebreaks = file_map.linebreaks
+        if len(linebreaks) * 8 > self.max_size:
+            return
+        if not isinstance(linebreaks, array) or sys.byteorder != 'little':
+            linebreaks = array('q', linebreaks)
+            if sys.byteorder != 'little':
+                linebreaks.byteswap()
+        os.makedirs(self.directory, exist_ok=True)
+        name = self._entry_name(path, stat, line_separator)
+        temp = os.path.join(self.directory, f".{name}.{os.getpid()}.{threading.get_ident()}")
+        with open(temp, 'wb') as file:
+            linebreaks.tofile(file)
+        os.replace(temp, os.path.join(self.directory, name))
+        prefix = name.partition('-')[0]
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix) and entry.name != name:
+                _remove(entry.path)
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used indexes until the cache is within its size limit
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Delete every cached index
+        """
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.endswith(SUFFIX):
+                _remove(entry.path)
+
+    def _entry_name(self, path:str, stat:os.stat_result, line_separator:bytes)->str:
+        # Named for the file (so a stale index of it can be found and replaced) and its current state
+        key = blake2b(os.path.realpath(path).encode(sys.getfilesystemencoding(), 'surrogateescape') + b'\0' + line_separator, digest_size=12)
+        state = blake2b(f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=8)
+        return f"{key.hexdigest()}-{state.hexdigest()}{SUFFIX}"
+
+
+def _remove(path:str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass # Already removed, perhaps by another process
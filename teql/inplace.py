@@ -0,0 +1,168 @@
+import os, struct
+from mmap import mmap, ACCESS_WRITE
+from .context import _file_state
+from .operation import Opcode
+from typing import List, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .editor import Editor
+__all__ = ('patch_in_place', 'recover_journal', 'journal_path')
+
+MAX_TAIL = 1024 * 1024 # Maximum number of bytes at the end of a file rewritten in place when an edit changes its size
+
+_MAGIC = b'TEQLJRN1'
+_HEADER = struct.Struct('<8sqq') # Magic, original size of the file, number of regions
+_REGION = struct.Struct('<qq') # Offset, length (followed by the region's original bytes)
+
+def journal_path(path:str)->str:
+    """
+    The path of the journal kept while a file is patched in place
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".teql.{name}.journal")
+
+def patch_in_place(path:str, editor:'Editor')->bool:
+    """
+    Apply an editor's operations directly to the file it was opened from, rather than writing a new
+    copy of the file. Returns False (having changed nothing) if the edits can't be made in place.
+
+    Edits which don't change the size of the text are written through a writable map of the file.
+    From the first edit which does change the size, the rest of the file is rewritten (and the file
+    truncated or extended), which is only done if that is within `MAX_TAIL` bytes of the end.
+
+    Before the file is changed, the original contents of every region to be written are saved to a
+    journal next to it, and the journal is deleted once the changes have been synced to disk. If the
+    process dies in between, `recover_journal` restores the original file from the journal.
+    """
+    context = editor.context
+    if context.parent is not None or context._source_file is None:
+        return False
+    planned = _plan(editor)
+    if planned is None:
+        return False
+    patches, tail_start, tail = planned
+    size = len(context)
+    with open(path, 'r+b') as file:
+        if _file_state(os.fstat(file.fileno())) != context._source_file[1]:
+            return False # Changed since it was mapped
+        if not patches and tail is None:
+            return True
+        undo = [(offset, context.bytes(offset, offset + len(value))) for offset, value in patches]
+        if tail is not None:
+            undo.append((tail_start, context.bytes(tail_start, size)))
+        _write_journal(path, size, undo)
+        if patches:
+            with mmap(file.fileno(), 0, access=ACCESS_WRITE) as mapped:
+                for offset, value in patches:
+                    mapped[offset:offset+len(value)] = value
+                mapped.flush()
+        if tail is not None:
+            file.seek(tail_start)
+            file.write(tail)
+            file.truncate()
+            file.flush()
+        os.fsync(file.fileno())
+    os.remove(journal_path(path))
+    if tail is not None:
+        context.data.close() # It may now extend past the end of the file
+    return True
+
+def recover_journal(path:str)->bool:
+    """
+    If patching a file in place was interrupted, restore the file's original contents from its
+    journal. Returns whether there was anything to restore.
+    """
+    journal = journal_path(path)
+    try:
+        with open(journal, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return False
+    regions = _read_journal(data)
+    if regions is not None:
+        size, regions = regions
+        with open(path, 'r+b') as file:
+            for offset, original in regions:
+                file.seek(offset)
+                file.write(original)
+            file.truncate(size)
+            file.flush()
+            os.fsync(file.fileno())
+    # A journal which can't be read was never completed, so the file was never changed
+    os.remove(journal)
+    return regions is not None
+
+
+def _plan(editor:'Editor')->Optional[Tuple[List[Tuple[int,bytes]], Optional[int], Optional[bytes]]]:
+    """
+    Work out the same-length patches to make to a file, and the offset and new contents of the tail
+    to rewrite from the first edit that changes the size (if any); or None if that is too much to rewrite
+    """
+    context = editor.context
+    patches = []
+    tail_start = None
+    for operation in editor.operations:
+        value = b'' if operation.opcode == Opcode.delete else operation.value.encode(context.encoding)
+        if len(value) != operation.end - operation.start:
+            tail_start = operation.start
+            break
+        if value and value != context.bytes(operation.start, operation.end):
+            patches.append((operation.start, value))
+    if tail_start is None:
+        return patches, None, None
+    if len(context) - tail_start > MAX_TAIL:
+        return None
+    # The edits before the tail don't change the size, so it starts at the same offset in the output
+    pieces = []
+    offset = 0
+    for start, end, value in editor._segments():
+        length = len(value) if value is not None else end - start
+        if offset + length > tail_start:
+            skip = max(0, tail_start - offset)
+            pieces.append(value[skip:] if value is not None else context.bytes(start + skip, end))
+        offset += length
+    return patches, tail_start, b''.join(pieces)
+
+def _write_journal(path:str, size:int, regions:List[Tuple[int,bytes]]):
+    journal = journal_path(path)
+    temp = journal + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, size, len(regions)))
+        for offset, original in regions:
+            file.write(_REGION.pack(offset, len(original)))
+            file.write(original)
+        file.flush()
+        os.fsync(file.fileno())
+    # Only a complete journal ever has its real name
+    os.replace(temp, journal)
+    _sync_directory(os.path.dirname(journal))
+
+def _read_journal(data:bytes)->Optional[Tuple[int, List[Tuple[int,bytes]]]]:
+    if len(data) < _HEADER.size:
+        return None
+    magic, size, count = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        return None
+    regions = []
+    position = _HEADER.size
+    for i in range(count):
+        if position + _REGION.size > len(data):
+            return None
+        offset, length = _REGION.unpack_from(data, position)
+        position += _REGION.size
+        if position + length > len(data):
+            return None
+        regions.append((offset, data[position:position+length]))
+        position += length
+    return size, regions
+
+def _sync_directory(directory:str):
+    try:
+        fd = os.open(directory or os.curdir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass # Not supported on all platforms
+    finally:
+        os.close(fd)
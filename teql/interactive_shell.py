@@ -1,14 +1,14 @@
 import atexit
 import os
-import readline
 from .teql import TEQL, UpdateResult, SelectResult, SetResult
 from .exceptions import *
 
 class InteractiveShell:
-    def __init__(self):
-        self.teql = TEQL()
+    def __init__(self, parser=None, index_cache=None, jobs=1, trigram_index=None):
+        self.teql = TEQL(parser=parser, index_cache=index_cache, jobs=jobs, trigram_index=trigram_index)
     
     def load_history(self, histfile=None):
+        import readline
         if histfile is None:
             histfile = os.path.join(os.path.expanduser("~"), ".teql_history")
         try:
@@ -20,44 +20,49 @@ class InteractiveShell:
         atexit.register(self.save_history, h_len, histfile)
 
     def save_history(self, prev_h_len, histfile):
+        import readline
         new_h_len = readline.get_current_history_length()
         readline.set_history_length(1000)
         readline.append_history_file(new_h_len - prev_h_len, histfile)
 
     def run(self):
+        import readline # deferred; importing it takes over the terminal's line editing
         self.load_history()
         readline.parse_and_bind('"\M-[A": previous-history')
         readline.parse_and_bind('"\M-[B": next-history')
         buff = []
         is_continued = False
-        while True:
-            try:
-                line = input('      ' if is_continued else 'teql> ')
-            except KeyboardInterrupt:
-                print()
-                break
-            except EOFError:
-                print()
-                break
-            buff.append(line)
-            is_continued = True
-            if line.strip().endswith(';') or line.strip() == '': # TODO make this smarter
-                # consider this the end of the query
-                query = '\n'.join(buff)
-                buff = []
-                is_continued = False
-                if query.strip():
-                    try:
-                        result = self.teql.execute(query)
-                        if isinstance(result, SelectResult):
-                            for store in result.fetch_all():
-                                print(store)
-                        elif isinstance(result, UpdateResult):
-                            print(result) # TODO
-                        elif isinstance(result, SetResult):
-                            print(result) # TODO
-                        else:
-                            print(result)
-                    except TEQLException as e:
-                        print(e)
-                        continue
\ No newline at end of file
+        try:
+            while True:
+                try:
+                    line = input('      ' if is_continued else 'teql> ')
+                except KeyboardInterrupt:
+                    print()
+                    break
+                except EOFError:
+                    print()
+                    break
+                buff.append(line)
+                is_continued = True
+                if line.strip().endswith(';') or line.strip() == '': # TODO make this smarter
+                    # consider this the end of the query
+                    query = '\n'.join(buff)
+                    buff = []
+                    is_continued = False
+                    if query.strip():
+                        try:
+                            result = self.teql.execute(query)
+                            if isinstance(result, SelectResult):
+                                for store in result.fetch_all():
+                                    print(store)
+                            elif isinstance(result, UpdateResult):
+                                print(result) # TODO
+                            elif isinstance(result, SetResult):
+                                print(result) # TODO
+                            else:
+                                print(result)
+                        except TEQLException as e:
+                            print(e)
+                            continue
+        finally:
+            self.teql.close() # Don't leave parallel workers running after the shell exits
@@ -0,0 +1,89 @@
+import re
+from typing import Iterable, Mapping
+
+__all__ = ('compile_keywords', 'load_mapping')
+
+_END = None # Marks a trie node at which a keyword ends
+MAX_NESTING = 200 # Deeper tries are written as a plain alternation, which the regex compiler can handle
+
+def compile_keywords(keywords:Iterable[bytes])->re.Pattern:
+    """
+    Compile a set of literal keywords into a single pattern that finds all of them in one pass.
+
+    The keywords are built into a trie, and the trie is written out as nested alternations, so the
+    regex engine acts as a keyword automaton: at each position it follows at most one branch per
+    byte rather than trying every keyword in turn. Where one keyword is a prefix of another, the
+    longer one is tried first, so matches are leftmost-longest and don't overlap.
+
+    If the trie would nest more than `MAX_NESTING` alternations deep (as with a long chain of keywords
+    which are each a prefix of the next), the keywords are instead tried one at a time, longest first.
+    """
+    keywords = set(keywords)
+    trie = {}
+    for keyword in keywords:
+        if not keyword:
+            raise ValueError('Keywords must not be empty')
+        node = trie
+        for byte in keyword:
+            node = node.setdefault(byte, {})
+        node[_END] = True
+    if not trie:
+        raise ValueError('No keywords given')
+    if _trie_depth(trie) > MAX_NESTING:
+        return re.compile(b'|'.join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True)))
+    return re.compile(_trie_pattern(trie))
+
+def _children(node:dict):
+    """
+    Yield the bytes leading to each child of a trie node, and the child, collapsing chains with a single branch
+    """
+    for byte in sorted(key for key in node if key is not _END):
+        child = node[byte]
+        prefix = bytearray([byte])
+        while len(child) == 1 and _END not in child:
+            (byte, child), = child.items()
+            prefix.append(byte)
+        yield bytes(prefix), child
+
+def _trie_depth(trie:dict)->int:
+    """
+    How deeply the alternations of a trie's pattern are nested (found without recursion, however deep it is)
+    """
+    deepest = 0
+    stack = [(trie, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for prefix, child in _children(node))
+    return deepest
+
+def _trie_pattern(node:dict)->bytes:
+    # Chains with a single branch are collapsed, so nesting only grows where the keywords diverge
+    branches = [re.escape(prefix) + _trie_pattern(child) for prefix, child in _children(node)]
+    if not branches:
+        return b''
+    if len(branches) == 1:
+        pattern = branches[0]
+    else:
+        pattern = b'(?:' + b'|'.join(branches) + b')'
+    if _END in node:
+        # The keyword could end here, but prefer a longer one (the quantifier is greedy)
+        pattern = b'(?:' + pattern + b')?'
+    return pattern
+
+
+def load_mapping(path:str, encoding:str=None)->Mapping[str,str]:
+    """
+    Read a mapping of old to new values from a file with one tab-separated pair per line
+    """
+    mapping = {}
+    with open(path, encoding=encoding) as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            old, tab, new = line.partition('\t')
+            if not tab:
+                raise ValueError(f"{path}, line {number}: expected a tab-separated pair")
+            mapping[old] = new
+    return mapping
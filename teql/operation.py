@@ -1,5 +1,7 @@
+from bisect import bisect
 from dataclasses import dataclass
 from enum import Enum
+from typing import Iterable
 
 
 class Opcode(str,Enum):
@@ -16,3 +18,31 @@ class Operation:
     start:int
     end:int
     value:str=None
+
+
+class CursorTranslator:
+    """
+    Translates cursor positions from before a series of (sorted, non-overlapping) operations are applied
+    to after, in O(log n) for n operations.
+
+    A cursor before or after an operation moves with the text around it. A cursor at the end of a 
+    changed span (including the position of an insertion), or within it, moves to the end of the new
+    text; a cursor at the start of a changed span stays at its start.
+    """
+    def __init__(self, operations:Iterable[Operation], encoding:str):
+        self.starts = []
+        self.ends = []
+        self.shifts = [0] # The total change in length from the operations before each one
+        for op in operations:
+            length = 0 if op.opcode == Opcode.delete else len(op.value.encode(encoding))
+            self.starts.append(op.start)
+            self.ends.append(op.end)
+            self.shifts.append(self.shifts[-1] + length - (op.end - op.start))
+
+    def __call__(self, cursor:int)->int:
+        # The operations that end at or before the cursor
+        i = bisect(self.ends, cursor)
+        if i < len(self.starts) and self.starts[i] < cursor:
+            # Within a changed span
+            return self.ends[i] + self.shifts[i + 1]
+        return cursor + self.shifts[i]
@@ -0,0 +1,139 @@
+from copy import copy
+from dataclasses import fields
+from . import ast
+from typing import Optional
+
+__all__ = ('optimize',)
+
+def optimize(selector:ast._CursorOrSelection)->ast._CursorOrSelection:
+    """
+    Rewrite a cursor or selection AST into a cheaper equivalent.
+
+    Children are optimized first, then the rules are applied to the node until none of them match.
+    The original tree is never modified.
+    """
+    node = _optimize_children(selector)
+    while True:
+        for rule in RULES:
+            rewritten = rule(node)
+            if rewritten is not None:
+                # The rewrite may have produced new children that can themselves be optimized
+                node = _optimize_children(rewritten)
+                break
+        else:
+            return node
+
+def _optimize_children(node):
+    if not isinstance(node, ast._CursorOrSelection):
+        return node
+    node = copy(node)
+    for field in fields(node):
+        value = getattr(node, field.name)
+        if isinstance(value, ast._CursorOrSelection):
+            setattr(node, field.name, optimize(value))
+    return node
+
+
+def _is_plain_find(node)->bool:
+    """
+    A FIND with no modifiers, for a literal string or regex
+    """
+    return (
+        isinstance(node, ast.FindSelection)
+        and isinstance(node.expression, (str, ast.LiteralRegex))
+        and not (node.is_next or node.is_matching or node.is_line or node.is_with)
+    )
+
+def _is_first_only(ranges)->bool:
+    return len(ranges) == 1 and (
+        (isinstance(ranges[0], ast.RangeIndexFirst) and ranges[0].n is None)
+        or (isinstance(ranges[0], ast.RangeIndexIndex) and ranges[0].index == 1)
+    )
+
+def _is_last_only(ranges)->bool:
+    return len(ranges) == 1 and (
+        (isinstance(ranges[0], ast.RangeIndexLast) and ranges[0].n is None)
+        or (isinstance(ranges[0], ast.RangeIndexIndex) and ranges[0].index == -1)
+    )
+
+def _find_first(node):
+    if _is_plain_find(node):
+        return ast.FindFirstSelection(node.expression)
+    return node
+
+def _find_last(node, n:int=None):
+    if _is_plain_find(node):
+        return ast.FindLastSelection(node.expression, n)
+    return node
+
+
+def _first_or_last_of_find(node)->Optional[ast._Selection]:
+    """
+    `FIRST OF FIND x` becomes a single forward search, and `LAST [n] OF FIND x` a backward search
+    """
+    if isinstance(node, ast.RangeIndexSelection) and _is_plain_find(node.other):
+        if _is_first_only(node.ranges):
+            return _find_first(node.other)
+        if _is_last_only(node.ranges):
+            return _find_last(node.other)
+        if len(node.ranges) == 1 and isinstance(node.ranges[0], ast.RangeIndexLast):
+            return _find_last(node.other, node.ranges[0].n)
+
+def _only_first_or_last_used(node)->Optional[ast._Selection]:
+    """
+    Selectors which only use the first (or last) match of another selector need only search for that match,
+    e.g. `EVERYTHING AFTER FIND x` becomes a backward search
+    """
+    if isinstance(node, ast.SelectionAfterSelection) and _is_plain_find(node.other):
+        return ast.SelectionAfterSelection(_find_last(node.other))
+    if isinstance(node, ast.SelectionBeforeSelection) and _is_plain_find(node.other):
+        return ast.SelectionBeforeSelection(_find_first(node.other))
+    if isinstance(node, (ast.BlockSelection, ast.BetweenSelection)) and (_is_plain_find(node.start) or _is_plain_find(node.end)):
+        node = copy(node)
+        node.start = _find_first(node.start)
+        node.end = _find_last(node.end)
+        return node
+
+def _find_in_lines(node)->Optional[ast._Selection]:
+    """
+    `FIND x IN LINES IN y` becomes a single scan of y's lines (and of the whole file for `LINES IN FILE`),
+    as long as x can't match across a line break
+    """
+    if (
+        isinstance(node, ast.SubSelection)
+        and isinstance(node.outer, ast.SelectionLineSelection)
+        and _is_plain_find(node.inner)
+        and isinstance(node.inner.expression, str)
+        and node.inner.expression
+        and "\n" not in node.inner.expression
+        and "\r" not in node.inner.expression
+    ):
+        return ast.SubSelection(node.inner, ast.CursorLineSelection(node.outer.other))
+
+def _ranges_of_lines_of_file(node)->Optional[ast._Selection]:
+    """
+    `FIRST n OF LINES IN FILE` (and other ranges) address the lines by number, rather than splitting the 
+    whole file into lines
+    """
+    if (
+        isinstance(node, ast.RangeIndexSelection)
+        and isinstance(node.other, ast.SelectionLineSelection)
+        and isinstance(node.other.other, ast.FileSelection)
+    ):
+        return ast.SubSelection(ast.DirectLineSelection(node.ranges), node.other.other)
+
+def _lines_of_file(node)->Optional[ast._Selection]:
+    """
+    The whole file is already made up of whole lines
+    """
+    if isinstance(node, ast.CursorLineSelection) and isinstance(node.other, ast.FileSelection):
+        return node.other
+
+
+RULES = [
+    _first_or_last_of_find,
+    _only_first_or_last_used,
+    _find_in_lines,
+    _ranges_of_lines_of_file,
+    _lines_of_file,
+]
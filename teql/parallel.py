@@ -0,0 +1,95 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from . import ast
+from typing import Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .teql import TEQL
+__all__ = ('ParallelRunner',)
+
+BATCHES_PER_JOB = 4 # Files are sent to the workers in batches; more batches balance the load better
+
+class ParallelRunner:
+    """
+    Runs a query against many files on a pool of worker processes.
+
+    The (already parsed and bound) query is sent to the workers along with the session's settings, and
+    each worker maps and evaluates its own files. Rather than the selected text, the workers send back
+    the offsets of each selection (and when updating, only that each file is done). These are
+    returned in the same order as the paths, whichever worker finishes first.
+    """
+    def __init__(self, jobs:int):
+        self.jobs = jobs
+        self._executor = None
+
+    def select(self, teql:'TEQL', selectors:Sequence[Optional[ast._Selection]], paths:Sequence[str])->Iterator[Tuple[str, List[Optional[array]]]]:
+        """
+        Evaluate selectors against each file, yielding the path and, for each selector, an array of the
+        start and end offsets of its selections (or None in place of a selector that is None)
+        """
+        return self._map(teql, _select_batch, selectors, paths)
+
+    def update(self, teql:'TEQL', query:ast._UpdateQuery, paths:Sequence[str])->Iterator[str]:
+        """
+        Apply an (already resolved) update query to each file, yielding each path once its file has been rewritten
+        """
+        return (path for path, _ in self._map(teql, _update_batch, query, paths))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _map(self, teql:'TEQL', function, payload, paths:Sequence[str]):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.jobs)
+        cache = teql.index_cache
+        index_cache = None if cache is None else (cache.directory, cache.max_size, cache.min_file_size)
+        settings = (teql.encoding, teql.line_separator, teql.session_variables, teql.write_mode, index_cache)
+        # The workers may not share the session's working directory
+        absolute = [os.path.abspath(path) for path in paths]
+        size = max(1, -(-len(paths) // (self.jobs * BATCHES_PER_JOB)))
+        batches = [absolute[i:i+size] for i in range(0, len(absolute), size)]
+        results = self._executor.map(function, repeat(settings), repeat(payload), batches)
+        return zip(paths, chain.from_iterable(results))
+
+
+_worker_teql = None
+def _worker(settings)->'TEQL':
+    """
+    Get this worker process's TEQL instance, with the settings of the session that sent the work
+    """
+    global _worker_teql
+    if _worker_teql is None:
+        from .teql import TEQL
+        _worker_teql = TEQL()
+    _worker_teql.encoding, _worker_teql.line_separator, _worker_teql.session_variables, _worker_teql.write_mode, index_cache = settings
+    cache = _worker_teql.index_cache
+    if index_cache is None:
+        _worker_teql.index_cache = None
+    elif cache is None or (cache.directory, cache.max_size, cache.min_file_size) != index_cache:
+        from .index_cache import LineIndexCache
+        directory, max_size, min_file_size = index_cache
+        _worker_teql.index_cache = LineIndexCache(directory, max_size=max_size, min_file_size=min_file_size)
+    return _worker_teql
+
+def _select_batch(settings, selectors, paths):
+    teql = _worker(settings)
+    plans = [None if selector is None else teql._compileSelection(selector) for selector in selectors]
+    results = []
+    for path in paths:
+        context = teql._openContext(path)
+        results.append([
+            None if plan is None else array('q', chain.from_iterable((selection.start, selection.end) for selection in plan(context)))
+            for plan in plans
+        ])
+    return results
+
+def _update_batch(settings, query, paths):
+    teql = _worker(settings)
+    plan = teql._compileSelection(teql._getUpdateQuerySelector(query))
+    for path in paths:
+        editor = teql._editContext(query, teql._openContext(path, True), plan)
+        teql._updateFile(path, editor)
+    return [None] * len(paths)
@@ -1,16 +1,155 @@
-import os, sys
-from lark import Lark
-from lark.exceptions import LarkError
-from .ast import transformer
+import os, re
+from functools import lru_cache
+from itertools import chain
 from .exceptions import TEQLException
-__all__ = ('parse',)
+from typing import Iterable, Iterator, Union
+__all__ = ('parse', 'get_parser', 'split_statements', 'PARSER_MODES')
 
-with open(os.path.join(os.path.dirname(__file__), 'grammar.lark'), 'r') as file:
-    parser = Lark(file.read())
+GRAMMAR_PATH = os.path.join(os.path.dirname(__file__), 'grammar.lark')
+PARSER_MODES = ('earley', 'lalr')
+DEFAULT_MODE = os.environ.get('TEQL_PARSER', 'earley')
 
-def parse(text):
+@lru_cache(maxsize=None)
+def get_parser(mode:str=None):
+    """
+    Get the Lark parser for the given mode, building it on first use rather than at import time.
+
+    The `lalr` parser is much faster to load and to run, and is serialized to Lark's on-disk cache
+    (keyed by a hash of the grammar and options, so editing grammar.lark invalidates it). The grammar
+    is unambiguous about how `IN`, `OF` and `OR` group, so both modes build the same tree.
+    """
+    from lark import Lark
+    mode = mode or DEFAULT_MODE
+    with open(GRAMMAR_PATH, 'r') as file:
+        grammar = file.read()
+    if mode == 'earley':
+        return Lark(grammar)
+    elif mode == 'lalr':
+        return Lark(grammar, parser='lalr', cache=True)
+    raise TEQLException(f"Unknown parser mode: {mode}")
+
+def parse(text, mode:str=None):
+    from lark.exceptions import LarkError
+    from .ast import transformer
     try:
-        tree = parser.parse(text)
+        tree = get_parser(mode or DEFAULT_MODE).parse(text)
     except LarkError as e:
         raise TEQLException(str(e))
-    return transformer.transform(tree)
\ No newline at end of file
+    return transformer.transform(tree)
+
+
+# Characters that may start something a top-level semicolon could be hidden inside
+_SPECIAL = re.compile(r"""[;"'#/\-A-Za-z_]""")
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_STRING = {
+    '"': re.compile(r'"(?:\\.|[^"\\\n])*"'),
+    "'": re.compile(r"'(?:\\.|[^'\\\n])*'"),
+}
+_REGEX = re.compile(r"/(?:\\.|[^/\\])+/")
+_PATH = re.compile(r"[^\s;]+")
+# Keywords which may be followed by a /regex/ rather than a path or comment
+_REGEX_KEYWORDS = {'FIND', 'WITH', 'LINE', 'LINES', 'NEXT', 'MATCHING'}
+
+def split_statements(script:Union[str,Iterable[str]])->Iterator[str]:
+    """
+    Split a script into its top-level statements, without parsing it.
+
+    The script may be a string or any iterable of strings (such as a text file), which is read 
+    incrementally; only the statement currently being scanned is held in memory. Semicolons inside
+    strings, regexes, paths and comments are ignored, and a BEGIN...COMMIT block is kept together as
+    a single statement. Statements that are empty or contain only comments are skipped.
+    """
+    if isinstance(script, str):
+        script = (script,)
+    buffer = ''
+    begin = 0 # Where the current statement starts in the buffer
+    pos = 0 # Where to resume scanning the buffer
+    has_content = False # Whether the current statement has anything other than whitespace and comments
+    first_word = last_word = None # First word of the current statement, and most recent word
+    segment_first_word = None # First word since the last semicolon (to find COMMIT)
+    for chunk in chain(script, (None,)):
+        at_eof = chunk is None
+        if not at_eof:
+            buffer += chunk
+        while True:
+            matched = _SPECIAL.search(buffer, pos)
+            end = len(buffer) if matched is None else matched.start()
+            if buffer[pos:end].strip():
+                has_content = True
+            if matched is None:
+                pos = len(buffer)
+                break
+            pos = matched.start()
+            char = buffer[pos]
+            if char in '-/' and pos + 1 == len(buffer) and not at_eof:
+                break # May be the start of a comment continued in the next chunk
+            if char == ';':
+                if first_word == 'BEGIN' and segment_first_word != 'COMMIT':
+                    # Semicolons separate the queries within a transaction
+                    pos += 1
+                    segment_first_word = None
+                    continue
+                if has_content:
+                    yield buffer[begin:pos]
+                pos += 1
+                begin = pos
+                if begin > len(buffer) // 2:
+                    # Drop the statements already split off, only once they are most of the buffer
+                    buffer = buffer[begin:]
+                    begin = pos = 0
+                has_content = False
+                first_word = last_word = segment_first_word = None
+                continue
+            if last_word == 'USE' and not char in '"\'#' and not buffer.startswith(('//', '/*', '--'), pos):
+                # Unquoted path
+                token = _PATH.match(buffer, pos)
+                if token.end() == len(buffer) and not at_eof:
+                    break # The path may continue in the next chunk
+                has_content = True
+                last_word = None
+                pos = token.end()
+                continue
+            if char == '#' or buffer.startswith(('//', '--'), pos):
+                # Line comment
+                newline = buffer.find('\n', pos)
+                if newline == -1:
+                    if at_eof:
+                        pos = len(buffer)
+                    break
+                pos = newline + 1
+                continue
+            if buffer.startswith('/*', pos):
+                # Block comment
+                close = buffer.find('*/', pos + 2)
+                if close == -1:
+                    if at_eof:
+                        pos = len(buffer)
+                    break
+                pos = close + 2
+                continue
+            if char in _STRING or (char == '/' and last_word in _REGEX_KEYWORDS):
+                token = (_STRING[char] if char in _STRING else _REGEX).match(buffer, pos)
+                if token is None and not at_eof and (char == '/' or buffer.find('\n', pos) == -1):
+                    break # Wait for the rest of the string or regex
+                has_content = True
+                last_word = None
+                pos = pos + 1 if token is None else token.end()
+                continue
+            if char.isalpha() or char == '_':
+                token = _WORD.match(buffer, pos)
+                if token.end() == len(buffer) and not at_eof:
+                    break # The word may continue in the next chunk
+                has_content = True
+                last_word = token.group().upper()
+                if first_word is None:
+                    first_word = last_word
+                if segment_first_word is None:
+                    segment_first_word = last_word
+                pos = token.end()
+                continue
+            # Anything else is just part of the statement
+            has_content = True
+            last_word = None
+            pos += 1
+        if at_eof and has_content:
+            yield buffer[begin:]
@@ -0,0 +1,107 @@
+from bisect import bisect_right
+from .context import _searchable
+from typing import List, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .editor import Editor
+__all__ = ('PieceTable',)
+
+class PieceTable:
+    """
+    The text of a context with an editor's operations applied, without applying them.
+
+    The edited text is described by a sorted list of pieces, each either a run of the context's
+    unchanged data or the encoded value of an operation, so any part of it can be read (in
+    O(log k) time for k operations) without copying the rest. Offsets can also be translated between
+    the edited text and the original.
+    """
+    def __init__(self, editor:'Editor'):
+        self.context = editor.context
+        self._starts:List[int] = [] # Offset of each piece in the edited text
+        self._pieces:List[Tuple[int,int,Optional[bytes]]] = [] # Original start and end of each piece, and its value if it was changed
+        self._original_starts:List[int] = []
+        length = 0
+        for start, end, value in editor._segments():
+            size = end - start if value is None else len(value)
+            if size:
+                self._starts.append(length)
+                self._pieces.append((start, end, value))
+                self._original_starts.append(start)
+                length += size
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return self.bytes(start, stop)[::step]
+            return self.bytes(start, stop)
+        index = range(self._length)[index]
+        return self.bytes(index, index + 1)[0]
+
+    def bytes(self, start:int=0, end:int=None)->bytes:
+        """
+        Get the edited text between two offsets
+        """
+        if end is None or end > self._length:
+            end = self._length
+        if start >= end:
+            return b''
+        output = bytearray(end - start)
+        self.readinto(start, output)
+        return bytes(output)
+
+    def readinto(self, offset:int, buffer)->int:
+        """
+        Copy the edited text from the offset into a writable buffer, returning the number of bytes copied
+        """
+        with memoryview(buffer) as view, view.cast('B') as output:
+            wanted = min(len(output), self._length - offset)
+            if wanted <= 0:
+                return 0
+            copied = 0
+            index = bisect_right(self._starts, offset) - 1
+            # The context's data is only viewed while copying, so it can still be closed afterwards
+            with memoryview(_searchable(self.context.data)) as data:
+                while copied < wanted:
+                    start, end, value = self._pieces[index]
+                    skip = offset + copied - self._starts[index]
+                    if value is None:
+                        start += self.context.start + skip
+                        count = min(end + self.context.start - start, wanted - copied)
+                        output[copied:copied+count] = data[start:start+count]
+                    else:
+                        count = min(len(value) - skip, wanted - copied)
+                        with memoryview(value) as source:
+                            output[copied:copied+count] = source[skip:skip+count]
+                    copied += count
+                    index += 1
+            return copied
+
+    def to_original(self, offset:int)->int:
+        """
+        Translate an offset in the edited text to the corresponding offset in the original. Offsets
+        within the text of an operation give the start of the text it replaced.
+        """
+        if offset >= self._length:
+            return len(self.context)
+        index = bisect_right(self._starts, offset) - 1
+        start, end, value = self._pieces[index]
+        if value is None:
+            return start + offset - self._starts[index]
+        return start
+
+    def from_original(self, offset:int)->int:
+        """
+        Translate an offset in the original text to the corresponding offset in the edited text. Offsets
+        within text which was replaced or deleted give the start of whatever replaced it.
+        """
+        index = bisect_right(self._original_starts, offset) - 1
+        if index < 0:
+            return 0
+        start, end, value = self._pieces[index]
+        if offset < end:
+            return self._starts[index] + (offset - start if value is None else 0)
+        return self._starts[index] + (end - start if value is None else len(value))
@@ -1,11 +1,14 @@
 from . import ast
-from typing import Sequence, Collection
+from collections import deque
+from itertools import islice
+from typing import Sequence, Collection, Optional
 
 def apply_ranges(ranges:Collection[ast._RangeIndex], select_from:Collection, adapt_index=False):
     prev = -1
-    if not isinstance(select_from, Sequence):
-        select_from = list(select_from)
     adapter = _1_to_0 if adapt_index else lambda i:i
+    if not isinstance(select_from, Sequence):
+        # Only pull as many items as the ranges can possibly need from the iterable
+        select_from = list(islice(select_from, _prefix_length(ranges, adapter)))
     for r in ranges:
         if isinstance(r, ast.RangeIndexFirst):
             if r.n is None:
@@ -34,13 +37,40 @@ def apply_ranges(ranges:Collection[ast._RangeIndex], select_from:Collection, ada
             start = adapter(r.start)
             end = adapter(r.end)
             # Note: index ranges are inclusive (e.g. contain the end value), differing from normal Python ranges
-            yield from select_from[start:end+1:r.step]
+            # (so a range ending at -1 runs to the end, rather than to 0)
+            yield from select_from[start:(end+1 or None):r.step]
             # Set prev to the end value of the selected range, or the end value of the full collection; whichever is first
             # TODO account for negative indices
             prev = min(r.end, len(select_from)) 
             if r.step != 1:
                 prev -= (prev - r.start) % r.step
 
+def _prefix_length(ranges:Collection[ast._RangeIndex], adapter)->Optional[int]:
+    """
+    Get an upper bound on the number of leading items the ranges will access, or None if they may 
+    access the end of the collection.
+    """
+    prev = -1
+    needed = 0
+    for r in ranges:
+        if isinstance(r, ast.RangeIndexFirst):
+            prev = 0 if r.n is None else r.n - 1
+        elif isinstance(r, ast.RangeIndexNext):
+            prev += 1 if r.n is None else r.n
+        elif isinstance(r, ast.RangeIndexIndex):
+            prev = adapter(r.index)
+            if prev < 0:
+                return None
+        elif isinstance(r, ast.RangeIndexRange):
+            if adapter(r.start) < 0 or adapter(r.end) < 0:
+                return None
+            # apply_ranges sets prev from the unadapted end, so use whichever is larger
+            prev = max(r.end, adapter(r.end))
+        else:
+            return None
+        needed = max(needed, prev + 1)
+    return needed
+
 def _1_to_0(index):
     if index > 0:
         return index - 1
@@ -51,13 +81,14 @@ def _1_to_0(index):
 
 def first(select_from:Collection):
     if not isinstance(select_from, Sequence):
-        select_from = list(select_from)
+        return next(iter(select_from), None)
     if select_from:
         return select_from[0]
     
 
 def last(select_from:Collection):
     if not isinstance(select_from, Sequence):
-        select_from = list(select_from)
+        # Keep only the most recent item rather than building a list of all of them
+        select_from = deque(select_from, maxlen=1)
     if select_from:
         return select_from[-1]
\ No newline at end of file
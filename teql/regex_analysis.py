@@ -0,0 +1,166 @@
+import re
+from typing import List
+try:
+    from re import _parser as sre_parse, _constants as sre_constants # Python 3.11+
+except ImportError:
+    import sre_parse, sre_constants
+
+__all__ = ('can_match_byte', 'is_line_local', 'required_literals')
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: re.compile(rb'\d'),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(rb'\D'),
+    sre_constants.CATEGORY_SPACE: re.compile(rb'\s'),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(rb'\S'),
+    sre_constants.CATEGORY_WORD: re.compile(rb'\w'),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(rb'\W'),
+}
+
+def can_match_byte(pattern:bytes, flags:int, byte:int)->bool:
+    """
+    Check whether a (bytes) regular expression could include the given byte in a match.
+
+    This is conservative: anything that isn't understood (such as backreferences) is assumed to be
+    able to match the byte. Lookarounds are ignored, as they don't add to the span of a match.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return True
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    return _subpattern_can_match(parsed, state.flags, byte)
+
+def is_line_local(pattern:bytes, flags:int, separator:bytes)->bool:
+    """
+    Check whether searching each line separately (up to, but not including, its line separator) finds
+    the same matches as searching the whole text.
+
+    This requires that the pattern can't match any byte of the line separator, doesn't use lookarounds
+    (which could look into the neighbouring lines), and only anchors to the start or end of a line 
+    rather than of the whole text.
+    """
+    if any(can_match_byte(pattern, flags, byte) for byte in separator):
+        return False
+    parsed = sre_parse.parse(pattern, flags)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    for op, av, item_flags in _walk(parsed, state.flags):
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            return False
+        if op is sre_constants.AT:
+            if av in (sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING):
+                return False
+            if av in (sre_constants.AT_BEGINNING, sre_constants.AT_END) and not item_flags & re.MULTILINE:
+                return False
+    return True
+
+def required_literals(pattern:bytes, flags:int)->List[bytes]:
+    """
+    Find strings which every match of a (bytes) regular expression must contain, so that text which
+    lacks any of them can be skipped without running the regex.
+
+    This is conservative: only runs of literal bytes outside of alternations, optional repeats and
+    lookarounds are found, and letters are only included when matched case sensitively.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return []
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    literals = []
+    _collect_literals(parsed, state.flags, literals)
+    return literals
+
+def _collect_literals(subpattern, flags, literals:List[bytes]):
+    run = bytearray()
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL and (not flags & re.IGNORECASE or bytes([av]).lower() == bytes([av]).upper()):
+            run.append(av)
+            continue
+        if run:
+            literals.append(bytes(run))
+            run = bytearray()
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, inner = av
+            _collect_literals(inner, (flags | add_flags) & ~del_flags, literals)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)):
+            low, high, inner = av
+            if low >= 1:
+                _collect_literals(inner, flags, literals)
+        elif op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+            _collect_literals(av, flags, literals)
+    if run:
+        literals.append(bytes(run))
+
+def _walk(subpattern, flags):
+    """
+    Yield every item of a parsed pattern (recursively), with the flags in effect for it
+    """
+    for op, av in subpattern:
+        yield op, av, flags
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, inner = av
+            yield from _walk(inner, (flags | add_flags) & ~del_flags)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                yield from _walk(branch, flags)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)):
+            yield from _walk(av[2], flags)
+        elif op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+            yield from _walk(av, flags)
+        elif op is sre_constants.GROUPREF_EXISTS:
+            yield from _walk(av[1], flags)
+            if av[2] is not None:
+                yield from _walk(av[2], flags)
+
+def _subpattern_can_match(subpattern, flags, byte)->bool:
+    return any(_item_can_match(op, av, flags, byte) for op, av in subpattern)
+
+def _item_can_match(op, av, flags, byte)->bool:
+    if op is sre_constants.LITERAL:
+        return _same_byte(av, byte, flags)
+    if op is sre_constants.NOT_LITERAL:
+        return not _same_byte(av, byte, flags)
+    if op is sre_constants.ANY:
+        return byte != ord("\n") or bool(flags & re.DOTALL)
+    if op is sre_constants.IN:
+        return _set_can_match(av, flags, byte)
+    if op is sre_constants.SUBPATTERN:
+        group, add_flags, del_flags, subpattern = av
+        return _subpattern_can_match(subpattern, (flags | add_flags) & ~del_flags, byte)
+    if op is sre_constants.BRANCH:
+        return any(_subpattern_can_match(branch, flags, byte) for branch in av[1])
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)):
+        low, high, subpattern = av
+        return high != 0 and _subpattern_can_match(subpattern, flags, byte)
+    if op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+        return _subpattern_can_match(av, flags, byte)
+    if op is sre_constants.GROUPREF_EXISTS:
+        group, yes, no = av
+        return _subpattern_can_match(yes, flags, byte) or (no is not None and _subpattern_can_match(no, flags, byte))
+    if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return False
+    return True
+
+def _set_can_match(items, flags, byte)->bool:
+    negate = False
+    found = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            found = found or _same_byte(av, byte, flags)
+        elif op is sre_constants.RANGE:
+            low, high = av
+            found = found or low <= byte <= high or (
+                bool(flags & re.IGNORECASE) and low <= ord(bytes([byte]).swapcase()) <= high
+            )
+        elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+            found = found or bool(_CATEGORIES[av].match(bytes([byte])))
+        else:
+            return True
+    return found != negate
+
+def _same_byte(value, byte, flags)->bool:
+    if value == byte:
+        return True
+    return bool(flags & re.IGNORECASE) and bytes([value]).lower() == bytes([byte]).lower()
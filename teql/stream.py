@@ -0,0 +1,330 @@
+import re
+from . import ast
+from .context import _interpret_flags
+from .exceptions import TEQLException
+from .range import _prefix_length, _1_to_0
+from .regex_analysis import is_line_local
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from .teql import TEQL
+
+__all__ = ('StreamCompiler', 'split_lines')
+
+READ_SIZE = 64 * 1024 # Number of bytes to read from the input at a time
+
+class Line:
+    """
+    A single line of a stream, including its line separator (except perhaps for the last line)
+    """
+    __slots__ = ('data', 'number', 'content_end')
+
+    def __init__(self, data:bytes, number:int, separator:bytes):
+        self.data = data
+        self.number = number
+        self.content_end = len(data) - len(separator) if data.endswith(separator) else len(data)
+
+# Finds the spans within a line that a selector selects. The start and end give the bounds of an
+# enclosing selection within the line, or are None at the top level, where the context is the whole stream.
+Matcher = Callable[[Line, Optional[int], Optional[int]], Iterable[Tuple[int,int]]]
+# Transforms a stream of lines into a stream of byte strings (which may contain any number of lines)
+Stage = Callable[[Iterator[Line]], Iterator[bytes]]
+
+class StreamCompiler:
+    """
+    Compiles queries to run in a single forward pass over a stream, like `sed`, rather than against
+    memory-mapped files.
+
+    Each query becomes a stage which reads the stream a line at a time, so memory use is bounded by
+    the length of the longest line. Only selectors that can be found within a single line, in order,
+    are supported: FIND (for strings and regexes that can't match across a line break), FIND LINES,
+    LINE <cursor>, forward line numbers and ranges, FIRST/NEXT/n OF, <x> IN <y> and cursors placed
+    before or after these; along with START and END. Anything else raises a TEQLException.
+    """
+    def __init__(self, teql:'TEQL'):
+        self.teql = teql
+
+    @property
+    def encoding(self)->str:
+        return self.teql.encoding
+
+    @property
+    def separator(self)->bytes:
+        separator = self.teql.line_separator
+        if isinstance(separator, str):
+            separator = separator.encode(self.encoding)
+        return separator
+
+    def compile(self, query:ast._Node)->Stage:
+        compiler = getattr(self, f"_compile{type(query).__name__}", None)
+        if compiler is None:
+            raise TEQLException(f"{type(query).__name__} can't be run on a stream")
+        return compiler(query)
+
+    def run(self, stages:Iterable[Stage], input:BinaryIO, output:BinaryIO):
+        """
+        Pass the input through each of the stages in turn, writing the result to the output
+        """
+        chunks = iter(lambda: input.read(READ_SIZE), b'')
+        for stage in stages:
+            chunks = stage(self._lines(chunks))
+        for chunk in chunks:
+            output.write(chunk)
+
+    def _lines(self, chunks:Iterable[bytes])->Iterator[Line]:
+        for number, line in enumerate(split_lines(chunks, self.separator), 1):
+            yield Line(line, number, self.separator)
+
+    def _compileShowQuery(self, query:ast.ShowQuery)->Stage:
+        if not isinstance(query.value.value, ast._Selection):
+            raise TEQLException(f"Can't SHOW {type(query.value.value).__name__} on a stream")
+        matcher = self.matcher(query.value.value)
+        separator = self.separator
+        def show(lines:Iterator[Line]):
+            for line in lines:
+                for start, end in matcher(line, None, None):
+                    selected = line.data[start:end]
+                    yield selected if selected.endswith(separator) else selected + separator
+        return show
+
+    def _compileChangeQuery(self, query:ast.ChangeQuery)->Stage:
+        selection = query.selection
+        if not isinstance(selection, ast._Selection):
+            selection = ast.FindSelection(selection)
+        replacement = self._replacement(query.replacement)
+        return self._edit_stage(self.matcher(selection), replacement)
+
+    def _compileDeleteQuery(self, query:ast.DeleteQuery)->Stage:
+        return self._edit_stage(self.matcher(query.selection), b'')
+
+    def _compileInsertQuery(self, query:ast.InsertQuery)->Stage:
+        value = self._replacement(query.string)
+        if isinstance(query.cursor, ast.EndCursor):
+            def insert_at_end(lines:Iterator[Line]):
+                for line in lines:
+                    yield line.data
+                yield value
+            return insert_at_end
+        return self._edit_stage(self.matcher(query.cursor), value)
+
+    def _compileSetQuery(self, query:ast.SetQuery)->Stage:
+        # Settings take effect as soon as the script is compiled; the stream passes through unchanged
+        self.teql._executeQuery(query)
+        def set_query(lines:Iterator[Line]):
+            for line in lines:
+                yield line.data
+        return set_query
+
+    def _edit_stage(self, matcher:Matcher, value:bytes)->Stage:
+        def edit(lines:Iterator[Line]):
+            for line in lines:
+                spans = sorted(matcher(line, None, None))
+                if not spans:
+                    yield line.data
+                    continue
+                data = line.data
+                cursor = 0
+                for start, end in spans:
+                    if start < cursor:
+                        raise TEQLException(f'Conflicting/overlapping operations on line {line.number}')
+                    yield data[cursor:start]
+                    yield value
+                    cursor = end
+                yield data[cursor:]
+        return edit
+
+    def _replacement(self, replacement)->bytes:
+        return self.teql._evaluateReplacement(None, replacement).encode(self.encoding)
+
+
+    def matcher(self, selector:ast._CursorOrSelection, nested:bool=False)->Matcher:
+        """
+        Compile a cursor or selection to find its spans within each line. Nested selectors are those
+        evaluated within another selection, rather than within the whole stream.
+        """
+        compiler = getattr(self, f"_match{type(selector).__name__}", None)
+        if compiler is None:
+            raise TEQLException(f"{type(selector).__name__} can't be evaluated on a stream")
+        return compiler(selector, nested)
+
+    def _matchStartCursor(self, selector:ast.StartCursor, nested:bool)->Matcher:
+        def start_cursor(line:Line, start, end):
+            if start is not None:
+                yield start, start
+            elif line.number == 1:
+                yield 0, 0
+        return start_cursor
+
+    def _matchEndCursor(self, selector:ast.EndCursor, nested:bool)->Matcher:
+        if not nested:
+            raise TEQLException("END can only be used on a stream to INSERT AT END")
+        def end_cursor(line:Line, start, end):
+            yield end, end
+        return end_cursor
+
+    def _matchSelectionAfterCursor(self, selector:ast.SelectionAfterCursor, nested:bool)->Matcher:
+        if selector.n:
+            raise TEQLException("Offset cursors can't be evaluated on a stream")
+        other = self.matcher(selector.other, nested)
+        def selection_after_cursor(line:Line, start, end):
+            for other_start, other_end in other(line, start, end):
+                yield other_end, other_end
+        return selection_after_cursor
+
+    def _matchSelectionBeforeCursor(self, selector:ast.SelectionBeforeCursor, nested:bool)->Matcher:
+        if selector.n:
+            raise TEQLException("Offset cursors can't be evaluated on a stream")
+        other = self.matcher(selector.other, nested)
+        def selection_before_cursor(line:Line, start, end):
+            for other_start, other_end in other(line, start, end):
+                yield other_start, other_start
+        return selection_before_cursor
+
+    def _matchSelectionCursor(self, selector:ast.SelectionCursor, nested:bool)->Matcher:
+        inner = self.matcher(selector.inner, True)
+        outer = self.matcher(selector.outer, nested)
+        def selection_cursor(line:Line, start, end):
+            for outer_start, outer_end in outer(line, start, end):
+                yield from inner(line, outer_start, outer_end)
+        return selection_cursor
+
+    def _matchSubSelection(self, selector:ast.SubSelection, nested:bool)->Matcher:
+        inner = self.matcher(selector.inner, True)
+        outer = self.matcher(selector.outer, nested)
+        def sub_selection(line:Line, start, end):
+            for outer_start, outer_end in outer(line, start, end):
+                yield from inner(line, outer_start, outer_end)
+        return sub_selection
+
+    def _matchRangeIndexCursor(self, selector:ast.RangeIndexCursor, nested:bool)->Matcher:
+        return self._range_index(selector, nested)
+
+    def _matchRangeIndexSelection(self, selector:ast.RangeIndexSelection, nested:bool)->Matcher:
+        return self._range_index(selector, nested)
+
+    def _range_index(self, selector, nested:bool)->Matcher:
+        # Matches are counted over the whole stream, so the counter can't restart for each enclosing selection
+        if nested:
+            raise TEQLException("Indexes can't be used within another selection on a stream")
+        selected = _forward_indexes(selector.ranges)
+        last = selected.last
+        other = self.matcher(selector.other, nested)
+        count = 0
+        def range_index(line:Line, start, end):
+            nonlocal count
+            if count >= last:
+                return
+            for span in other(line, start, end):
+                count += 1
+                if count in selected:
+                    yield span
+        return range_index
+
+    def _matchDirectLineSelection(self, selector:ast.DirectLineSelection, nested:bool)->Matcher:
+        if nested:
+            raise TEQLException("Line numbers can't be used within another selection on a stream")
+        selected = _forward_indexes(selector.ranges)
+        def direct_line_selection(line:Line, start, end):
+            if line.number in selected:
+                yield 0, len(line.data)
+        return direct_line_selection
+
+    def _matchCursorLineSelection(self, selector:ast.CursorLineSelection, nested:bool)->Matcher:
+        other = self.matcher(selector.other, nested)
+        def cursor_line_selection(line:Line, start, end):
+            for span in other(line, start, end):
+                yield 0, len(line.data)
+                break
+        return cursor_line_selection
+
+    def _matchFindSelection(self, selector:ast.FindSelection, nested:bool)->Matcher:
+        if selector.is_next or selector.is_matching:
+            raise TEQLException("FIND NEXT and FIND MATCHING can't be evaluated on a stream")
+        pattern = self._find_pattern(selector.expression)
+        is_line = selector.is_line
+        def find_selection(line:Line, start, end):
+            if start is None:
+                start, end = 0, line.content_end
+            else:
+                end = min(end, line.content_end)
+            for matched in pattern.finditer(line.data, start, end):
+                if is_line:
+                    yield 0, len(line.data)
+                    break
+                yield matched.span()
+        return find_selection
+
+    def _find_pattern(self, expression)->re.Pattern:
+        if isinstance(expression, ast.Variable):
+            expression = str(self.teql._resolveVariable(expression))
+        if isinstance(expression, str):
+            pattern = re.compile(re.escape(expression.encode(self.encoding)))
+        elif isinstance(expression, ast.LiteralRegex):
+            pattern = re.compile(expression.pattern.encode(self.encoding), _interpret_flags(expression.flags))
+        else:
+            raise TEQLException(f"Can't FIND {type(expression).__name__} on a stream")
+        if not is_line_local(pattern.pattern, pattern.flags, self.separator):
+            raise TEQLException(f"{expression} could match across lines, so can't be found on a stream")
+        return pattern
+
+
+def split_lines(chunks:Iterable[bytes], separator:bytes)->Iterator[bytes]:
+    """
+    Split a series of byte strings into lines, each including its line separator
+    """
+    pending = bytearray()
+    for chunk in chunks:
+        if not pending and chunk.endswith(separator) and chunk.find(separator) == len(chunk) - len(separator):
+            # Already a single line; the usual case between stages
+            yield chunk
+            continue
+        pending += chunk
+        start = 0
+        while True:
+            index = pending.find(separator, start)
+            if index == -1:
+                break
+            end = index + len(separator)
+            yield bytes(pending[start:end])
+            start = end
+        del pending[:start]
+    if pending:
+        yield bytes(pending)
+
+def _forward_indexes(ranges:List[ast._RangeIndex])->'_Indexes':
+    """
+    Get the (1-based) indexes selected by a list of ranges, as long as they can be found without 
+    knowing how many items there are in total. (Which indexes are selected follows `apply_ranges`.)
+    """
+    if _prefix_length(ranges, _1_to_0) is None:
+        raise TEQLException("Only forward ranges (not LAST or negative indexes) can be used on a stream")
+    selected = []
+    prev = -1 # The 0-based index of the last item selected, as in apply_ranges
+    for r in ranges:
+        if isinstance(r, ast.RangeIndexFirst):
+            n = 1 if r.n is None else r.n
+            selected.append(range(1, n + 1))
+            prev = n - 1
+        elif isinstance(r, ast.RangeIndexNext):
+            n = 1 if r.n is None else r.n
+            selected.append(range(prev + 2, prev + 2 + n))
+            prev += n
+        elif isinstance(r, ast.RangeIndexIndex):
+            selected.append(range(r.index, r.index + 1))
+            prev = r.index - 1
+        elif isinstance(r, ast.RangeIndexRange):
+            selected.append(range(r.start, r.end + 1, r.step))
+            prev = r.end
+            if r.step != 1:
+                prev -= (prev - r.start) % r.step
+    return _Indexes(selected)
+
+class _Indexes:
+    """
+    A set of indexes selected by ranges, checked against each range rather than stored
+    """
+    def __init__(self, ranges:List[range]):
+        self.ranges = ranges
+        self.last = max((r[-1] for r in ranges if r), default=0)
+
+    def __contains__(self, index:int)->bool:
+        return any(index in r for r in self.ranges)
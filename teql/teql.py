@@ -1,31 +1,175 @@
-import sys, os
-from glob import glob
-from dataclasses import dataclass
-from tempfile import NamedTemporaryFile
+import sys, os, re
+from codecs import getincrementaldecoder
+from copy import copy
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from teql.editor import Editor
 from .operation import Opcode, Operation
 from .exceptions import TEQLException
-from .parser import parse
+from .parser import parse, split_statements
 from . import ast
 from .context import Context
-from .range import apply_ranges, first, last
-from typing import List, Iterable, Optional
+from .context_pool import ContextPool, DEFAULT_MAX_OPEN
+from .cancellation import Cancellation, cancellable, check_cancelled
+from .compiler import SelectionCompiler, Plan
+from .optimizer import optimize
+from .explain import format_plan
+from .keywords import load_mapping
+from time import perf_counter
+from typing import AsyncIterator, BinaryIO, List, Iterable, Mapping, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from .index_cache import LineIndexCache
+    from .parallel import ParallelRunner
+    from .trigram_index import TrigramIndex
 
 class TEQL:
-    def __init__(self, *, encoding=None, line_separator=None):
+    def __init__(self, *, encoding=None, line_separator=None, parser=None, plan_cache_size=128, index_cache:'LineIndexCache'=None, context_pool_size=DEFAULT_MAX_OPEN, jobs=1, trigram_index:'TrigramIndex'=None):
+        """
+        If an index cache is given, the line indexes of large files are kept in it between runs.
+
+        Up to `context_pool_size` files are kept open between queries (see ContextPool).
+
+        With more than one job, queries against many files are run on a pool of that many worker
+        processes (see ParallelRunner); call `close` (or use the session as a context manager) to shut
+        them down.
+
+        If a trigram index is given, it is used to skip the files which can't contain the strings a
+        query finds, without opening them.
+        """
         self.encoding = encoding or sys.getdefaultencoding()
         self.line_separator = line_separator or os.linesep
+        self.parser = parser
         self.line_numbers = None
         self.use = None
         self.session_variables = VariableStore()
+        self._parseCached = lru_cache(maxsize=plan_cache_size)(_parse_plan)
+        self.index_cache = index_cache
+        self.context_pool = ContextPool(context_pool_size)
+        from .discovery import FileFinder # deferred; not needed to import the package
+        self.file_finder = FileFinder()
+        self.jobs = jobs
+        self._parallel = None
+        self.trigram_index = trigram_index
+        self.write_mode = 'replace'
+        self.diff_context = 3
     
-    def execute(self, code:str):
-        queries = parse(code)
-        if not queries:
-            raise TEQLException('No query to execute')
-        if len(queries) > 1:
-            raise TEQLException("Can't execute multiple queries with `execute`, use `execute_all` instead")
-        query = queries[0]
+    def execute(self, code:str, *args, **kwargs):
+        """
+        Execute a single query, binding any `$1`/`$name` placeholders to the given arguments
+        """
+        return self.prepare(code).execute(*args, **kwargs)
+
+    def execute_all(self, script:Union[str,Iterable[str]], *args, **kwargs):
+        """
+        Execute a script of one or more queries, binding any `$1`/`$name` placeholders to the given arguments.
+
+        The script may be a string or a text file (or other iterable of strings). It is split, parsed
+        and executed one statement at a time, so results are yielded while the rest of the script is 
+        still being read, and memory use does not grow with the size of the script. Note that this 
+        means a syntax error is only reported once the statements before it have been executed.
+        """
+        for query in self._bindScript(script, args, kwargs):
+            yield self._executeQuery(query)
+
+    def execute_async(self, code:str, *args, executor:'Executor'=None, concurrency:int=None, **kwargs)->AsyncIterator:
+        """
+        Like `execute`, but for asyncio: returns an async iterator yielding the query's result, with
+        the work run on an executor rather than blocking the event loop (see AsyncRunner)
+        """
+        return self.prepare(code).execute_async(*args, executor=executor, concurrency=concurrency, **kwargs)
+
+    def execute_all_async(self, script:Union[str,Iterable[str]], *args, executor:'Executor'=None, concurrency:int=None, **kwargs)->AsyncIterator:
+        """
+        Like `execute_all`, but for asyncio: returns an async iterator yielding the result of each
+        query, with the work (including reading the script) run on an executor (see AsyncRunner)
+        """
+        from .aio import AsyncRunner # deferred; only needed by asyncio applications
+        return AsyncRunner(self, executor, concurrency).run(self._bindScript(script, args, kwargs))
+
+    def _bindScript(self, script:Union[str,Iterable[str]], args, kwargs)->Iterable[ast._Node]:
+        """
+        Split, parse and bind a script one statement at a time
+        """
+        found = False
+        for statement in split_statements(script):
+            found = True
+            yield from self.prepare(statement).bind(*args, **kwargs)
+        if not found:
+            raise TEQLException('No queries to execute')
+
+    def execute_stream(self, script:Union[str,Iterable[str]], input:BinaryIO, output:BinaryIO, *args, **kwargs):
+        """
+        Run a script in a single forward pass over a binary input stream (such as stdin), writing the 
+        edited stream to the output, in memory bounded by the longest line rather than the input size.
+
+        Each query is applied to the output of the one before, like a pipeline of `sed` commands. A 
+        SHOW query passes on only what it selects, like `grep`. Only queries whose selections can be
+        found within single lines are supported; see StreamCompiler.
+        """
+        from .stream import StreamCompiler # deferred; only needed in stream mode
+        compiler = StreamCompiler(self)
+        stages = [
+            compiler.compile(query)
+            for statement in split_statements(script)
+            for query in self.prepare(statement).bind(*args, **kwargs)
+        ]
+        if not stages:
+            raise TEQLException('No queries to execute')
+        compiler.run(stages, input, output)
+
+    def prepare(self, code:str)->'PreparedStatement':
+        """
+        Parse a query (or script) once so it can be executed many times with different arguments.
+
+        Parsed queries are kept in a bounded LRU cache keyed by the normalized query text, so 
+        repeatedly preparing or executing the same text does not parse it again.
+        """
+        return PreparedStatement(self, self._parseCached(_normalize_query(code), self.parser))
+
+    def edit(self, data, code:str, *args, **kwargs)->bytes:
+        """
+        Run update queries against a buffer in memory (bytes, bytearray, memoryview, mmap, or anything 
+        else supporting the buffer protocol; or a string), rather than the files given by USE. The
+        buffer is searched without being copied, and the edited contents are returned as bytes; the
+        buffer itself is left unchanged, and is no longer viewed once this returns.
+
+        Any other queries in the code (such as SET) are executed as normal.
+        """
+        edited = None
+        for query in self.prepare(code).bind(*args, **kwargs):
+            if isinstance(query, ast._UpdateQuery):
+                context = Context(data if edited is None else edited, encoding=self.encoding, line_separator=self.line_separator)
+                try:
+                    edited = self._editContext(self._resolveUpdateQuery(query), context).bytes()
+                finally:
+                    context.release()
+            else:
+                self._executeQuery(query)
+        if edited is None:
+            context = Context(data, encoding=self.encoding)
+            try:
+                return context.bytes()
+            finally:
+                context.release()
+        return edited
+
+    def close(self):
+        """
+        Shut down the worker processes of parallel queries, if any were started. The session can still
+        be used afterwards, starting new workers when they are needed.
+        """
+        if self._parallel is not None:
+            self._parallel.shutdown()
+            self._parallel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _executeQuery(self, query:ast._Node):
         if isinstance(query, ast._UpdateQuery):
             return self._executeUpdateQuery(query)
         elif isinstance(query, ast.ShowQuery):
@@ -36,36 +180,77 @@ class TEQL:
             return self._executeSetQuery(query)
         elif isinstance(query, ast.UseQuery):
             return self._executeUseQuery(query)
+        elif isinstance(query, ast.ExplainQuery):
+            return self._executeExplainQuery(query)
+        elif isinstance(query, ast.PreviewQuery):
+            return self._executeUpdateQueryPreview(query.query, query.is_diff)
 
-    def execute_all(self, code:str):
-        queries = parse(code)
-        if not queries:
-            raise TEQLException('No queries to execute')
-        for query in queries:
-            if isinstance(query, ast._UpdateQuery):
-                yield self._executeUpdateQuery(query)
-            elif isinstance(query, ast.ShowQuery):
-                yield self._executeShowQuery(query)
-            elif isinstance(query, ast.SelectQuery):
-                yield self._executeSelectQuery(query)
-            elif isinstance(query, ast.SetQuery):
-                yield self._executeSetQuery(query)
-            elif isinstance(query, ast.UseQuery):
-                yield self._executeUseQuery(query)
-
-    def _iterFileContexts(self):
-        path_found = False
-        for path in glob(self.use):
-            path_found = True
-            with open(path, 'r+b') as file:
-                yield path, Context(file, encoding=self.encoding, line_separator=self.line_separator)
-        if not path_found:
-            raise TEQLException(f"File(s) not found: {self.use}")
+    def _iterFileContexts(self, writable=False, selector:ast._CursorOrSelection=None):
+        for path in self._candidateFiles(self._findFiles(self.use), selector):
+            yield path, self._openContext(path, writable)
+
+    def _findFiles(self, pattern)->List[str]:
+        paths = self.file_finder.find(pattern)
+        if not paths:
+            raise TEQLException(f"File(s) not found: {pattern}")
+        return paths
+
+    def _candidateFiles(self, paths:List[str], selector:Optional[ast._CursorOrSelection])->List[str]:
+        """
+        Narrow a list of files down to those in which the selector may find something, using the trigram index
+        """
+        if self.trigram_index is None or selector is None:
+            return paths
+        from .trigram_index import selector_literals # deferred; only needed with an index
+        literals = selector_literals(selector, self.encoding, self._resolveVariable)
+        if not literals:
+            return paths
+        return self.trigram_index.candidates(paths, literals)
+
+    def _parallelRunner(self, paths:Sequence[str])->Optional['ParallelRunner']:
+        """
+        Get the runner to evaluate a query against the given files in parallel, or None if it should be run in this process
+        """
+        if self.jobs <= 1 or len(paths) < 2:
+            return None
+        if self._parallel is not None and self._parallel.jobs != self.jobs:
+            self._parallel.shutdown()
+            self._parallel = None
+        if self._parallel is None:
+            from .parallel import ParallelRunner # deferred; it pulls in multiprocessing
+            self._parallel = ParallelRunner(self.jobs)
+        return self._parallel
+
+    def _openContext(self, path, writable=False)->Context:
+        """
+        Get the context of a file from the session's pool, opening the file if it isn't already open or has changed
+        """
+        check_cancelled()
+        if self.write_mode == 'inplace':
+            from .inplace import recover_journal # deferred; only needed in inplace mode
+            recover_journal(path) # In case patching the file was interrupted
+        def open_context(file, file_map):
+            return Context(file, encoding=self.encoding, line_separator=self.line_separator, index_cache=self.index_cache, file_map=file_map)
+        return self.context_pool.get(path, open_context, writable=writable, settings=self._contextSettings())
+
+    def _contextSettings(self):
+        return self.encoding, self.line_separator
         
     def _executeShowQuery(self, query:ast.ShowQuery):
         if isinstance(query.value.value, ast._Selection):
-            for path,context in self._iterFileContexts():
-                for selection in self._evaluateSelection(query.value.value, context):
+            paths = self._candidateFiles(self._findFiles(self.use), query.value.value)
+            runner = self._parallelRunner(paths)
+            if runner is not None:
+                for path, (offsets,) in runner.select(self, [query.value.value], paths):
+                    if not offsets:
+                        continue
+                    context = self._openContext(path)
+                    for i in range(0, len(offsets), 2):
+                        print(context.string(offsets[i], offsets[i+1]))
+                return
+            plan = self._compileSelection(query.value.value)
+            for path in paths:
+                for selection in plan(self._openContext(path)):
                     print(selection.string())
         # TODO all the other things we could show
     
@@ -73,74 +258,176 @@ class TEQL:
         return SelectResult(self._executeSelectQueryGetStores(query))
     
     def _executeSelectQueryGetStores(self, query:ast.SelectQuery):
-        path_found = False
-        for path in glob(query.path):
-            path_found = True
+        plans = [
+            self._compileSelection(value.value) if isinstance(value.value, ast._Selection) else None
+            for value in query.values
+        ]
+        paths = self._findFiles(query.path)
+        runner = self._parallelRunner(paths)
+        if runner is not None:
+            selectors = [value.value if isinstance(value.value, ast._Selection) else None for value in query.values]
+            found = runner.select(self, selectors, paths)
+            candidates = [None] * len(plans)
+        else:
+            found = ((path, None) for path in paths)
+            # Each file still gets a row, but files the index rules out for a value needn't be searched for it
+            candidates = [
+                set(self._candidateFiles(paths, value.value)) if plan is not None and self.trigram_index is not None else None
+                for value, plan in zip(query.values, plans)
+            ]
+        for path, offsets in found:
             store = VariableStore()
             store[0] = path
             index = 1
-            with open(path, 'r+b') as file:
-                context = Context(file, encoding=self.encoding, line_separator=self.line_separator)
-                for value in query.values:
-                    evaluated = self._evaluateSelectValue(value, context)
-                    store[index] = evaluated
-                    if value.alias is not None:
-                        store[value.alias.name] = evaluated
-                    index += 1
+            context = None
+            for i, (value, plan) in enumerate(zip(query.values, plans)):
+                if candidates[i] is not None and path not in candidates[i]:
+                    evaluated = VariableStore([])
+                elif offsets is not None and offsets[i] is not None:
+                    if context is None:
+                        context = self._openContext(path)
+                    evaluated = VariableStore([context.string(offsets[i][j], offsets[i][j+1]) for j in range(0, len(offsets[i]), 2)])
+                else:
+                    if context is None:
+                        context = self._openContext(path)
+                    evaluated = self._evaluateSelectValue(value, context, plan)
+                store[index] = evaluated
+                if value.alias is not None:
+                    store[value.alias.name] = evaluated
+                index += 1
             yield store
-        if not path_found:
-            raise TEQLException(f"File(s) not found: {query.path}")
     
-    def _evaluateSelectValue(self, value:ast.SelectValue, context: Context):
+    def _evaluateSelectValue(self, value:ast.SelectValue, context: Context, plan:Plan=None):
         if isinstance(value.value, ast._Selection):
+            if plan is None:
+                plan = self._compileSelection(value.value)
             return VariableStore([
-                selection.string() for selection in self._evaluateSelection(value.value, context)
+                selection.string() for selection in plan(context)
             ])
         # TODO other types
 
     
     def _executeUpdateQuery(self, query:ast._UpdateQuery):
+        query = self._resolveUpdateQuery(query)
+        paths = self._candidateFiles(self._findFiles(self.use), self._getUpdateQuerySelector(query))
+        runner = self._parallelRunner(paths)
+        if runner is not None:
+            for path in runner.update(self, query, paths):
+                self.context_pool.discard(path) # Rewritten by a worker
+            return
         for path, editor in self._evaluateUpdateQuery(query):
+            self._updateFile(path, editor)
+
+    def _updateFile(self, path, editor:Editor):
+        file_map = editor.edited_file_map()
+        self.context_pool.discard(path) # Its mapping is closed before the file is replaced
+        patched = False
+        if self.write_mode == 'inplace':
+            from .inplace import patch_in_place # deferred; only needed in inplace mode
+            patched = patch_in_place(path, editor)
+        if not patched:
             self._overwriteFile(path, editor)
+        # The map is kept so the next query can address lines without scanning the file again
+        self.context_pool.replaced(path, file_map, settings=self._contextSettings())
     
     def _overwriteFile(self, path, editor:Editor):
+        from tempfile import NamedTemporaryFile # deferred; read-only runs never need it
         with NamedTemporaryFile('wb', prefix='.teql.', dir=os.path.dirname(path), delete=False) as temp:
             editor(temp.file)
             editor.context.data.close()
             name = temp.name
         os.replace(name, path)
     
-    def _executeUpdateQueryPreview(self, query:ast._UpdateQuery):
-        for path, editor in self._evaluateUpdateQuery(query):
-            print(); print(path); print()
-            editor(sys.stdout)
-            print()
-    
-    # TODO: show diff from update query (would require tracking line numbers)
+    def _executeUpdateQueryPreview(self, query:ast._UpdateQuery, diff:bool=False):
+        """
+        Write the result of an update query (or with `diff`, a unified diff of its changes) to stdout
+        rather than to the files
+        """
+        for path, editor in self._evaluateUpdateQuery(query, writable=False):
+            if diff:
+                name = os.fsencode(path)
+                _write_stdout(editor.patch(self.diff_context, name, name), self.encoding)
+            else:
+                print(); print(path); print()
+                _write_stdout(editor, self.encoding)
+                print()
 
-    def _evaluateUpdateQuery(self, query:ast._UpdateQuery):
-        for path, context in self._iterFileContexts():
-            opcodes = []
-            opcodes.extend(self._getUpdateOperationOpcodes(query, context))
-            yield path, Editor(context, self._normalizeOpcodeList(opcodes))
+    def _evaluateUpdateQuery(self, query:ast._UpdateQuery, writable=True):
+        query = self._resolveUpdateQuery(query)
+        selector = self._getUpdateQuerySelector(query)
+        plan = self._compileSelection(selector)
+        for path, context in self._iterFileContexts(writable, selector):
+            yield path, self._editContext(query, context, plan)
+
+    def _editContext(self, query:ast._UpdateQuery, context:Context, plan:Plan=None)->Editor:
+        """
+        Get an editor which applies an (already resolved) update query to a single context
+        """
+        opcodes = []
+        opcodes.extend(self._getUpdateOperationOpcodes(query, context, plan))
+        return Editor(context, list(self._normalizeOpcodeList(opcodes)))
     
-    def _getUpdateOperationOpcodes(self, query:ast._UpdateQuery, context:Context):
+    def _resolveUpdateQuery(self, query:ast._UpdateQuery)->ast._UpdateQuery:
+        """
+        Load anything an update query needs before it is run against each file (i.e. the mapping of CHANGE USING MAPPING)
+        """
+        if isinstance(query, ast.ChangeMappingQuery):
+            return ast.ChangeMappingQuery(self._loadMapping(query.mapping))
+        return query
+
+    def _loadMapping(self, mapping)->Mapping[str,str]:
+        """
+        Get the mapping for a CHANGE USING MAPPING query, reading it from a file if given a path
+        """
+        if isinstance(mapping, ast.Variable):
+            mapping = self._resolveVariable(mapping)
+        if isinstance(mapping, str):
+            try:
+                mapping = load_mapping(mapping, self.encoding)
+            except (OSError, ValueError) as e:
+                raise TEQLException(f"Can't load mapping: {e}")
+        if not isinstance(mapping, Mapping):
+            raise TEQLException(f"Not a mapping: {mapping!r}")
+        if not mapping:
+            raise TEQLException("The mapping is empty")
+        if '' in mapping:
+            raise TEQLException("The mapping can't contain an empty key")
+        return mapping
+
+    def _getUpdateQuerySelector(self, query:ast._UpdateQuery)->ast._CursorOrSelection:
+        """
+        Get the cursor or selection that an update query operates on
+        """
+        if isinstance(query, ast.InsertQuery):
+            return query.cursor
+        elif isinstance(query, ast.ChangeQuery):
+            if not isinstance(query.selection, ast._Selection):
+                return ast.FindSelection(query.selection)
+            return query.selection
+        elif isinstance(query, ast.ChangeMappingQuery):
+            return ast.FindAnySelection(list(self._loadMapping(query.mapping)))
+        elif isinstance(query, (ast.DeleteQuery, ast.IndentQuery)):
+            return query.selection
+
+    def _getUpdateOperationOpcodes(self, query:ast._UpdateQuery, context:Context, plan:Plan=None):
         """
         Generate a series of opcodes for the operations to apply to the file
         """
+        if plan is None:
+            plan = self._compileSelection(self._getUpdateQuerySelector(query))
         if isinstance(query, ast.InsertQuery):
-            for sel in self._evaluateSelection(query.cursor, context):
+            for sel in plan(context):
                 # TODO add newlines if operation.is_line = True
                 yield Opcode.insert(sel.start, sel.end, self._evaluateReplacement(sel, query.string))
         elif isinstance(query, ast.ChangeQuery):
-            if not isinstance(query.selection, ast._Selection):
-                selection = ast.FindSelection(selection)
-            else:
-                selection = query.selection
-            for sel in self._evaluateSelection(selection, context):
+            for sel in plan(context):
                 yield Opcode.replace(sel.start, sel.end, self._evaluateReplacement(sel, query.replacement))
+        elif isinstance(query, ast.ChangeMappingQuery):
+            mapping = self._loadMapping(query.mapping)
+            for sel in plan(context):
+                yield Opcode.replace(sel.start, sel.end, str(mapping[sel.string()]))
         if isinstance(query, ast.DeleteQuery):
-            for sel in self._evaluateSelection(query.selection, context):
+            for sel in plan(context):
                 yield Opcode.delete(sel.start, sel.end)
         if isinstance(query, ast.IndentQuery):
             # TODO
@@ -150,99 +437,13 @@ class TEQL:
         """
         Given a cursor or selector statement, yield a series of real selections with start and end indices.
         """
-        if isinstance(selector, ast.StartCursor):
-            yield context.sub(0,0)
-        elif isinstance(selector, ast.EndCursor):
-            i = len(context)
-            yield context.sub(i,i)
-        elif isinstance(selector, ast.SeekCursor):
-            i = selector.offset
-            if (i < 0):
-                i = len(context) + i
-            yield context.sub(i, i)
-        elif isinstance(selector, ast.OffsetCursor):
-            for other in self._evaluateSelection(selector.other, context):
-                i = other.start + selector.offset
-                yield context.sub(i, i)
-        elif isinstance(selector, ast.SelectionAfterCursor):
-            for other in self._evaluateSelection(selector.other, context):
-                i = other.end + (selector.n or 0)
-                yield context.sub(i,i)
-        elif isinstance(selector, ast.SelectionBeforeCursor):
-            for other in self._evaluateSelection(selector.other, context):
-                i = other.start - (selector.n or 0)
-                yield context.sub(i,i)
-        elif isinstance(selector, ast.SelectionCursor):
-            for other in self._evaluateSelection(selector.outer, context):
-                yield from self._evaluateSelection(selector.inner, context.sub(other.s1, other.s2))
-        elif isinstance(selector, ast.RangeIndexCursor): 
-            # if a cursor has multiple matches, select the nth one(s)
-            other = self._evaluateSelection(selector.other, context)
-            yield from apply_ranges(selector.ranges, other, adapt_index=True)
-        elif isinstance(selector, ast.SelectionAfterSelection):
-            # select everything in context from the end of the other cursor or selection
-            other = last(self._evaluateSelection(selector.other, context))
-            i = len(context)
-            yield context.sub(other.end, i)
-        elif isinstance(selector, ast.SelectionBeforeSelection):
-            # select everything in context until the start of the other cursor or selection
-            other = first(self._evaluateSelection(selector.other, context))
-            yield context.sub(0, other.start) # TODO may need to subtract 1 to other.start
-        elif isinstance(selector, ast.SubstringSelection):
-            # select everything in context until the start of the other cursor or selection
-            yield context.sub(selector.start, selector.end)
-        elif isinstance(selector, ast.DirectLineSelection):
-            # select a specific line by line number; negative to select from end
-            yield from apply_ranges(selector.ranges, context.expand_to_lines().split_lines(), adapt_index=True)
-        elif isinstance(selector, ast.CursorLineSelection):
-            # select a line by that a cursor sits on
-            for other in self._evaluateSelection(selector.other, context):
-                yield other.expand_to_lines()
-        elif isinstance(selector, ast.SelectionLineSelection):
-            # select individual lines of a larger selection
-            for other in self._evaluateSelection(selector.other, context):
-                yield from other.expand_to_lines().split_lines()
-        elif isinstance(selector, ast.FindSelection):
-            # find a selection
-            # TODO include modifiers:
-            # is_next # relative to previous selection
-            # is_matching:bool # same indentation as previous selection
-            # is_line:bool # select entire line
-            # is_with:bool # match only part of a line even if selecting entire line
-            if isinstance(selector.expression, str):
-                yield from context.find_all(selector.expression)
-            elif isinstance(selector.expression, ast.LiteralRegex):
-                yield from context.find_all_re(selector.expression.pattern, selector.expression.flags)
-            elif isinstance(selector.expression, ast.Variable):
-                pass # TODO
-            elif isinstance(selector.expression, ast._Selection):
-                pass # TODO
-        elif isinstance(selector, ast.BlockSelection):
-            # select a large block from two other selections
-            start = first(self._evaluateSelection(selector.start, context))
-            if isinstance(selector.end, ast.LengthCursor):
-                end = start + selector.end.length
-            else:
-                end = last(self._evaluateSelection(selector.end, context))
-            # Ensure both ends exist and the end is after the start
-            if start is not None and end is not None and start.end <= end.start:
-                yield context.sub(start.start, end.end)
-        elif isinstance(selector, ast.BetweenSelection):
-            # select a large block between two other selections
-            start = first(self._evaluateSelection(selector.start, context))
-            end = last(self._evaluateSelection(selector.end, context))
-            # Ensure both ends exist and the end is after the start
-            if start is not None and end is not None and start.end <= end.start:
-                yield context.sub(start.end, end.start)
-        elif isinstance(selector, ast.SubSelection):
-            # select a portion of a previous selection
-            for other in self._evaluateSelection(selector.outer, context):
-                yield from self._evaluateSelection(selector.inner, other)
-        elif isinstance(selector, ast.RangeIndexSelection):
-            # if a selection has multiple matches, select the nth one
-            yield from apply_ranges(selector.ranges, self._evaluateSelection(selector.other, context), adapt_index=True)
-        elif isinstance(selector, ast.FileSelection):
-            yield context.file()
+        return self._compileSelection(selector)(context)
+
+    def _compileSelection(self, selector:ast._CursorOrSelection)->Plan:
+        """
+        Compile a cursor or selector statement into a plan which can be run against each file's context
+        """
+        return cancellable(SelectionCompiler(self._resolveVariable).compile_root(optimize(selector)))
 
     def _evaluateReplacement(self, selection, replacement):
         """
@@ -250,8 +451,19 @@ class TEQL:
         """
         if isinstance(replacement, str):
             return replacement
+        if isinstance(replacement, ast.Variable):
+            return str(self._resolveVariable(replacement))
         # TODO: variables and so forth; regex replacements
     
+    def _resolveVariable(self, variable:ast.Variable):
+        """
+        Look up the value of a variable that was not bound as a parameter
+        """
+        try:
+            return self.session_variables[variable.identifiers]
+        except (KeyError, IndexError):
+            raise TEQLException(f"Unbound variable: ${'.'.join(map(str, variable.identifiers))}")
+
     def _normalizeOpcodeList(self, opcodes:List['Operation']):
         """
         Sort a series of opcodes by index, and ensure that none of them overlap
@@ -263,6 +475,35 @@ class TEQL:
             prev = opcode
             yield opcode
 
+    def _executeExplainQuery(self, query:ast.ExplainQuery):
+        """
+        Describe the optimized plan for a query. With ANALYZE, the query's selector is also run against
+        each file (without printing results or writing changes) to collect statistics for each node.
+        """
+        if isinstance(query.query, ast.ShowQuery) and isinstance(query.query.value.value, ast._Selection):
+            selector = query.query.value.value
+        elif isinstance(query.query, ast._UpdateQuery):
+            query = copy(query)
+            query.query = self._resolveUpdateQuery(query.query)
+            selector = self._getUpdateQuerySelector(query.query)
+        else:
+            raise TEQLException(f"Can't EXPLAIN {type(query.query).__name__}")
+        selector = optimize(selector)
+        if not query.is_analyze:
+            return ExplainResult(format_plan(selector))
+        profile = {}
+        plan = SelectionCompiler(self._resolveVariable, profile).compile_root(selector)
+        files = 0
+        started = perf_counter()
+        for path, context in self._iterFileContexts(selector=selector):
+            files += 1
+            if isinstance(query.query, ast._UpdateQuery):
+                list(self._normalizeOpcodeList(self._getUpdateOperationOpcodes(query.query, context, plan)))
+            else:
+                for selection in plan(context):
+                    pass
+        return ExplainResult(format_plan(selector, profile), perf_counter() - started, files)
+
     def _executeSetQuery(self, query:ast.SetQuery):
         if isinstance(query.value, ast.Variable):
             value = self.session_variables[query.value.identifiers]
@@ -298,6 +539,53 @@ class TEQL:
                     self.line_numbers = None
                 else:
                     raise ValueError(f"{value} is not valid for linenumbers")
+            if query.key.name == 'jobs':
+                # The number of processes to run queries against many files with
+                if isinstance(value, ast.Symbol) and value.name.lower() == 'auto':
+                    self.jobs = os.cpu_count() or 1
+                elif isinstance(value, ast.Symbol) and value.name.lower() == 'off':
+                    self.jobs = 1
+                elif isinstance(value, int) and value > 0:
+                    self.jobs = value
+                elif isinstance(value, str) and value.strip().isdigit() and int(value) > 0:
+                    self.jobs = int(value)
+                else:
+                    raise ValueError(f"{value} is not valid for jobs")
+            if query.key.name == 'ignore':
+                # Whether USE and FROM patterns skip files excluded by .gitignore
+                if isinstance(value, ast.Symbol) and value.name.lower() in ('on', 'off'):
+                    self.file_finder.use_ignore_files = value.name.lower() == 'on'
+                else:
+                    raise ValueError(f"{value} is not valid for ignore")
+            if query.key.name == 'binary':
+                if isinstance(value, ast.Symbol) and value.name.lower() in ('skip', 'include'):
+                    self.file_finder.skip_binary = value.name.lower() == 'skip'
+                else:
+                    raise ValueError(f"{value} is not valid for binary")
+            if query.key.name == 'maxfilesize':
+                if isinstance(value, ast.Symbol) and value.name.lower() == 'off':
+                    self.file_finder.max_file_size = None
+                elif isinstance(value, int) and value >= 0:
+                    self.file_finder.max_file_size = value
+                elif isinstance(value, str) and _SIZE.fullmatch(value.strip()):
+                    number, unit = _SIZE.fullmatch(value.strip()).groups()
+                    self.file_finder.max_file_size = int(number) * 1024 ** ' KMG'.index((unit or ' ').upper())
+                else:
+                    raise ValueError(f"{value} is not valid for maxfilesize")
+            if query.key.name == 'diffcontext':
+                # The number of unchanged lines shown around each change by PREVIEW DIFF
+                if isinstance(value, int) and value >= 0:
+                    self.diff_context = value
+                elif isinstance(value, str) and value.strip().isdigit():
+                    self.diff_context = int(value)
+                else:
+                    raise ValueError(f"{value} is not valid for diffcontext")
+            if query.key.name == 'write_mode':
+                # Whether updates may patch files in place, rather than always replacing them with a new copy
+                if isinstance(value, ast.Symbol) and value.name.lower() in ('inplace', 'replace'):
+                    self.write_mode = value.name.lower()
+                else:
+                    raise ValueError(f"{value} is not valid for write_mode")
         elif isinstance(query.key, ast.Variable):
             self.session_variables[query.key.identifiers] = value
     
@@ -329,6 +617,8 @@ class VariableStore:
         elif isinstance(index, (list,tuple)):
             if not index:
                 return self
+            if len(index) == 1:
+                return self.__getitem__(index[0])
             return self.__getitem__(index[0]).__getitem__(index[1:])
         else:
             raise KeyError(index)
@@ -339,11 +629,14 @@ class VariableStore:
                 self._positional.extend([None] * (index - len(self._positional) + 1))
             self._positional[index] = value
         elif isinstance(index, str):
-            self._named[index] = index
+            self._named[index] = value
         elif isinstance(index, (list,tuple)):
             if not index:
                 pass # TODO
-            return self.__getitem__(index[0]).__setitem__(index[1:])
+            elif len(index) == 1:
+                self.__setitem__(index[0], value)
+            else:
+                self.__getitem__(index[0]).__setitem__(index[1:], value)
         else:
             raise KeyError(index)
     
@@ -351,12 +644,109 @@ class VariableStore:
         return f"VariableStore({repr(self._positional)}, {repr(self._named)})"
 
 
+class PreparedStatement:
+    """
+    A parsed query or script which can be executed repeatedly with different arguments.
+
+    Positional arguments are bound to `$1`, `$2`, etc. and keyword arguments to `$name`. Any 
+    placeholder that is not bound is looked up in the session variables when the query is run.
+    """
+    def __init__(self, teql:TEQL, queries:Sequence[ast._Node]):
+        self.teql = teql
+        self.queries = queries
+
+    def bind(self, *args, **kwargs)->List[ast._Node]:
+        """
+        Get a copy of the parsed queries with the given arguments substituted for their placeholders
+        """
+        # Index 0 is reserved, so that $1 is the first argument
+        parameters = VariableStore([None, *args], kwargs)
+        return [_bind_parameters(query, parameters) for query in self.queries]
+
+    def execute(self, *args, **kwargs):
+        return self.teql._executeQuery(self._bindSingle(args, kwargs))
+
+    def execute_all(self, *args, **kwargs):
+        if not self.queries:
+            raise TEQLException('No queries to execute')
+        for query in self.bind(*args, **kwargs):
+            yield self.teql._executeQuery(query)
+
+    def execute_async(self, *args, executor:'Executor'=None, concurrency:int=None, **kwargs)->AsyncIterator:
+        from .aio import AsyncRunner # deferred; only needed by asyncio applications
+        return AsyncRunner(self.teql, executor, concurrency).run([self._bindSingle(args, kwargs)])
+
+    def execute_all_async(self, *args, executor:'Executor'=None, concurrency:int=None, **kwargs)->AsyncIterator:
+        from .aio import AsyncRunner # deferred; only needed by asyncio applications
+        if not self.queries:
+            raise TEQLException('No queries to execute')
+        return AsyncRunner(self.teql, executor, concurrency).run(self.bind(*args, **kwargs))
+
+    def _bindSingle(self, args, kwargs)->ast._Node:
+        if not self.queries:
+            raise TEQLException('No query to execute')
+        if len(self.queries) > 1:
+            raise TEQLException("Can't execute multiple queries with `execute`, use `execute_all` instead")
+        return self.bind(*args, **kwargs)[0]
+
+
+_SIZE = re.compile(r'(\d+)\s*([kmg])?i?b?', re.IGNORECASE)
+
+def _write_stdout(chunks:Iterable[bytes], encoding:str):
+    """
+    Write encoded text to stdout as it is, or decoded if stdout is only a text stream (as in tests)
+    """
+    buffer = getattr(sys.stdout, 'buffer', None)
+    if buffer is not None:
+        sys.stdout.flush()
+        buffer.writelines(chunks)
+        buffer.flush()
+        return
+    decoder = getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        sys.stdout.write(decoder.decode(chunk))
+    sys.stdout.write(decoder.decode(b'', final=True))
+
+def _normalize_query(code:str)->str:
+    return code.strip().rstrip(';').strip()
+
+def _parse_plan(code:str, mode:str)->Tuple[ast._Node]:
+    return tuple(parse(code, mode))
+
+def _bind_parameters(node, parameters:VariableStore):
+    """
+    Return a copy of the AST node, with any variables found in the parameters replaced by their value
+    """
+    if isinstance(node, ast.Variable):
+        try:
+            value = parameters[node.identifiers]
+        except (KeyError, IndexError):
+            return node
+        return node if value is None else value
+    elif isinstance(node, list):
+        return [_bind_parameters(item, parameters) for item in node]
+    elif isinstance(node, ast.SetQuery):
+        # The key of a SET names the variable being assigned, so must not be substituted
+        node = copy(node)
+        node.value = _bind_parameters(node.value, parameters)
+        return node
+    elif isinstance(node, ast._Node):
+        node = copy(node)
+        for field in fields(node):
+            setattr(node, field.name, _bind_parameters(getattr(node, field.name), parameters))
+        return node
+    return node
+
+
 class Result:
     pass
 
 class SelectResult(Result):
     def __init__(self, stores:Iterable[VariableStore]):
         self._stores = iter(stores)
+        # Used by the async methods; set when the result comes from an async execute
+        self._executor = None
+        self._cancellation = Cancellation()
     
     def fetch(self)->Optional[VariableStore]:
         try:
@@ -369,6 +759,28 @@ class SelectResult(Result):
     
     def fetch_iter(self)->Iterable[VariableStore]:
         yield from self._stores
+
+    async def fetch_async(self)->Optional[VariableStore]:
+        """
+        Like `fetch`, but with the file evaluated on an executor rather than blocking the event loop.
+
+        If the awaiting task is cancelled, the scan is stopped, and nothing more can be fetched.
+        """
+        return await self._offload(self.fetch)
+
+    async def fetch_all_async(self)->List[VariableStore]:
+        return await self._offload(self.fetch_all)
+
+    async def fetch_iter_async(self)->AsyncIterator[VariableStore]:
+        while True:
+            store = await self.fetch_async()
+            if store is None:
+                return
+            yield store
+
+    def _offload(self, function):
+        from .aio import offload # deferred; only needed by asyncio applications
+        return offload(self._executor, self._cancellation, function)
         
 class UpdateResult(Result):
     pass
@@ -376,4 +788,16 @@ class SetResult(Result):
     pass
 
 class UseResult(Result):
-    pass
\ No newline at end of file
+    pass
+
+class ExplainResult(Result):
+    def __init__(self, plan:List[str], seconds:float=None, files:int=None):
+        self.plan = plan
+        self.seconds = seconds
+        self.files = files
+
+    def __str__(self):
+        lines = list(self.plan)
+        if self.seconds is not None:
+            lines.append(f"Total: {self.seconds*1000:.3f}ms over {self.files} file(s)")
+        return '\n'.join(lines)
\ No newline at end of file
@@ -0,0 +1,238 @@
+import os, sqlite3, threading
+from . import ast
+from .context import _interpret_flags
+from .file_map import _numpy
+from .regex_analysis import required_literals
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+__all__ = ('TrigramIndex', 'default_index_path', 'selector_literals')
+
+DEFAULT_MAX_FILE_SIZE = 16 * 1024 * 1024 # Larger files aren't indexed, so are always searched
+PRUNE_AFTER = 10000 # Number of files reindexed before the postings of their old contents are deleted
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER NOT NULL,
+    file INTEGER NOT NULL,
+    PRIMARY KEY (trigram, file)
+) WITHOUT ROWID;
+"""
+
+def default_index_path()->str:
+    """
+    The path given by the TEQL_TRIGRAM_INDEX environment variable, or else `teql/trigrams.db` in the
+    user's cache directory
+    """
+    path = os.environ.get('TEQL_TRIGRAM_INDEX')
+    if path:
+        return path
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'teql', 'trigrams.db')
+
+class TrigramIndex:
+    """
+    An on-disk index of the three-byte sequences (trigrams) in each file, used to rule out files which
+    can't contain the strings a query searches for without opening them, like Google's codesearch.
+
+    The index is an SQLite database, which maps each trigram to the files containing it. Entries are
+    keyed by the file's absolute path, and record its size and modification time; whenever the index
+    is consulted, the files whose size or modification time have changed (and new files) are
+    reindexed first, so results are never out of date. Files larger than `max_file_size` aren't
+    indexed, and are never ruled out.
+
+    Errors reading or writing the index are ignored (so nothing is ruled out); the index is only
+    ever an optimization.
+    """
+    def __init__(self, path:str=None, *, max_file_size:int=DEFAULT_MAX_FILE_SIZE):
+        self.path = path or default_index_path()
+        self.max_file_size = max_file_size
+        self._connection = None
+        self._files:Optional[Dict[str, Tuple[int,int,int,bool]]] = None # path -> (id, size, mtime_ns, indexed)
+        self._reindexed = 0
+        self._lock = threading.Lock() # The index may be consulted from an async call's threads
+
+    def candidates(self, paths:Sequence[str], literals:Iterable[bytes])->List[str]:
+        """
+        Get the paths (in the same order) of the files which may contain every one of the literal
+        strings; that is, all but those which the index shows can't. Literals shorter than three bytes
+        don't rule out any files.
+        """
+        trigrams = set()
+        for literal in literals:
+            trigrams.update(_trigrams(literal))
+        if not trigrams:
+            return list(paths)
+        try:
+            with self._lock:
+                ids = self._refresh(paths)
+                matching = self._lookup(trigrams)
+        except (OSError, sqlite3.Error):
+            return list(paths)
+        return [path for path, file_id in zip(paths, ids) if file_id is None or file_id in matching]
+
+    def update(self, paths:Iterable[str]):
+        """
+        Bring the index entries of the files up to date, indexing them if they are new or have changed
+        """
+        with self._lock:
+            self._refresh(paths)
+
+    def prune(self):
+        """
+        Delete the entries of files which no longer exist, and the trigrams of files' old contents
+        """
+        with self._lock:
+            connection = self._connect()
+            files = self._load()
+            with connection:
+                for path, (file_id, size, mtime_ns, indexed) in list(files.items()):
+                    if not os.path.exists(path):
+                        connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                        del files[path]
+                connection.execute('DELETE FROM postings WHERE file NOT IN (SELECT id FROM files)')
+            self._reindexed = 0
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._files = None
+
+    def _connect(self)->sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _load(self)->Dict[str, Tuple[int,int,int,bool]]:
+        if self._files is None:
+            self._files = {
+                path: (file_id, size, mtime_ns, bool(indexed))
+                for file_id, path, size, mtime_ns, indexed in self._connect().execute('SELECT id, path, size, mtime_ns, indexed FROM files')
+            }
+        return self._files
+
+    def _refresh(self, paths:Iterable[str])->List[Optional[int]]:
+        """
+        Reindex any of the files which have changed, returning the id of each (or None if it isn't indexed)
+        """
+        connection = self._connect()
+        files = self._load()
+        ids = []
+        with connection:
+            for path in paths:
+                key = os.path.abspath(path)
+                try:
+                    stat = os.stat(key)
+                except OSError:
+                    ids.append(None)
+                    continue
+                entry = files.get(key)
+                if entry is None or entry[1] != stat.st_size or entry[2] != stat.st_mtime_ns:
+                    entry = files[key] = self._index(connection, key, stat, entry)
+                ids.append(entry[0] if entry[3] else None)
+        if self._reindexed >= PRUNE_AFTER:
+            with connection:
+                connection.execute('DELETE FROM postings WHERE file NOT IN (SELECT id FROM files)')
+            self._reindexed = 0
+        return ids
+
+    def _index(self, connection:sqlite3.Connection, path:str, stat:os.stat_result, old:Optional[tuple])->Tuple[int,int,int,bool]:
+        trigrams = None
+        if stat.st_size <= self.max_file_size:
+            try:
+                with open(path, 'rb') as file:
+                    trigrams = _file_trigrams(file.read())
+            except OSError:
+                pass
+        if old is not None:
+            self._reindexed += 1
+        # The file gets a new id; the postings of its old contents are deleted when the index is pruned.
+        # (By path, in case another session has reindexed it since it was loaded.)
+        connection.execute('DELETE FROM files WHERE path = ?', (path,))
+        file_id = connection.execute(
+            'INSERT INTO files (path, size, mtime_ns, indexed) VALUES (?, ?, ?, ?)',
+            (path, stat.st_size, stat.st_mtime_ns, trigrams is not None),
+        ).lastrowid
+        if trigrams:
+            connection.executemany('INSERT INTO postings (trigram, file) VALUES (?, ?)', ((trigram, file_id) for trigram in trigrams))
+        return file_id, stat.st_size, stat.st_mtime_ns, trigrams is not None
+
+    def _lookup(self, trigrams:Set[int])->Set[int]:
+        """
+        Get the ids of the files containing every one of the trigrams
+        """
+        connection = self._connect()
+        matching = None
+        for trigram in trigrams:
+            found = {file_id for file_id, in connection.execute('SELECT file FROM postings WHERE trigram = ?', (trigram,))}
+            matching = found if matching is None else matching & found
+            if not matching:
+                break
+        return matching
+
+
+def _trigrams(data:bytes)->Set[int]:
+    return {a << 16 | b << 8 | c for a, b, c in set(zip(data, data[1:], data[2:]))}
+
+def _file_trigrams(data:bytes)->List[int]:
+    numpy = _numpy()
+    if numpy is None or len(data) < 3:
+        return list(_trigrams(data))
+    values = numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.uint32)
+    return numpy.unique(values[:-2] << 16 | values[1:-1] << 8 | values[2:]).tolist()
+
+
+def selector_literals(selector:ast._CursorOrSelection, encoding:str, resolve_variable:Callable[[ast.Variable], object])->List[bytes]:
+    """
+    Get strings which a file must contain for a cursor or selection to find anything in it.
+
+    This is conservative: only the strings searched for by FIND (and the literals required by its
+    regexes) are found, along with those of any selection a selector is relative to or within.
+    """
+    if isinstance(selector, (ast.FindSelection, ast.FindFirstSelection, ast.FindLastSelection)):
+        expression = selector.expression
+        if isinstance(expression, ast.LiteralRegex):
+            try:
+                flags = _interpret_flags(expression.flags)
+            except (KeyError, ValueError):
+                return []
+            return required_literals(expression.pattern.encode(encoding), flags)
+        if isinstance(expression, ast.Variable):
+            expression = str(resolve_variable(expression))
+        if isinstance(expression, str):
+            return [expression.encode(encoding)]
+        return []
+    literals = []
+    for name in _RELATIVE_TO.get(type(selector), ()):
+        other = getattr(selector, name)
+        if isinstance(other, ast._CursorOrSelection):
+            literals.extend(selector_literals(other, encoding, resolve_variable))
+    return literals
+
+# The fields of each selector which must find something for the selector itself to find anything
+_RELATIVE_TO = {
+    ast.OffsetCursor: ('other',),
+    ast.SelectionAfterCursor: ('other',),
+    ast.SelectionBeforeCursor: ('other',),
+    ast.SelectionCursor: ('inner', 'outer'),
+    ast.RangeIndexCursor: ('other',),
+    ast.SelectionAfterSelection: ('other',),
+    ast.SelectionBeforeSelection: ('other',),
+    ast.CursorLineSelection: ('other',),
+    ast.SelectionLineSelection: ('other',),
+    ast.BlockSelection: ('start', 'end'),
+    ast.BetweenSelection: ('start', 'end'),
+    ast.SubSelection: ('inner', 'outer'),
+    ast.RangeIndexSelection: ('other',),
+}
@@ -8,4 +8,16 @@ from .evaluate_selections_test import *
 from .evaluate_updates_test import *
 from .editor_test import *
 from .file_map_test import *
-from .context_test import *
\ No newline at end of file
+from .context_test import *
+from .prepared_statement_test import *
+from .optimizer_test import *
+from .explain_test import *
+from .stream_test import *
+from .index_cache_test import *
+from .context_pool_test import *
+from .discovery_test import *
+from .parallel_test import *
+from .async_test import *
+from .trigram_index_test import *
+from .inplace_test import *
+from .lazy_import_test import *
@@ -0,0 +1,95 @@
+from unittest import TestCase
+from teql import TEQL, QueryCancelled
+from teql import ast
+from teql.cancellation import Cancellation, cancellable
+from teql.teql import PreparedStatement
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from io import StringIO
+import asyncio, os, threading
+
+class AsyncTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        for i in range(10):
+            with open(os.path.join(self.temp.name, f"{i:02}.txt"), 'wb') as file:
+                file.write(f"file {i}\nthe mimsy borogoves\n".encode())
+        self.pattern = os.path.join(self.temp.name, '*.txt')
+        self.teql = TEQL(line_separator="\n")
+        self.teql.execute(f'USE "{self.pattern}"')
+        self.executor = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.temp.cleanup()
+
+    def collect(self, results):
+        async def collect():
+            return [result async for result in results]
+        output = StringIO()
+        with redirect_stdout(output):
+            collected = asyncio.run(collect())
+        return collected, output.getvalue()
+
+    def test_execute_all(self):
+        results, output = self.collect(self.teql.execute_all_async(
+            'SHOW FIND /file \\d/; CHANGE FIND "mimsy" TO "flimsy"; SHOW FIND /\\w+msy/',
+            executor=self.executor, concurrency=3,
+        ))
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(output, ''.join(f"file {i}\n" for i in range(10)) + "flimsy\n" * 10)
+        with open(os.path.join(self.temp.name, '07.txt'), 'rb') as file:
+            self.assertEqual(file.read(), b"file 7\nthe flimsy borogoves\n")
+
+    def test_select(self):
+        query = ast.SelectQuery([ast.SelectValue(ast.FindSelection('file'), None)], self.pattern)
+        (result,), output = self.collect(PreparedStatement(self.teql, [query]).execute_async(executor=self.executor))
+        async def fetch():
+            first = await result.fetch_async()
+            return [first] + [store async for store in result.fetch_iter_async()]
+        stores = asyncio.run(fetch())
+        self.assertEqual(len(stores), 10)
+        self.assertEqual(list(stores[3][1]), ['file'])
+        self.assertIsNone(asyncio.run(result.fetch_async()))
+
+    def test_cancel(self):
+        opened = []
+        started = threading.Event()
+        release = threading.Event()
+        open_context = self.teql._openContext
+        def slow_open(path, writable=False):
+            opened.append(path)
+            started.set()
+            release.wait(5)
+            return open_context(path, writable)
+        self.teql._openContext = slow_open
+        async def cancel():
+            async def consume():
+                async for result in self.teql.execute_async('SHOW FIND "mimsy"', executor=self.executor, concurrency=1):
+                    pass
+            task = asyncio.ensure_future(consume())
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            task.cancel()
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        with redirect_stdout(StringIO()) as output:
+            asyncio.run(cancel())
+        self.executor.shutdown(wait=True)
+        # The scan in progress stopped, and no other file was opened
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_cancellation(self):
+        parent = Cancellation()
+        child = Cancellation(parent)
+        plan = child.run(cancellable, lambda context: iter(range(3)))
+        selections = plan(None)
+        self.assertEqual(next(selections), 0)
+        parent.cancel()
+        self.assertTrue(child.cancelled)
+        with self.assertRaises(QueryCancelled):
+            next(selections)
+        with self.assertRaises(QueryCancelled):
+            child.run(print)
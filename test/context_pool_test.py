@@ -0,0 +1,78 @@
+from unittest import TestCase
+from teql import TEQL
+from teql.context import Context
+from teql.context_pool import ContextPool
+from tempfile import TemporaryDirectory
+import os
+
+class ContextPoolTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.temp.name, f"{i}.txt")
+            with open(path, 'wb') as file:
+                file.write(f"file {i}\nline 2\n".encode())
+            self.paths.append(path)
+        self.opened = []
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def open_context(self, file, file_map):
+        self.opened.append(file.name)
+        return Context(file, line_separator="\n", file_map=file_map)
+
+    def test_reused(self):
+        pool = ContextPool()
+        context = pool.get(self.paths[0], self.open_context)
+        self.assertIs(pool.get(self.paths[0], self.open_context), context)
+        self.assertEqual(self.opened, [self.paths[0]])
+
+    def test_read_only(self):
+        pool = ContextPool()
+        context = pool.get(self.paths[0], self.open_context)
+        with self.assertRaises(TypeError):
+            context.data[0:1] = b'F'
+        # A writable context is opened when needed
+        writable = pool.get(self.paths[0], self.open_context, writable=True)
+        self.assertIsNot(writable, context)
+        self.assertIs(pool.get(self.paths[0], self.open_context), writable)
+
+    def test_changed(self):
+        pool = ContextPool()
+        context = pool.get(self.paths[0], self.open_context)
+        with open(self.paths[0], 'ab') as file:
+            file.write(b"line 3\n")
+        changed = pool.get(self.paths[0], self.open_context)
+        self.assertIsNot(changed, context)
+        self.assertEqual(changed.bytes(), b"file 0\nline 2\nline 3\n")
+
+    def test_settings_changed(self):
+        pool = ContextPool()
+        context = pool.get(self.paths[0], self.open_context, settings=('utf-8', "\n"))
+        self.assertIsNot(pool.get(self.paths[0], self.open_context, settings=('utf-8', "\r\n")), context)
+
+    def test_evicts_least_recently_used(self):
+        pool = ContextPool(max_open=2)
+        first = pool.get(self.paths[0], self.open_context)
+        pool.get(self.paths[1], self.open_context)
+        pool.get(self.paths[0], self.open_context)
+        pool.get(self.paths[2], self.open_context)
+        self.assertEqual(len(pool), 2)
+        self.assertIn(self.paths[0], pool)
+        self.assertNotIn(self.paths[1], pool)
+        self.assertIs(pool.get(self.paths[0], self.open_context), first)
+
+    def test_teql_session(self):
+        teql = TEQL(line_separator="\n")
+        teql.execute(f'USE "{self.paths[0]}"')
+        path, context = next(teql._iterFileContexts())
+        self.assertIs(next(teql._iterFileContexts())[1], context)
+        context.file_map # Built once, by the first query that needs it
+        teql.execute('DELETE LINE 1')
+        path, edited = next(teql._iterFileContexts())
+        self.assertIsNot(edited, context)
+        self.assertEqual(edited.bytes(), b"line 2\n")
+        # The map was carried over from before the edit
+        self.assertEqual(list(edited._file_map.linebreaks), [7])
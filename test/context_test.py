@@ -1,6 +1,8 @@
 from unittest import TestCase, skip
-from teql.context import Context
-import os
+from teql.context import Context, Span
+from teql import context as context_module
+from unittest.mock import patch
+import os, io
 from tempfile import TemporaryFile
 from string import printable
 
@@ -132,4 +134,159 @@ class ContextTest(TestCase):
         with self.assertRaises(IndexError):
             data = "Lllama llama / Llama llama / I ride a / Ride a llama"
             context = Context(data, start=21, end=43)
-            context.sub(10, 25)
\ No newline at end of file
+            context.sub(10, 25)
+
+class SpanTest(TestCase):
+    def test_split_lines(self):
+        context = Context("line1\nline2\nline3")
+        lines = list(context.span().split_lines())
+        self.assertTrue(all(isinstance(line, Span) for line in lines))
+        self.assertEqual([line.string() for line in lines], ["line1\n","line2\n","line3"])
+        self.assertTrue(all(line.source is context for line in lines))
+
+    def test_no_instance_dict(self):
+        span = Context("some text").span()
+        self.assertFalse(hasattr(span, '__dict__'))
+
+    def test_find_all_re_keeps_match(self):
+        context = Context("Worn and torn, those forlorn Norn")
+        found = list(context.span().find_all_re('([A-Za-z]+)orn'))
+        self.assertEqual(len(found), 4)
+        self.assertEqual(found[1].match_data.group(1), b't')
+
+    def test_sub_of_sub(self):
+        data = "Lllama llama / Llama llama / I ride a / Ride a llama"
+        span = Context(data, start=21, end=43).span()
+        sub = span.sub(10, 20)
+        self.assertEqual((sub.start, sub.end), (31, 41))
+        with self.assertRaises(IndexError):
+            span.sub(10, 25)
+
+    def test_to_context(self):
+        context = Context("let's look for a needle in a haystack")
+        found = context.span().find('needle').context()
+        self.assertIsInstance(found, Context)
+        self.assertEqual((found.start, found.end), (17, 23))
+        self.assertEqual(found.string(), 'needle')
+
+
+class ReverseSearchTest(TestCase):
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(__file__), 'files', 'aristotle.html'), 'rb') as file:
+            self.context = Context(file.read(), line_separator="\n")
+
+    def assertReversed(self, forward, backward):
+        self.assertEqual(
+            [(s.start, s.end) for s in backward],
+            [(s.start, s.end) for s in reversed(list(forward))],
+        )
+
+    def test_rfind_all(self):
+        self.assertReversed(self.context.find_all('Virtue'), self.context.rfind_all('Virtue'))
+        sub = self.context.sub(1000, 50000)
+        self.assertReversed(sub.find_all('the'), sub.rfind_all('the'))
+
+    def test_rfind_all_overlapping(self):
+        context = Context("aaaaa abab ababab")
+        self.assertReversed(context.find_all('aa'), context.rfind_all('aa'))
+        self.assertReversed(context.find_all('abab'), context.rfind_all('abab'))
+
+    def test_rfind_all_re(self):
+        # Use small chunks, so that matches have to be found across many of them
+        with patch.object(context_module, 'REVERSE_SEARCH_CHUNK', 512):
+            for pattern, flags in [('virtue', 'i'), (r'<[^>\n]*>', None), (r'\w+', None), ('^', 'm'), (r'\s+', None), (r'a.*?b', 's')]:
+                with self.subTest(pattern=pattern):
+                    self.assertReversed(self.context.find_all_re(pattern, flags), self.context.rfind_all_re(pattern, flags))
+            sub = self.context.sub(1000, 50000)
+            self.assertReversed(sub.find_all_re(r'\bthe\b'), sub.rfind_all_re(r'\bthe\b'))
+
+    def test_rfind_all_re_lazy(self):
+        # Only the end of the file should be scanned to find the last match
+        with patch.object(context_module, 'REVERSE_SEARCH_CHUNK', 512):
+            calls = []
+            class Pattern:
+                def __init__(self, pattern):
+                    self.pattern, self.flags = pattern.pattern, pattern.flags
+                    self._pattern = pattern
+                def finditer(self, data, start, end):
+                    calls.append(start)
+                    return self._pattern.finditer(data, start, end)
+            import re
+            found = next(self.context.rfind_all_pattern(Pattern(re.compile(rb'</html>'))))
+            self.assertEqual(found.string(), '</html>')
+            self.assertEqual(len(calls), 1)
+            self.assertGreater(calls[0], len(self.context) - 2048)
+
+
+class PrefilterTest(TestCase):
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(__file__), 'files', 'aristotle.html'), 'rb') as file:
+            self.data = file.read()
+        self.context = Context(self.data, line_separator="\n")
+
+    def test_same_matches(self):
+        import re
+        # Use small regions, so that the lines containing the literals are searched separately
+        with patch.object(context_module, 'PREFILTER_REGION', 16):
+            for pattern in [rb'\w+tue\b', rb'(?m)the$', rb'^<html', rb'(?i)Of the', rb'<p>.*?</p>', rb'(?s)<p>.*?</p>', rb'\bthe\s+\w+']:
+                with self.subTest(pattern=pattern):
+                    pattern = re.compile(pattern)
+                    for context in (self.context, self.context.sub(1000, 50000)):
+                        self.assertEqual(
+                            [(s.start, s.end) for s in context.find_all_pattern(pattern)],
+                            [(m.start(), m.end()) for m in pattern.finditer(self.data, context.start, context.end)],
+                        )
+
+    def test_skipped(self):
+        import re
+        calls = []
+        class Pattern:
+            def __init__(self, pattern):
+                self.pattern, self.flags = pattern.pattern, pattern.flags
+                self._pattern = pattern
+            def finditer(self, data, start, end):
+                calls.append((start, end))
+                return self._pattern.finditer(data, start, end)
+        self.assertEqual(list(self.context.find_all_pattern(Pattern(re.compile(rb'\w+ zebra')))), [])
+        self.assertEqual(list(self.context.rfind_all_pattern(Pattern(re.compile(rb'\w+ zebra')))), [])
+        self.assertEqual(calls, [])
+        # Only the region around the literal is searched
+        found = list(self.context.find_all_pattern(Pattern(re.compile(rb'[a-z]+</html>'))))
+        self.assertEqual(len(found), 0)
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(calls[0][0], len(self.context) - 100)
+
+
+class BufferTest(TestCase):
+    def test_no_copy(self):
+        for data in (b'some text', bytearray(b'some text'), memoryview(b'some text')):
+            context = Context(data)
+            self.assertIs(context.data, data.obj if isinstance(data, memoryview) else data)
+            self.assertEqual(context.find('text').string(), 'text')
+
+    def test_memoryview_slice(self):
+        data = b'skip me|line1\nline2 needle\nline3 needle|skip me too'
+        context = Context(memoryview(data)[8:-12], line_separator="\n")
+        self.assertEqual(len(context), len(data) - 20)
+        self.assertEqual(list(context.split_lines_string()), ["line1\n", "line2 needle\n", "line3 needle"])
+        self.assertEqual([(s.start, s.end) for s in context.find_all('needle')], [(12, 18), (25, 31)])
+        self.assertEqual([(s.start, s.end) for s in context.rfind_all('needle')], [(25, 31), (12, 18)])
+        self.assertEqual([s.string() for s in context.find_all_re(r'line\d')], ["line1", "line2", "line3"])
+        self.assertEqual(context.find('skip'), None)
+        self.assertEqual(context.rfind('skip'), None)
+
+    def test_bytes_io(self):
+        data = io.BytesIO(b'line1\nline2\n')
+        context = Context(data)
+        self.assertEqual(context.find('line2').string(), 'line2')
+        # The buffer is viewed in place, so it can't be resized until the context is released
+        self.assertRaises(BufferError, data.write, b'line3\n')
+        context.release()
+        data.seek(0, io.SEEK_END)
+        data.write(b'line3\n')
+        self.assertEqual(data.getvalue(), b'line1\nline2\nline3\n')
+
+    def test_multibyte_text_io(self):
+        context = Context(io.StringIO('caf\u00e9 au lait'), encoding='utf-8')
+        self.assertEqual(len(context), 13)
+        self.assertEqual(context.find('lait').string(), 'lait')
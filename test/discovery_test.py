@@ -0,0 +1,100 @@
+from unittest import TestCase
+from teql import TEQL
+from teql.discovery import FileFinder, _compile_ignore_rule
+from tempfile import TemporaryDirectory
+import os
+
+class FileFinderTest(TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.temp = TemporaryDirectory()
+        os.chdir(self.temp.name)
+        os.makedirs('.git')
+        for path, data in {
+            '.gitignore': b"build/\nnode_modules\n*.log\n!keep.log\n",
+            'src/a.py': b"a\n",
+            'src/sub/b.py': b"b\n",
+            'src/sub/.hidden.py': b"h\n",
+            'src/node_modules/pkg/c.py': b"c\n",
+            'build/d.py': b"d\n",
+            'src/binary.py': b"x\0y",
+            'src/big.py': b"#" * 2000 + b"\n",
+            'src/debug.log': b"l\n",
+            'src/keep.log': b"k\n",
+        }.items():
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp.cleanup()
+
+    def test_recursive(self):
+        finder = FileFinder(use_ignore_files=False, skip_binary=False)
+        self.assertEqual(finder.find('**/*.py'), [
+            'build/d.py', 'src/a.py', 'src/big.py', 'src/binary.py', 'src/node_modules/pkg/c.py', 'src/sub/b.py',
+        ])
+        self.assertEqual(finder.find('src/*.py'), ['src/a.py', 'src/big.py', 'src/binary.py'])
+        self.assertEqual(finder.find('src/**/.*'), ['src/sub/.hidden.py'])
+
+    def test_filters(self):
+        self.assertEqual(FileFinder().find('**/*.py'), ['src/a.py', 'src/big.py', 'src/sub/b.py'])
+        self.assertEqual(FileFinder(max_file_size=1000).find('**/*.py'), ['src/a.py', 'src/sub/b.py'])
+        self.assertEqual(FileFinder().find('src/*.log'), ['src/keep.log'])
+
+    def test_parent_ignore_files(self):
+        os.chdir('src')
+        self.assertEqual(FileFinder().find('**/*'), ['a.py', 'big.py', 'keep.log', 'sub/b.py'])
+
+    def test_symlink_loop(self):
+        os.symlink('..', 'src/sub/up')
+        os.symlink('missing.py', 'src/dangling.py')
+        finder = FileFinder(use_ignore_files=False, skip_binary=False)
+        # `**` doesn't follow the link back up the tree, and the dangling link isn't a file
+        self.assertEqual(finder.find('src/**/*.py'), ['src/a.py', 'src/big.py', 'src/binary.py', 'src/node_modules/pkg/c.py', 'src/sub/b.py'])
+        # A link named in the pattern is still followed
+        self.assertEqual(finder.find('src/sub/up/*.py'), ['src/sub/up/a.py', 'src/sub/up/big.py', 'src/sub/up/binary.py'])
+
+    def test_explicit_path(self):
+        self.assertEqual(FileFinder().find('src/binary.py'), ['src/binary.py'])
+        self.assertEqual(FileFinder().find('src/missing.py'), [])
+
+    def test_cached(self):
+        finder = FileFinder()
+        self.assertEqual(finder.find('src/*.py'), ['src/a.py', 'src/big.py'])
+        with open('src/new.py', 'wb') as file:
+            file.write(b"new\n")
+        self.assertEqual(finder.find('src/*.py'), ['src/a.py', 'src/big.py'])
+        finder.invalidate()
+        self.assertEqual(finder.find('src/*.py'), ['src/a.py', 'src/big.py', 'src/new.py'])
+
+    def test_ignore_rules(self):
+        for rule, path, expected in [
+            ('*.log', 'a/b/c.log', True),
+            ('/*.log', 'a/c.log', False),
+            ('a/*.log', 'a/c.log', True),
+            ('a/*.log', 'a/b/c.log', False),
+            ('a/**/c.log', 'a/b/c/c.log', True),
+            ('**/b', 'a/b', True),
+            ('a/**', 'a/b/c', True),
+            ('[!a]b', 'cb', True),
+            ('[!a]b', 'ab', False),
+            ('\\#x', '#x', True),
+        ]:
+            with self.subTest(rule=rule, path=path):
+                pattern, negated, directories_only = _compile_ignore_rule(rule)
+                self.assertEqual(bool(pattern.match(path)), expected)
+        self.assertIsNone(_compile_ignore_rule('# comment'))
+        self.assertEqual(_compile_ignore_rule('!keep/')[1:], (True, True))
+
+    def test_teql(self):
+        teql = TEQL(line_separator="\n")
+        teql.execute('USE "src/**/*.py"')
+        self.assertEqual([path for path, context in teql._iterFileContexts()], ['src/a.py', 'src/big.py', 'src/sub/b.py'])
+        teql.execute('SET ignore = off')
+        teql.execute('SET binary = include')
+        teql.execute('SET maxfilesize = "1K"')
+        self.assertEqual([path for path, context in teql._iterFileContexts()], [
+            'src/a.py', 'src/binary.py', 'src/node_modules/pkg/c.py', 'src/sub/b.py',
+        ])
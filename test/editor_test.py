@@ -11,6 +11,11 @@ class EditorTest(TestCase):
         b''.join(Editor(context, ops))
         self.assertEqual(b''.join(Editor(context, ops)), b'a1234567890')
 
+    def test_bytes(self):
+        context = Context(memoryview(b'1234567890'))
+        ops = (Opcode.insert(5, 5, 'a'), Opcode.delete(8, 10))
+        self.assertEqual(Editor(context, ops).bytes(), b'12345a678')
+
     def test_insert_in_middle(self):
         context = Context(b'1234567890')
         ops = (Opcode.insert(5, 5, 'a'),)
@@ -87,4 +92,140 @@ class EditorTest(TestCase):
         with self.assertRaises(EditorError):
             context = Context(b'1234567890')
             ops = (Opcode.replace(7, 9, 'a'), Opcode.delete(8, 10),)
-            b''.join(Editor(context, ops))
\ No newline at end of file
+            b''.join(Editor(context, ops))
+
+from teql import editor as editor_module
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from io import BytesIO
+
+class EditorPatchTest(TestCase):
+    def setUp(self):
+        self.data = b''.join(b'line %d\n' % i for i in range(1, 21))
+        self.context = Context(self.data, line_separator="\n")
+
+    def patch(self, *ops, context_lines=3):
+        return b''.join(Editor(self.context, ops).patch(context_lines))
+
+    def test_context_lines(self):
+        self.assertEqual(self.patch(Opcode.replace(self.data.index(b'line 5'), self.data.index(b'line 5') + 6, 'five')),
+            b'--- before\n+++ after\n@@ -2,7 +2,7 @@\n line 2\n line 3\n line 4\n-line 5\n+five\n line 6\n line 7\n line 8\n')
+        self.assertEqual(self.patch(Opcode.delete(0, 7), context_lines=1),
+            b'--- before\n+++ after\n@@ -1,2 +1 @@\n-line 1\n line 2\n')
+        self.assertEqual(self.patch(Opcode.insert(len(self.context), len(self.context), 'end'), context_lines=0),
+            b'--- before\n+++ after\n@@ -20,0 +21 @@\n+end\n\\ No newline at end of file\n')
+        self.assertEqual(self.patch(), b'')
+
+    def test_hunks_merged(self):
+        line = lambda n: self.data.index(b'line %d\n' % n)
+        # Lines 3 and 9 are close enough to share context; line 17 isn't
+        patch = self.patch(Opcode.insert(line(3), line(3), 'new\n'), Opcode.delete(line(9), line(10)), Opcode.replace(line(17), line(17) + 4, 'LINE'))
+        self.assertEqual(patch.split(b'\n@@'), [
+            b'--- before\n+++ after',
+            b' -1,12 +1,12 @@\n line 1\n line 2\n+new\n line 3\n line 4\n line 5\n line 6\n line 7\n line 8\n-line 9\n line 10\n line 11\n line 12',
+            b' -14,7 +14,7 @@\n line 14\n line 15\n line 16\n-line 17\n+LINE 17\n line 18\n line 19\n line 20\n',
+        ])
+
+    def test_no_op_operations(self):
+        line = lambda n: self.data.index(b'line %d\n' % n)
+        # Empty insertions and deletions, or replacing text with itself, aren't changes
+        self.assertEqual(self.patch(Opcode.insert(0, 0, ''), Opcode.delete(line(5), line(5)), Opcode.replace(line(9), line(9) + 4, 'line')), b'')
+        self.assertEqual(self.patch(Opcode.insert(0, 0, ''), Opcode.delete(line(12), line(12)), Opcode.replace(line(12) + 5, line(12) + 7, '12'), context_lines=1), b'')
+        self.assertEqual(self.patch(Opcode.delete(line(2), line(2)), Opcode.replace(line(9), line(9) + 4, 'LINE'), context_lines=0),
+            b'--- before\n+++ after\n@@ -9 +9 @@\n-line 9\n+LINE 9\n')
+        # Changes which cancel out on a line aren't shown
+        self.assertEqual(self.patch(Opcode.delete(line(3), line(3) + 1), Opcode.insert(line(3) + 1, line(3) + 1, 'l')), b'')
+        # Or across adjacent lines (removing the line break after b, then adding one before c)
+        editor = Editor(Context(b'a\nb\n\nc\n', line_separator="\n"), (Opcode.delete(3, 4), Opcode.insert(5, 5, '\n')))
+        self.assertEqual(b''.join(editor.patch()), b'')
+
+    def test_same_and_adjacent_lines(self):
+        # Edits on one line are shown as a single change, and the lines of adjacent changes together
+        start = self.data.index(b'line 4')
+        patch = self.patch(Opcode.replace(start, start + 1, 'L'), Opcode.replace(start + 5, start + 6, 'four'), Opcode.delete(start + 7, start + 14), context_lines=0)
+        self.assertEqual(patch, b'--- before\n+++ after\n@@ -4,2 +4 @@\n-line 4\n-line 5\n+Line four\n')
+
+
+class PieceTableTest(TestCase):
+    def setUp(self):
+        self.context = Context(b'1234567890')
+        self.editor = Editor(self.context, (Opcode.insert(0, 0, 'ab'), Opcode.replace(3, 5, 'xyz'), Opcode.delete(7, 9)))
+        self.expected = b'ab123xyz670'
+
+    def test_reads(self):
+        table = self.editor.piece_table
+        self.assertEqual(len(table), len(self.expected))
+        for start in range(len(self.expected) + 1):
+            for end in range(start, len(self.expected) + 2):
+                self.assertEqual(table.bytes(start, end), self.expected[start:end])
+        self.assertEqual(table[-3:], b'670')
+        self.assertEqual(table[5], ord('x'))
+
+    def test_offsets(self):
+        table = self.editor.piece_table
+        self.assertEqual([table.to_original(offset) for offset in range(len(self.expected) + 1)], [0, 0, 0, 1, 2, 3, 3, 3, 5, 6, 9, 10])
+        # Replaced and deleted text maps to whatever replaced it
+        self.assertEqual([table.from_original(offset) for offset in range(len(self.context) + 1)], [2, 3, 4, 5, 5, 8, 9, 10, 10, 10, 11])
+
+    def test_stream(self):
+        stream = self.editor.stream
+        self.assertTrue(stream.seekable())
+        self.assertEqual(stream.read(4), b'ab12')
+        stream.seek(-3, os.SEEK_END)
+        self.assertEqual(stream.read(), b'670')
+        stream.seek(5)
+        self.assertEqual(stream.read(2), b'xy')
+        self.assertEqual(stream.tell(), 7)
+        with self.assertRaises(ValueError):
+            stream.seek(-1)
+
+
+class EditorWriteTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.source = os.path.join(self.temp.name, 'source.txt')
+        with open(self.source, 'wb') as file:
+            file.write(b'0123456789' * 1000)
+        self.ops = (Opcode.replace(5, 15, 'abc'), Opcode.insert(5000, 5000, 'def'), Opcode.delete(9990, 10000))
+        self.expected = b'01234abc56789' + b'0123456789' * 498 + b'def' + b'0123456789' * 499
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def write(self, context):
+        output = os.path.join(self.temp.name, 'output.txt')
+        with open(output, 'wb') as file:
+            Editor(context, self.ops)(file)
+        with open(output, 'rb') as file:
+            return file.read()
+
+    def test_kernel_copy(self):
+        copied = []
+        def recording_copy(source, output, offset, count):
+            copied.append((offset, count))
+            return os.sendfile(output, source, offset, count)
+        with open(self.source, 'rb') as file, patch.object(editor_module, '_KERNEL_COPIES', [recording_copy]):
+            self.assertEqual(self.write(Context(file)), self.expected)
+        self.assertEqual(copied, [(0, 5), (15, 4985), (5000, 4990)])
+
+    def test_fallbacks(self):
+        def unsupported(source, output, offset, count):
+            raise OSError('unsupported')
+        with open(self.source, 'rb') as file, patch.object(editor_module, '_KERNEL_COPIES', [unsupported]):
+            self.assertEqual(self.write(Context(file)), self.expected)
+        # Nothing to copy from
+        self.assertEqual(self.write(Context(b'0123456789' * 1000)), self.expected)
+        output = BytesIO()
+        with open(self.source, 'rb') as file:
+            Editor(Context(file), self.ops).write(output)
+        self.assertEqual(output.getvalue(), self.expected)
+
+    def test_source_changed(self):
+        with open(self.source, 'rb') as file:
+            context = Context(file)
+        # Replaced since it was mapped, so can't be copied from
+        os.rename(self.source, self.source + '.old')
+        with open(self.source, 'wb') as file:
+            file.write(b'x' * 10000)
+        self.assertIsNone(context._open_source())
+        self.assertEqual(self.write(context), self.expected)
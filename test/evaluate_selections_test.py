@@ -183,3 +183,41 @@ in our own power, and so voluntary, the originations of which are in ourselves.
         self.assertEqual(len(results), 1, 'One cursor is returned')
         self.assertEqual(len(results[0]), 0, 'The selection is a cursor (no length)')
         self.assertEqual(results[0].start, 12, 'Cursor at the specified location')
+
+    def test_after_selection_in_sub_context(self):
+        line = next(self.teql._evaluateSelection(ast.DirectLineSelection([ast.RangeIndexIndex(2549)]), self.context))
+        results = list(self.teql._evaluateSelection(ast.SelectionAfterSelection(ast.FindSelection('respect')), line))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].string(), ' of truth:\n')
+
+    def test_compiled_plan_reused(self):
+        plan = self.teql._compileSelection(ast.SubSelection(ast.FindSelection('sweet'), ast.DirectLineSelection([ast.RangeIndexIndex(7120)])))
+        first_run = [(r.start, r.end) for r in plan(self.context)]
+        second_run = [(r.start, r.end) for r in plan(self.context)]
+        self.assertEqual(len(first_run), 1)
+        self.assertEqual(first_run, second_run)
+
+
+    def test_direct_line_selection_negative_range(self):
+        results = list(self.teql._evaluateSelection(ast.DirectLineSelection([ast.RangeIndexRange(-3, -1)]), self.context))
+        self.assertEqual([r.string() for r in results], ['\n', '</section></body>\n', '</html>\n'])
+
+    def test_line_selection_uses_line_index(self):
+        # Addressing lines by number must not split the file into lines
+        from unittest.mock import patch
+        from teql.context import _Selectable
+        with patch.object(_Selectable, 'split_lines', side_effect=AssertionError('split_lines called')):
+            results = list(self.teql._evaluateSelection(ast.DirectLineSelection([ast.RangeIndexIndex(2549), ast.RangeIndexLast()]), self.context))
+            self.assertEqual([r.string() for r in results], ["I. In respect of truth:\n", '</html>\n'])
+            results = list(self.teql._evaluateSelection(ast.RangeIndexSelection([ast.RangeIndexRange(5446, 5447)], ast.SelectionLineSelection(ast.FileSelection())), self.context))
+            self.assertEqual(len(results), 2)
+
+    def test_direct_line_selection_in_sub_context(self):
+        block = self.context.sub(self.context.file_map.line_to_cursor(2548) + 3, self.context.file_map.line_to_cursor(2551))
+        results = list(self.teql._evaluateSelection(ast.DirectLineSelection([ast.RangeIndexIndex(2)]), block))
+        self.assertEqual([r.string() for r in results], ["I. In respect of truth:\n"])
+
+    def test_cursor_line_selection_at_line_start(self):
+        cursor = self.context.file_map.line_to_cursor(2549)
+        results = list(self.teql._evaluateSelection(ast.CursorLineSelection(ast.SeekCursor(cursor)), self.context))
+        self.assertEqual([r.string() for r in results], ["I. In respect of truth:\n"])
@@ -34,4 +34,92 @@ class EvaluateUpdatesTest(TestCase):
         editor = list(result)[0][1]
         self.assertEqual(list(editor.operations), [
             Opcode.insert(451, 451, " [gruff, rough-mannered, ill-tempered]"),
-        ])
\ No newline at end of file
+        ])
+
+    def test_change_mapping(self):
+        # CHANGE USING MAPPING $1; (with a dict bound)
+        result = self.teql._evaluateUpdateQuery(ast.ChangeMappingQuery({'mim': 'X', 'mimsy': 'flimsy', 'uffish': 'gruff'}))
+        editor = list(result)[0][1]
+        # The longest key wins where one is a prefix of another
+        self.assertEqual(list(editor.operations), [
+            Opcode.replace(79, 84, "flimsy"),
+            Opcode.replace(445, 451, "gruff"),
+            Opcode.replace(957, 962, "flimsy"),
+        ])
+
+    def test_change_mapping_file(self):
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'renames.tsv')
+            with open(path, 'w') as file:
+                file.write("mimsy\tflimsy\n\nuffish\tgruff\n")
+            result = self.teql._evaluateUpdateQuery(ast.ChangeMappingQuery(path))
+            editor = list(result)[0][1]
+        self.assertEqual(list(editor.operations), [
+            Opcode.replace(79, 84, "flimsy"),
+            Opcode.replace(445, 451, "gruff"),
+            Opcode.replace(957, 962, "flimsy"),
+        ])
+
+
+    def test_edit_in_memory(self):
+        data = bytearray(b'one two three\ntwo three four\n')
+        result = self.teql.edit(memoryview(data), 'CHANGE FIND "two" TO $1; DELETE FIND "four"', '2')
+        self.assertEqual(result, b'one 2 three\n2 three \n')
+        # The buffer itself is not modified
+        self.assertEqual(data, b'one two three\ntwo three four\n')
+
+    def test_edit_bytes_io(self):
+        from io import BytesIO
+        from teql.exceptions import TEQLException
+        data = BytesIO(b'one two three\n')
+        self.assertEqual(self.teql.edit(data, 'CHANGE FIND "two" TO "2"'), b'one 2 three\n')
+        try:
+            self.teql.edit(data, 'CHANGE FIND "two" TO $missing')
+        except TEQLException as e:
+            error = e
+        # Even while the traceback (and the frames it references) is kept, the buffer is no longer viewed
+        self.assertIsNotNone(error.__traceback__)
+        data.write(b'ONE')
+        self.assertEqual(data.getvalue(), b'ONE two three\n')
+
+    def test_file_map_kept_after_update(self):
+        from tempfile import TemporaryDirectory
+        from teql.file_map import FileMap
+        import shutil
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'jabberwocky.txt')
+            shutil.copyfile('files/jabberwocky.txt', path)
+            teql = TEQL(line_separator="\n")
+            teql.execute(f'USE "{path}"')
+            teql.execute('DELETE LINE 2')
+            teql.execute('CHANGE FIND "mimsy" TO $1', "miserable\nand flimsy")
+            path, context = next(teql._iterFileContexts())
+            # Updated from the map of the previous query, rather than waiting to be built from scratch
+            self.assertIsNotNone(context._file_map)
+            self.assertEqual(list(context._file_map.linebreaks), list(FileMap.from_data(context.data, b"\n").linebreaks))
+            context.data.close()
+
+    def test_preview_diff(self):
+        from contextlib import redirect_stdout
+        from io import StringIO
+        teql = TEQL(line_separator="\n")
+        teql.execute('USE "files/jabberwocky.txt"')
+        teql.execute('SET diffcontext = 1')
+        output = StringIO()
+        with redirect_stdout(output):
+            teql.execute('PREVIEW DIFF CHANGE FIND "mimsy" TO "flimsy"')
+        self.assertEqual(output.getvalue(), ''.join([
+            "--- files/jabberwocky.txt\n+++ files/jabberwocky.txt\n",
+            "@@ -2,3 +2,3 @@\n       Did gyre and gimble in the wabe:\n-All mimsy were the borogoves,\n+All flimsy were the borogoves,\n       And the mome raths outgrabe.\n",
+            # The last line of the file has no line break
+            "@@ -32,3 +32,3 @@\n       Did gyre and gimble in the wabe:\n-All mimsy were the borogoves,\n+All flimsy were the borogoves,\n       And the mome raths outgrabe.\n\\ No newline at end of file\n",
+        ]))
+        # Nothing is written
+        self.assertEqual(next(teql._iterFileContexts())[1].string().count('mimsy'), 2)
+        # Queries which change nothing give no diff
+        output = StringIO()
+        with redirect_stdout(output):
+            teql.execute('PREVIEW DIFF DELETE FIND /q*/')
+            teql.execute('PREVIEW DIFF INSERT "" AT START')
+        self.assertEqual(output.getvalue(), '')
@@ -0,0 +1,41 @@
+from unittest import TestCase
+from teql import TEQL
+from teql.teql import ExplainResult
+import os
+
+class ExplainTest(TestCase):
+    def setUp(self):
+        os.chdir(os.path.join(os.path.dirname(__file__)))
+        self.teql = TEQL()
+        self.teql.use = 'files/jabberwocky.txt'
+
+    def test_explain_shows_optimized_plan(self):
+        result = self.teql.execute('EXPLAIN SHOW FIND "mimsy" IN LINES IN FILE')
+        self.assertIsInstance(result, ExplainResult)
+        self.assertEqual(result.plan, [
+            "SubSelection",
+            "  FindSelection expression='mimsy'",
+            "  FileSelection",
+        ])
+
+    def test_explain_update(self):
+        result = self.teql.execute('EXPLAIN DELETE EVERYTHING AFTER FIND "mimsy"')
+        self.assertEqual(result.plan, [
+            "SelectionAfterSelection",
+            "  FindLastSelection expression='mimsy'",
+        ])
+
+    def test_explain_analyze(self):
+        result = self.teql.execute('EXPLAIN ANALYZE SHOW FIND "the" IN LINES 1:4')
+        self.assertEqual(result.files, 1)
+        self.assertEqual(len(result.plan), 3)
+        self.assertRegex(result.plan[0], r"^SubSelection \(time=[0-9.]+ms produced=4 bytes=1017 files=1 loops=1\)$")
+        self.assertRegex(result.plan[1], r"^  FindSelection expression='the' \(time=[0-9.]+ms produced=4 bytes=\d+ files=1 loops=4\)$")
+        self.assertRegex(result.plan[2], r"^  DirectLineSelection ranges=1:4 \(time=[0-9.]+ms produced=4 bytes=1017 files=1 loops=1\)$")
+
+    def test_explain_analyze_does_not_write(self):
+        with open('files/jabberwocky.txt', 'rb') as file:
+            before = file.read()
+        self.teql.execute('EXPLAIN ANALYZE CHANGE FIND "mimsy" TO "flimsy"')
+        with open('files/jabberwocky.txt', 'rb') as file:
+            self.assertEqual(file.read(), before)
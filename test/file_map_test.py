@@ -1,11 +1,37 @@
+from teql import file_map as file_map_module
 from teql.file_map import FileMap
+from teql.context import Context
+from teql.editor import Editor
+from teql.operation import Opcode
+from array import array
 import os
-from unittest import TestCase
+import re
+from unittest import TestCase, mock
 class FileMapTest(TestCase):
     def setUp(self):
         with open(os.path.join(os.path.dirname(__file__), 'files/jabberwocky.txt') ,'rb') as file:
             self.file_map = FileMap.from_lines(file)
 
+    def test_from_data(self):
+        with open(os.path.join(os.path.dirname(__file__), 'files/jabberwocky.txt') ,'rb') as file:
+            file_map = FileMap.from_data(file.read(), b"\n")
+        self.assertEqual(file_map.linebreaks, self.file_map.linebreaks)
+        self.assertEqual(file_map.filesize, self.file_map.filesize)
+        self.assertIsInstance(file_map.linebreaks, array)
+
+    def test_from_data_in_chunks(self):
+        data = b"ab\r\ncd\r\n\r\ne\nf\rg\r\n"
+        for separator in (b"\n", b"\r\n", b"\r"):
+            expected = [m.end() for m in re.finditer(re.escape(separator), data)]
+            for numpy in (False, None):
+                for chunk in (1, 2, 3, 7, 1024):
+                    with self.subTest(separator=separator, numpy=numpy is None, chunk=chunk), \
+                            mock.patch.object(file_map_module, 'SCAN_CHUNK', chunk), \
+                            mock.patch.object(file_map_module, '_numpy_module', numpy):
+                        file_map = FileMap.from_data(data, separator)
+                        self.assertEqual(list(file_map.linebreaks), expected)
+                        self.assertEqual(file_map.filesize, len(data))
+
     def test_cursor_at_zero(self):
         self.assertEqual(self.file_map.cursor_to_line_col(0), (1,1))
 
@@ -57,5 +83,24 @@ class FileMapTest(TestCase):
 
     def test_line_to_start_end_cursor_last(self):
         self.assertEqual(self.file_map.line_to_start_end_cursor(34), (983,1017))
-    
-        
\ No newline at end of file
+
+    def test_apply(self):
+        data = b"one\r\ntwo\r\nthree\r\nfour"
+        ops = [Opcode.insert(0, 0, "zero\r\n"), Opcode.replace(5, 10, "2\r\n2b"), Opcode.delete(16, 17)]
+        edited = b''.join(Editor(Context(data), ops))
+        self.assertEqual(edited, b"zero\r\none\r\n2\r\n2bthree\rfour")
+        file_map = FileMap.from_data(data, b"\r\n").apply(ops, b"\r\n", 'utf-8', data)
+        self.assertEqual(list(file_map.linebreaks), [6, 11, 14])
+        self.assertEqual(file_map.filesize, len(edited))
+        self.assertEqual(file_map.line_to_start_end_cursor(3), (11, 14))
+        self.assertEqual(file_map.cursor_to_line_col(20), (4, 7))
+        # Completing a separator with an edit
+        file_map = file_map.apply([Opcode.insert(22, 22, "\n")], b"\r\n", 'utf-8', edited)
+        self.assertEqual(list(file_map.linebreaks), [6, 11, 14, 23])
+        self.assertEqual(file_map.filesize, len(edited) + 1)
+
+    def test_apply_in_place(self):
+        file_map = self.file_map.apply([Opcode.delete(0, 36), Opcode.insert(1017, 1017, "\n")], b"\n", 'utf-8')
+        self.assertEqual(len(file_map.linebreaks), len(self.file_map.linebreaks))
+        self.assertEqual(file_map.line_to_start_end_cursor(6), (173-36, 221-36))
+        self.assertEqual(file_map.line_to_start_end_cursor(33), (983-36, 1017-36+1))
@@ -0,0 +1,78 @@
+from unittest import TestCase, mock
+from teql import TEQL
+from teql.context import Context
+from teql.file_map import FileMap
+from teql.index_cache import LineIndexCache
+from tempfile import TemporaryDirectory
+import os, shutil
+
+class LineIndexCacheTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.directory = os.path.join(self.temp.name, 'cache')
+        self.cache = LineIndexCache(self.directory, min_file_size=0)
+        self.path = os.path.join(self.temp.name, 'jabberwocky.txt')
+        shutil.copyfile(os.path.join(os.path.dirname(__file__), 'files', 'jabberwocky.txt'), self.path)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def file_map(self, cache=None):
+        with open(self.path, 'r+b') as file:
+            return Context(file, line_separator="\n", index_cache=cache or self.cache).file_map
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.idx'))
+
+    def test_reused(self):
+        built = self.file_map()
+        self.assertEqual(len(self.entries()), 1)
+        with mock.patch.object(FileMap, 'from_data', side_effect=AssertionError('rescanned')):
+            loaded = self.file_map()
+        self.assertIsInstance(loaded.linebreaks, memoryview)
+        self.assertEqual(list(loaded.linebreaks), list(built.linebreaks))
+        self.assertEqual(loaded.filesize, built.filesize)
+        self.assertEqual(loaded.line_to_start_end_cursor(7), (173,221))
+        self.assertEqual(loaded.cursor_to_line_col(999), (34,17))
+
+    def test_invalidated(self):
+        self.file_map()
+        old_entries = self.entries()
+        with open(self.path, 'ab') as file:
+            file.write(b"\nCallooh! Callay!\n")
+        file_map = self.file_map()
+        self.assertEqual(len(file_map.linebreaks), 35)
+        # The stale index was replaced
+        self.assertEqual(len(self.entries()), 1)
+        self.assertNotEqual(self.entries(), old_entries)
+
+    def test_small_files_not_cached(self):
+        self.file_map(LineIndexCache(self.directory, min_file_size=1024*1024))
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_evicts_least_recently_used(self):
+        # Each index is 800 bytes, so only two fit
+        cache = LineIndexCache(self.directory, max_size=1600, min_file_size=0)
+        stats = []
+        for i in range(3):
+            path = os.path.join(self.temp.name, f"{i}.txt")
+            with open(path, 'wb') as file:
+                file.write(b"line\n" * 100)
+            with open(path, 'r+b') as file:
+                stats.append((path, os.fstat(file.fileno())))
+                Context(file, line_separator="\n", index_cache=cache).file_map
+            # Give each index a distinct age, in case the timestamps are coarse
+            for entry in os.scandir(self.directory):
+                if entry.stat().st_mtime_ns > 10**9 * 10:
+                    os.utime(entry.path, (i, i))
+        self.assertEqual(len(self.entries()), 2)
+        self.assertIsNone(cache.load(*stats[0], b"\n"))
+        self.assertIsNotNone(cache.load(*stats[2], b"\n"))
+
+    def test_teql(self):
+        teql = TEQL(line_separator="\n", index_cache=self.cache)
+        teql.execute(f'USE "{self.path}"')
+        teql.execute('DELETE LINE 2')
+        with open(self.path, 'rb') as file:
+            self.assertTrue(file.read().startswith(b"'Twas brillig, and the slithy toves\nAll mimsy"))
+        self.assertEqual(len(self.entries()), 1)
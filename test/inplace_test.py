@@ -0,0 +1,66 @@
+from unittest import TestCase
+from teql import TEQL
+from teql import inplace
+from teql.inplace import journal_path, recover_journal, _write_journal
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+import os
+
+class InPlaceTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.path = os.path.join(self.temp.name, 'jabberwocky.txt')
+        self.text = b"'Twas brillig, and the slithy toves\nDid gyre and gimble in the wabe:\nAll mimsy were the borogoves,\nAnd the mome raths outgrabe.\n"
+        with open(self.path, 'wb') as file:
+            file.write(self.text)
+        self.teql = TEQL(line_separator="\n")
+        self.teql.execute(f'USE "{self.path}"')
+        self.teql.execute('SET write_mode = inplace')
+        self.inode = os.stat(self.path).st_ino
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def assertPatched(self, expected):
+        self.assertEqual(self.read(), expected)
+        self.assertEqual(os.stat(self.path).st_ino, self.inode)
+        self.assertFalse(os.path.exists(journal_path(self.path)))
+
+    def test_same_length(self):
+        self.teql.execute('CHANGE FIND "mimsy" TO "flimy"')
+        self.assertPatched(self.text.replace(b'mimsy', b'flimy'))
+        # The session sees the change
+        self.assertEqual([context.string() for path, context in self.teql._iterFileContexts()], [self.text.replace(b'mimsy', b'flimy').decode()])
+
+    def test_tail(self):
+        self.teql.execute('CHANGE FIND "toves" TO "coves"')
+        self.teql.execute('CHANGE FIND "outgrabe" TO "out grabbed"')
+        self.assertPatched(self.text.replace(b'toves', b'coves').replace(b'outgrabe', b'out grabbed'))
+        self.teql.execute('DELETE FIND $1', "And the mome raths out grabbed.\n")
+        self.assertPatched(self.text.replace(b'toves', b'coves').replace(b"And the mome raths outgrabe.\n", b''))
+
+    def test_size_changed_mid_file(self):
+        with patch.object(inplace, 'MAX_TAIL', 16):
+            self.teql.execute('CHANGE FIND "brillig" TO "bright"')
+        self.assertEqual(self.read(), self.text.replace(b'brillig', b'bright'))
+        self.assertNotEqual(os.stat(self.path).st_ino, self.inode) # Replaced with a new copy
+
+    def test_recover(self):
+        # As if the process died after patching the file, but before deleting the journal
+        _write_journal(self.path, len(self.text), [(6, b'brillig'), (100, self.text[100:])])
+        with open(self.path, 'r+b') as file:
+            file.seek(6)
+            file.write(b'BRILLIG')
+            file.seek(100)
+            file.write(b'and more text than there was')
+        self.assertEqual([context.string() for path, context in self.teql._iterFileContexts()], [self.text.decode()])
+        self.assertPatched(self.text)
+        # An incomplete journal means the file was never changed
+        with open(journal_path(self.path), 'wb') as file:
+            file.write(b'TEQLJRN1\0\0')
+        self.assertFalse(recover_journal(self.path))
+        self.assertPatched(self.text)
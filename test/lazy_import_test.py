@@ -0,0 +1,15 @@
+from unittest import TestCase
+import subprocess, sys, os
+
+class LazyImportTest(TestCase):
+    def test_cli_does_not_load_engine(self):
+        code = "import sys, teql.cli; print(sorted(m for m in ('teql.teql', 'lark', 'multiprocessing', 'concurrent.futures', 'readline') if m in sys.modules))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_shell_module_does_not_load_readline(self):
+        code = "import sys, teql.interactive_shell; print('readline' in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), 'False')
@@ -0,0 +1,68 @@
+from unittest import TestCase
+from teql import TEQL
+from teql import ast
+from teql.compiler import SelectionCompiler
+from teql.optimizer import optimize
+import os
+
+class OptimizerTest(TestCase):
+    def setUp(self):
+        os.chdir(os.path.join(os.path.dirname(__file__)))
+        self.teql = TEQL()
+        self.teql.use = 'files/aristotle.html'
+        self.context = next(self.teql._iterFileContexts())[1]
+
+    def assertSameResults(self, selector):
+        unoptimized = SelectionCompiler(self.teql._resolveVariable).compile(selector)
+        expected = [(s.start, s.end) for s in unoptimized(self.context)]
+        actual = [(s.start, s.end) for s in self.teql._evaluateSelection(selector, self.context)]
+        self.assertEqual(actual, expected)
+
+    def test_first_of_find(self):
+        selector = ast.RangeIndexSelection([ast.RangeIndexFirst()], ast.FindSelection('Virtue'))
+        self.assertEqual(optimize(selector), ast.FindFirstSelection('Virtue'))
+        self.assertSameResults(selector)
+
+    def test_last_of_find(self):
+        selector = ast.RangeIndexSelection([ast.RangeIndexLast()], ast.FindSelection(ast.LiteralRegex('virtue', 'i')))
+        self.assertEqual(optimize(selector), ast.FindLastSelection(ast.LiteralRegex('virtue', 'i')))
+        self.assertSameResults(selector)
+
+    def test_last_n_of_find(self):
+        selector = ast.RangeIndexSelection([ast.RangeIndexLast(3)], ast.FindSelection(ast.LiteralRegex('virtue', 'i')))
+        self.assertEqual(optimize(selector), ast.FindLastSelection(ast.LiteralRegex('virtue', 'i'), 3))
+        self.assertSameResults(selector)
+
+    def test_range_of_lines_in_file(self):
+        selector = ast.RangeIndexSelection([ast.RangeIndexFirst(3), ast.RangeIndexRange(5446, 5450)], ast.SelectionLineSelection(ast.FileSelection()))
+        self.assertEqual(optimize(selector), ast.SubSelection(ast.DirectLineSelection(selector.ranges), ast.FileSelection()))
+        self.assertSameResults(selector)
+
+    def test_everything_after_find(self):
+        selector = ast.SelectionAfterSelection(ast.FindSelection('Virtue'))
+        self.assertEqual(optimize(selector), ast.SelectionAfterSelection(ast.FindLastSelection('Virtue')))
+        self.assertSameResults(selector)
+
+    def test_between_finds(self):
+        selector = ast.BetweenSelection(ast.FindSelection('<body'), ast.FindSelection('</body>'))
+        self.assertEqual(optimize(selector), ast.BetweenSelection(ast.FindFirstSelection('<body'), ast.FindLastSelection('</body>')))
+        self.assertSameResults(selector)
+
+    def test_find_in_lines_in_file(self):
+        selector = ast.SubSelection(ast.FindSelection('sweet'), ast.SelectionLineSelection(ast.FileSelection()))
+        self.assertEqual(optimize(selector), ast.SubSelection(ast.FindSelection('sweet'), ast.FileSelection()))
+        self.assertSameResults(selector)
+
+    def test_find_in_lines_in_selection(self):
+        selector = ast.SubSelection(ast.FindSelection('virtue'), ast.SelectionLineSelection(ast.SubstringSelection(389500, 400000)))
+        self.assertEqual(optimize(selector), ast.SubSelection(ast.FindSelection('virtue'), ast.CursorLineSelection(ast.SubstringSelection(389500, 400000))))
+        self.assertSameResults(selector)
+
+    def test_regex_in_lines_not_rewritten(self):
+        selector = ast.SubSelection(ast.FindSelection(ast.LiteralRegex(r'\s+')), ast.SelectionLineSelection(ast.FileSelection()))
+        self.assertEqual(optimize(selector), selector)
+
+    def test_original_not_modified(self):
+        selector = ast.SelectionAfterSelection(ast.FindSelection('Virtue'))
+        optimize(selector)
+        self.assertEqual(selector, ast.SelectionAfterSelection(ast.FindSelection('Virtue')))
@@ -0,0 +1,80 @@
+from unittest import TestCase
+from teql import TEQL
+from teql import ast
+from teql.index_cache import LineIndexCache
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from io import StringIO
+import os
+
+class ParallelTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        for i in range(12):
+            with open(os.path.join(self.temp.name, f"{i:02}.txt"), 'wb') as file:
+                file.write(f"file {i}\nthe mimsy borogoves\nand the mome raths\n".encode())
+        self.pattern = os.path.join(self.temp.name, '*.txt')
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def session(self, jobs):
+        teql = TEQL(line_separator="\n", jobs=jobs)
+        teql.execute(f'USE "{self.pattern}"')
+        return teql
+
+    def show(self, teql, query):
+        output = StringIO()
+        with redirect_stdout(output):
+            teql.execute(query)
+        return output.getvalue()
+
+    def test_show(self):
+        query = 'SHOW FIND LINES WITH /m\\w+/'
+        parallel = self.session(2)
+        self.assertEqual(self.show(parallel, query), self.show(self.session(1), query))
+        self.assertIsNotNone(parallel._parallel)
+        parallel.close()
+        self.assertIsNone(parallel._parallel)
+        # Workers are started again when needed
+        self.assertEqual(self.show(parallel, query), self.show(self.session(1), query))
+        parallel.close()
+
+    def test_show_opens_only_matching_files(self):
+        parallel = self.session(2)
+        self.assertEqual(self.show(parallel, 'SHOW FIND "file 3"'), "file 3\n")
+        self.assertEqual(len(parallel.context_pool), 1)
+        parallel.close()
+
+    def test_select(self):
+        query = ast.SelectQuery([ast.SelectValue(ast.FindSelection('the'), None)], self.pattern)
+        parallel = self.session(3)
+        stores = parallel._executeSelectQuery(query).fetch_all()
+        self.assertEqual(
+            [(store[0], list(store[1])) for store in stores],
+            [(store[0], list(store[1])) for store in self.session(1)._executeSelectQuery(query).fetch_all()],
+        )
+        self.assertEqual(len(stores), 12)
+        parallel.close()
+
+    def test_update(self):
+        teql = self.session(1)
+        teql.execute('SET jobs = 4')
+        self.show(teql, 'SHOW FIND "mimsy"') # Opens each file in the session's pool
+        teql.execute('CHANGE FIND "mimsy" TO "flimsy"')
+        for i in range(12):
+            with open(os.path.join(self.temp.name, f"{i:02}.txt"), 'rb') as file:
+                self.assertEqual(file.read(), f"file {i}\nthe flimsy borogoves\nand the mome raths\n".encode())
+        # The session sees the rewritten files
+        self.assertEqual(self.show(teql, 'SHOW FIND /\\w+msy/'), "flimsy\n" * 12)
+        teql.close()
+
+    def test_index_cache(self):
+        directory = os.path.join(self.temp.name, 'cache')
+        teql = TEQL(line_separator="\n", jobs=2, index_cache=LineIndexCache(directory, min_file_size=0))
+        teql.execute(f'USE "{self.pattern}"')
+        query = 'SHOW LINE 2'
+        self.assertEqual(self.show(teql, query), self.show(self.session(1), query))
+        # The workers map the files, so they must be the ones to fill the cache
+        self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.idx')]), 12)
+        teql.close()
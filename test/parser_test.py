@@ -66,3 +66,109 @@
     #     self.assertEqual(result.offset, -1)
     #     self.assertEqual(result.from_end, False)
         
+
+
+from unittest import TestCase
+from teql.parser import parse
+from teql import ast
+
+class ParserModeTest(TestCase):
+    def assertSameParse(self, query):
+        self.assertEqual(parse(query, 'lalr'), parse(query, 'earley'), query)
+
+    def test_lalr_matches_earley(self):
+        self.assertSameParse('SHOW LINE 5')
+        self.assertSameParse('SHOW LINES -5:-1')
+        self.assertSameParse('SHOW FIRST 3 LINES IN FILE')
+        self.assertSameParse('SHOW EVERYTHING AFTER FIND /end/i')
+        self.assertSameParse('SHOW FIND LINES WITH "cheese"')
+        self.assertSameParse('SHOW BETWEEN FIND "a" AND FIND "b"')
+        self.assertSameParse('USE "file with spaces.txt"; SET linenumbers = on')
+        self.assertSameParse('CHANGE FIND "thisname" TO "othername"')
+        self.assertSameParse('DELETE EVERYTHING BEFORE LINE 3 IN FIND "x"')
+        self.assertSameParse('CHANGE USING MAPPING "renames.tsv"')
+        self.assertSameParse('CHANGE USING MAPPING $renames')
+        self.assertSameParse('PREVIEW DIFF CHANGE FIND "thisname" TO "othername"')
+        self.assertSameParse('SET jobs = 4; SET diffcontext 0')
+
+    def test_preview(self):
+        query, = parse('PREVIEW DIFF DELETE LINE 3')
+        self.assertIsInstance(query, ast.PreviewQuery)
+        self.assertTrue(query.is_diff)
+        self.assertIsInstance(query.query, ast.DeleteQuery)
+        query, = parse('preview insert "x" at start')
+        self.assertFalse(query.is_diff)
+
+    def test_offset_cursor_forms(self):
+        self.assertSameParse('INSERT "a" AT 3 AFTER FIND "x"')
+        self.assertSameParse('INSERT "a" AT 3 BEFORE FIND "x" IN LINE 4')
+        self.assertSameParse('INSERT "a" AT AFTER FIND "x"')
+
+    def test_chained_in_and_of(self):
+        self.assertSameParse('SHOW 2 OF FIND "x" IN LINES 4:8')
+        self.assertSameParse('SHOW FIND "a" IN FIND "b" IN LINE 3')
+        self.assertSameParse('SHOW 2 OF FIND "x" IN LINE 3 IN FIND "y"')
+        self.assertSameParse('SHOW 1 OF 2 OF FIND "x" IN LINE 3')
+        self.assertSameParse('INSERT "a" AT START IN FIND "x" IN LINE 3')
+        self.assertSameParse('SHOW LINE START IN FIND "a" IN LINE 3')
+        self.assertSameParse('DELETE FIND "a" IN EVERYTHING AFTER LINE 3 IN LINES 4:8')
+        self.assertSameParse('DELETE FROM FILE TO FIND "b" IN FIND "a" IN LINE 3')
+        self.assertSameParse('INDENT 2 LINE START OR EVERYTHING AFTER FILE OR LINE 3')
+        query, = parse('SHOW 2 OF FIND "x" IN LINES 4:8')
+        self.assertIsInstance(query.value.value, ast.SubSelection)
+        self.assertIsInstance(query.value.value.inner, ast.RangeIndexSelection)
+        query, = parse('SHOW FIND "a" IN FIND "b" IN LINE 3')
+        self.assertIsInstance(query.value.value.inner, ast.SubSelection)
+
+
+from teql.parser import split_statements
+import io
+
+class SplitStatementsTest(TestCase):
+    def assertSplit(self, script, expected):
+        self.assertEqual([s.strip() for s in split_statements(script)], expected)
+        # The result must not depend on how the script is chunked
+        self.assertEqual([s.strip() for s in split_statements(io.StringIO(script))], expected)
+        self.assertEqual([s.strip() for s in split_statements(list(script))], expected)
+
+    def test_simple(self):
+        self.assertSplit('SHOW LINE 1; SHOW LINE 2;', ['SHOW LINE 1', 'SHOW LINE 2'])
+
+    def test_semicolons_in_strings_and_regexes(self):
+        self.assertSplit(r'SHOW FIND "a;\";b"; SHOW FIND /x;y/i; SHOW FIND LINE WITH ";"', [
+            r'SHOW FIND "a;\";b"', 'SHOW FIND /x;y/i', 'SHOW FIND LINE WITH ";"'
+        ])
+
+    def test_semicolons_in_comments(self):
+        self.assertSplit('SHOW LINE 1 -- a;b\n; /* c; d */ SHOW LINE 2 # e;f\n', [
+            'SHOW LINE 1 -- a;b', '/* c; d */ SHOW LINE 2 # e;f'
+        ])
+
+    def test_paths(self):
+        self.assertSplit('USE lines/file.txt; USE /tmp/x.txt; SHOW LINE 1', ['USE lines/file.txt', 'USE /tmp/x.txt', 'SHOW LINE 1'])
+
+    def test_transaction(self):
+        self.assertSplit('BEGIN; DELETE LINE 1; DELETE LINE 2; COMMIT; SHOW LINE 1', [
+            'BEGIN; DELETE LINE 1; DELETE LINE 2; COMMIT', 'SHOW LINE 1'
+        ])
+
+    def test_empty_statements(self):
+        self.assertSplit(' ; ;\n-- nothing here;\n', [])
+
+    def test_incremental(self):
+        read = []
+        def script():
+            for line in ('SHOW LINE 1;\n', 'SHOW LINE 2;\n', 'SHOW LINE 3;\n'):
+                read.append(line)
+                yield line
+        statements = split_statements(script())
+        self.assertEqual(next(statements).strip(), 'SHOW LINE 1')
+        self.assertEqual(len(read), 1)
+
+    def test_large_script(self):
+        # Split statements are dropped from the buffer in bulk, so this takes linear time
+        script = ''.join(f'CHANGE FIND "a;{i}" TO "b"; # {i};\n' for i in range(100000))
+        statements = list(split_statements(script))
+        self.assertEqual(len(statements), 100000)
+        self.assertEqual(statements[0], 'CHANGE FIND "a;0" TO "b"')
+        self.assertEqual(statements[-1], ' # 99998;\nCHANGE FIND "a;99999" TO "b"')
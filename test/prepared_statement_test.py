@@ -0,0 +1,51 @@
+from unittest import TestCase
+from teql import TEQL, TEQLException
+from teql import ast
+from teql.operation import Opcode
+import os
+
+class PreparedStatementTest(TestCase):
+    def setUp(self):
+        os.chdir(os.path.join(os.path.dirname(__file__)))
+        self.teql = TEQL()
+        self.teql.use = 'files/jabberwocky.txt'
+
+    def test_bind_positional(self):
+        statement = self.teql.prepare('CHANGE FIND $1 TO $2')
+        query = statement.bind('mimsy', 'miserable and flimsy')[0]
+        editor = list(self.teql._evaluateUpdateQuery(query))[0][1]
+        self.assertEqual(list(editor.operations), [
+            Opcode.replace(79, 84, "miserable and flimsy"),
+            Opcode.replace(957, 962, "miserable and flimsy"),
+        ])
+
+    def test_bind_named(self):
+        statement = self.teql.prepare('CHANGE $old TO $new')
+        query = statement.bind(old='uffish', new='gruff')[0]
+        editor = list(self.teql._evaluateUpdateQuery(query))[0][1]
+        self.assertEqual(list(editor.operations), [
+            Opcode.replace(445, 451, "gruff"),
+        ])
+
+    def test_bind_does_not_modify_statement(self):
+        statement = self.teql.prepare('CHANGE FIND $1 TO $2')
+        statement.bind('a', 'b')
+        self.assertEqual(statement.queries[0].replacement, ast.Variable([2]))
+
+    def test_unbound_uses_session_variable(self):
+        self.teql.execute('SET $needle = "mimsy"')
+        query = self.teql.prepare('SHOW FIND $needle').bind()[0]
+        context = next(self.teql._iterFileContexts())[1]
+        results = list(self.teql._evaluateSelection(query.value.value, context))
+        self.assertEqual(len(results), 2)
+
+    def test_unbound_variable(self):
+        query = self.teql.prepare('SHOW FIND $missing').bind()[0]
+        context = next(self.teql._iterFileContexts())[1]
+        with self.assertRaises(TEQLException):
+            list(self.teql._evaluateSelection(query.value.value, context))
+
+    def test_plan_cache(self):
+        first = self.teql.prepare('SHOW LINE 3')
+        second = self.teql.prepare('  SHOW LINE 3;\n')
+        self.assertIs(first.queries, second.queries)
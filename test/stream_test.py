@@ -0,0 +1,56 @@
+from unittest import TestCase
+from teql import TEQL, TEQLException
+from teql.stream import split_lines
+from io import BytesIO
+import os
+
+class StreamTest(TestCase):
+    def setUp(self):
+        self.teql = TEQL(line_separator="\n")
+        with open(os.path.join(os.path.dirname(__file__), 'files', 'jabberwocky.txt'), 'rb') as file:
+            self.data = file.read()
+
+    def stream(self, script, data=None, *args):
+        output = BytesIO()
+        self.teql.execute_stream(script, BytesIO(self.data if data is None else data), output, *args)
+        return output.getvalue()
+
+    def assertSameAsEdit(self, script, *args):
+        self.assertEqual(self.stream(script, None, *args), self.teql.edit(self.data, script, *args), script)
+
+    def test_same_as_edit(self):
+        self.assertSameAsEdit('CHANGE FIND "mimsy" TO "miserable and flimsy"')
+        self.assertSameAsEdit('CHANGE FIND /b\\w+/i TO "blah"')
+        self.assertSameAsEdit('DELETE LINES 3:5')
+        self.assertSameAsEdit('DELETE FIND LINES WITH "the"')
+        self.assertSameAsEdit('INSERT " [gruff]" AFTER FIND "uffish"')
+        self.assertSameAsEdit('INSERT "> " AT START IN LINES 1:4')
+        self.assertSameAsEdit('CHANGE FIND "Jabberwock" IN LINE 10 TO "dragon"')
+        self.assertSameAsEdit('CHANGE FIRST 2 OF FIND "the" TO "THE"; DELETE LINE 1')
+        self.assertSameAsEdit('INSERT $1 AT END', "The End\n")
+
+    def test_show(self):
+        self.assertEqual(self.stream('SHOW FIND LINES WITH "o"', b'one\ntwo\nthree\nfour'), b'one\ntwo\nfour\n')
+        self.assertEqual(self.stream('SHOW FIND /t\\w+/', b'one two three\nfour'), b'two\nthree\n')
+
+    def test_large_ranges(self):
+        # The selected line numbers are never all held in memory
+        self.assertEqual(self.stream('SHOW LINES 2:20000000', b'one\ntwo\nthree\n'), b'two\nthree\n')
+        self.assertEqual(self.stream('SHOW LINES 1:20000000:2', b'one\ntwo\nthree\n'), b'one\nthree\n')
+        self.assertEqual(self.stream('SHOW 2:20000000 OF FIND "o"', b'one\ntwo\nthree\n'), b'o\n')
+
+    def test_pipeline(self):
+        # Later queries see the output of earlier ones, including new lines
+        self.assertEqual(self.stream('CHANGE FIND "," TO $1; SHOW LINE 2', b'a,b,c\nd\n', "\n"), b'b\n')
+
+    def test_parameters(self):
+        self.assertEqual(self.stream('CHANGE FIND $1 TO $2', b'a b a\n', 'a', 'x'), b'x b x\n')
+
+    def test_unsupported(self):
+        for script in ('DELETE LINE -1', 'SHOW FIND /a\\sb/', 'DELETE EVERYTHING AFTER FIND "x"', 'SHOW FIND /^x/'):
+            with self.subTest(script=script), self.assertRaises(TEQLException):
+                self.stream(script)
+
+    def test_split_lines(self):
+        chunks = [b'a\r', b'\nb', b'c\r\n\r\nd']
+        self.assertEqual(list(split_lines(chunks, b'\r\n')), [b'a\r\n', b'bc\r\n', b'\r\n', b'd'])
@@ -0,0 +1,97 @@
+from unittest import TestCase
+from teql import TEQL
+from teql import ast
+from teql.trigram_index import TrigramIndex, selector_literals
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from io import StringIO
+import os
+
+class TrigramIndexTest(TestCase):
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.index = TrigramIndex(os.path.join(self.temp.name, 'index', 'trigrams.db'))
+        self.paths = []
+        for name, text in [
+            ('a.txt', "'Twas brillig, and the slithy toves\n"),
+            ('b.txt', "Did gyre and gimble in the wabe:\n"),
+            ('c.txt', "All mimsy were the borogoves,\n"),
+            ('d.txt', "And the mome raths outgrabe.\n"),
+        ]:
+            self.paths.append(self.write(name, text))
+
+    def tearDown(self):
+        self.index.close()
+        self.temp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.temp.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_candidates(self):
+        self.assertEqual(self.index.candidates(self.paths, [b'toves']), [self.paths[0]])
+        self.assertEqual(self.index.candidates(self.paths, [b'the', b'oves']), [self.paths[0], self.paths[2]])
+        self.assertEqual(self.index.candidates(self.paths, [b'jabberwock']), [])
+        # Too short to look up
+        self.assertEqual(self.index.candidates(self.paths, [b'zz']), self.paths)
+
+    def test_refreshed(self):
+        self.assertEqual(self.index.candidates(self.paths, [b'jubjub']), [])
+        self.write('b.txt', "Beware the Jubjub bird\n".lower())
+        self.assertEqual(self.index.candidates(self.paths, [b'jubjub']), [self.paths[1]])
+        # A new session sees the same index
+        index = TrigramIndex(self.index.path)
+        self.assertEqual(index.candidates(self.paths, [b'jubjub']), [self.paths[1]])
+        self.assertEqual(index.candidates(self.paths, [b'gimble']), [])
+        index.prune()
+        self.assertEqual(index.candidates(self.paths, [b'gimble', b'gyre']), [])
+        index.close()
+
+    def test_large_files_not_ruled_out(self):
+        index = TrigramIndex(os.path.join(self.temp.name, 'small.db'), max_file_size=30)
+        self.assertEqual(index.candidates(self.paths, [b'toves']), [self.paths[0], self.paths[1]])
+        index.close()
+
+    def test_selector_literals(self):
+        resolve = lambda variable: 'from variable'
+        for selector, expected in [
+            (ast.FindSelection('toves'), [b'toves']),
+            (ast.FindSelection(ast.LiteralRegex(r'mim\w+ were')), [b'mim', b' were']),
+            (ast.FindSelection(ast.LiteralRegex('TOVES', 'i')), []),
+            (ast.FindSelection(ast.Variable(['x'])), [b'from variable']),
+            (ast.SelectionLineSelection(ast.FindFirstSelection('gyre')), [b'gyre']),
+            (ast.BetweenSelection(ast.FindSelection('('), ast.FindSelection(')')), [b'(', b')']),
+            (ast.SubSelection(ast.FindSelection('a'), ast.DirectLineSelection([ast.RangeIndexIndex(1)])), [b'a']),
+            (ast.FindAnySelection(['a', 'b']), []),
+            (ast.StartCursor(), []),
+        ]:
+            with self.subTest(selector=selector):
+                self.assertEqual(selector_literals(selector, 'utf-8', resolve), expected)
+
+    def test_teql(self):
+        teql = TEQL(line_separator="\n", trigram_index=self.index)
+        teql.execute(f'USE "{os.path.join(self.temp.name, "*.txt")}"')
+        opened = []
+        open_context = teql._openContext
+        def recording_open(path, writable=False):
+            opened.append(os.path.basename(path))
+            return open_context(path, writable)
+        teql._openContext = recording_open
+        output = StringIO()
+        with redirect_stdout(output):
+            teql.execute('SHOW FIND LINES WITH "borogoves"')
+        self.assertEqual(output.getvalue(), "All mimsy were the borogoves,\n\n")
+        self.assertEqual(opened, ['c.txt'])
+        opened.clear()
+        teql.execute('CHANGE FIND /m\\w+e raths/ TO "green pigs"')
+        self.assertEqual(opened, ['d.txt'])
+        with open(self.paths[3]) as file:
+            self.assertEqual(file.read(), "And the green pigs outgrabe.\n")
+        opened.clear()
+        query = ast.SelectQuery([ast.SelectValue(ast.FindSelection('brillig'), None), ast.SelectValue(ast.FindSelection('pigs'), None)], teql.use)
+        stores = teql._executeSelectQuery(query).fetch_all()
+        # Every file gets a row, but only those which may match are opened
+        self.assertEqual([(len(list(store[1])), len(list(store[2]))) for store in stores], [(1, 0), (0, 0), (0, 0), (0, 1)])
+        self.assertEqual(opened, ['a.txt', 'd.txt'])
@@ -19,6 +19,8 @@ class ApplyRangesTest(TestCase):
         self.assertEqual(list(result), [9])
         result = apply_ranges([ast.RangeIndexLast(3)], sample)
         self.assertEqual(list(result), [7, 8, 9])
+        result = apply_ranges([ast.RangeIndexRange(-3, -1)], sample, adapt_index=True)
+        self.assertEqual(list(result), [7, 8, 9])
         # Ensure next is also set
         with self.assertRaises(IndexError):
             list(apply_ranges([ast.RangeIndexLast(), ast.RangeIndexNext()], sample))
@@ -64,4 +66,87 @@ class ApplyRangesTest(TestCase):
         self.assertEqual(list(result), [3, 5, 7, 9])
         # Ensure next is also set
         result = apply_ranges([ast.RangeIndexRange(3, 8, 2), ast.RangeIndexNext()], sample)
-        self.assertEqual(list(result), [3, 5, 7, 8])
\ No newline at end of file
+        self.assertEqual(list(result), [3, 5, 7, 8])
+    def test_only_consumes_needed_prefix(self):
+        from itertools import count
+        result = apply_ranges([ast.RangeIndexFirst(2), ast.RangeIndexNext()], count(1), adapt_index=True)
+        self.assertEqual(list(result), [1, 2, 3])
+        result = apply_ranges([ast.RangeIndexRange(2, 4)], count(1), adapt_index=True)
+        self.assertEqual(list(result), [2, 3, 4])
+
+
+from teql.keywords import compile_keywords, MAX_NESTING
+
+class CompileKeywordsTest(TestCase):
+    def test_leftmost_longest(self):
+        pattern = compile_keywords([b'he', b'hers', b'his', b'she', b'h'])
+        self.assertEqual([m.group() for m in pattern.finditer(b'ushers his h shers')], [b'she', b'his', b'h', b'she'])
+        self.assertEqual([m.group() for m in pattern.finditer(b'hers hex')], [b'hers', b'he'])
+
+    def test_special_characters(self):
+        pattern = compile_keywords([b'a.b', b'(x)', b'a'])
+        self.assertEqual([m.group() for m in pattern.finditer(b'axb a.b (x) x')], [b'a', b'a.b', b'(x)'])
+
+    def test_empty_keyword(self):
+        with self.assertRaises(ValueError):
+            compile_keywords([b'a', b''])
+
+    def test_deep_prefix_chains(self):
+        for depth in (MAX_NESTING, 600):
+            with self.subTest(depth=depth):
+                # Each keyword is a prefix of the next, so every one nests another alternation
+                pattern = compile_keywords([b'ab' * n for n in range(1, depth + 1)])
+                self.assertEqual([m.group() for m in pattern.finditer(b'ab' * 3 + b' ' + b'ab' * (depth + 2))], [b'ab' * 3, b'ab' * depth, b'ab' * 2])
+
+
+import re
+from teql.regex_analysis import can_match_byte, required_literals
+
+class CanMatchByteTest(TestCase):
+    def test_can_match_newline(self):
+        newline = ord("\n")
+        for pattern, flags, expected in [
+            (rb'abc', 0, False),
+            (rb'a.c', 0, False),
+            (rb'a.c', re.S, True),
+            (rb'(?s)a.c', 0, True),
+            (rb'a\sc', 0, True),
+            (rb'\w+', 0, False),
+            (rb'[^x]', 0, True),
+            (rb'[^\n]+', 0, False),
+            (rb'[\x00-\x20]', 0, True),
+            (rb'foo(?=\n)', 0, False),
+            (rb'a|\n', 0, True),
+            (rb'(a)\1', 0, True),
+        ]:
+            with self.subTest(pattern=pattern, flags=flags):
+                self.assertEqual(can_match_byte(pattern, flags, newline), expected)
+
+    def test_required_literals(self):
+        for pattern, flags, expected in [
+            (rb'foo\w+bar', 0, [b'foo', b'bar']),
+            (rb'x(?:yz)+w?q', 0, [b'x', b'yz', b'q']),
+            (rb'ab|cd', 0, []),
+            (rb'(?i)ab12', 0, [b'12']),
+            (rb'(?=ab)c', 0, [b'c']),
+            (rb'a*b{0,2}', 0, []),
+            (rb'[', 0, []),
+        ]:
+            with self.subTest(pattern=pattern, flags=flags):
+                self.assertEqual(required_literals(pattern, flags), expected)
+
+
+from teql.operation import CursorTranslator, Opcode
+
+class CursorTranslatorTest(TestCase):
+    def test_translate(self):
+        translate = CursorTranslator([Opcode.insert(2, 2, "ab"), Opcode.replace(4, 6, "x"), Opcode.delete(8, 10)], 'utf-8')
+        self.assertEqual(translate(0), 0)
+        self.assertEqual(translate(2), 4) # After the insertion
+        self.assertEqual(translate(3), 5)
+        self.assertEqual(translate(4), 6) # Start of the replacement
+        self.assertEqual(translate(5), 7) # Within the replacement, so at its end
+        self.assertEqual(translate(6), 7)
+        self.assertEqual(translate(8), 9)
+        self.assertEqual(translate(9), 9)
+        self.assertEqual(translate(12), 11)